@@ -1,22 +1,57 @@
 """Integrate Betty with `nginx <https://nginx.org/>`_."""
 
+import logging
 from pathlib import Path
-from typing import final
+from typing import final, TYPE_CHECKING
 
 from betty.event_dispatcher import EventHandlerRegistry
 from betty.locale.localizable import static, _, Localizable
 from betty.machine_name import MachineName
 from betty.project.extension import ConfigurableExtension
-from betty.project.generate import GenerateSiteEvent
 from typing_extensions import override
 
-from betty_nginx.artifact import generate_configuration_file, generate_dockerfile_file
 from betty_nginx.config import NginxConfiguration
+from betty_nginx.release import current_release_directory_path
 
+if TYPE_CHECKING:
+    from betty.project.generate import GenerateSiteEvent
 
-async def _generate_configuration_files(event: GenerateSiteEvent) -> None:
-    await generate_configuration_file(event.project)
-    await generate_dockerfile_file(event.project)
+
+async def _generate_configuration_files(event: "GenerateSiteEvent") -> None:
+    # This module is loaded for every Betty command, so only import the artifact generators when generating.
+    from betty_nginx.artifact import (
+        generate_configuration_file,
+        generate_dockerfile_file,
+        PostGenerateArtifactsEvent,
+        write_generation_profile,
+    )
+
+    logger = logging.getLogger(__name__)
+    report = await generate_configuration_file(event.project)
+    report.extend(await generate_dockerfile_file(event.project))
+    logger.debug(
+        "Generated nginx artifacts: %d written, %d unchanged.",
+        len(report.written),
+        len(report.unchanged),
+    )
+    for span in report.spans:
+        logger.debug(
+            "Generating nginx artifacts: %s%s took %.3f milliseconds.",
+            span.step,
+            "" if span.file_path is None else f" {span.file_path}",
+            span.duration * 1000,
+        )
+    nginx = (await event.project.extensions)[Nginx]
+    if nginx.configuration.generation_profile:
+        await write_generation_profile(
+            report,
+            event.project.configuration.output_directory_path
+            / "nginx"
+            / "generation-profile.json",
+        )
+    await event.project.event_dispatcher.dispatch(
+        PostGenerateArtifactsEvent(event.job_context, report)
+    )
 
 
 @final
@@ -44,6 +79,8 @@ class Nginx(ConfigurableExtension[NginxConfiguration]):
 
     @override
     def register_event_handlers(self, registry: EventHandlerRegistry) -> None:
+        from betty.project.generate import GenerateSiteEvent
+
         registry.add_handler(GenerateSiteEvent, _generate_configuration_files)
 
     @override
@@ -69,7 +106,15 @@ class Nginx(ConfigurableExtension[NginxConfiguration]):
     def www_directory_path(self) -> str:
         """
         The nginx server's public web root directory path.
+
+        With releases, this is the symlink to the current release.
         """
+        if self._configuration.releases_directory_path is not None:
+            return str(
+                current_release_directory_path(
+                    Path(self._configuration.releases_directory_path)
+                )
+            )
         return self._configuration.www_directory_path or str(
             self._project.configuration.www_directory_path
         )
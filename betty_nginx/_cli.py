@@ -3,7 +3,9 @@ Provide Command Line Interface functionality.
 """
 
 import asyncio
-from typing import final, Self
+import shlex
+from pathlib import Path
+from typing import final, Self, TYPE_CHECKING
 
 import asyncclick as click
 from betty.app import App
@@ -15,7 +17,13 @@ from betty.plugin import ShorthandPluginBase
 from betty.project import Project
 from typing_extensions import override
 
-from betty_nginx import serve
+from betty_nginx import Nginx
+
+# Betty loads this module for every command it runs, so commands import their dependencies only once they run.
+if TYPE_CHECKING:
+    from betty_nginx.analyze import ConfigurationAnalysis
+    from betty_nginx.logs import AccessLogReport
+    from betty_nginx.manifest import ManifestDiff
 
 
 @final
@@ -48,6 +56,8 @@ class NginxServe(ShorthandPluginBase, AppDependentFactory, Command):
         )
         @project_option
         async def nginx_serve(project: Project) -> None:
+            from betty_nginx import serve
+
             async with await serve.DockerizedNginxServer.new_for_project(
                 project
             ) as server:
@@ -56,3 +66,509 @@ class NginxServe(ShorthandPluginBase, AppDependentFactory, Command):
                     await asyncio.sleep(999)
 
         return nginx_serve
+
+
+@final
+class NginxLogs(ShorthandPluginBase, AppDependentFactory, Command):
+    """
+    A command to analyze nginx's structured JSON access logs.
+    """
+
+    _plugin_id = "nginx-logs"
+    _plugin_label = _(
+        "Analyze nginx access logs for latency percentiles, top URLs, and response breakdowns."
+    )
+
+    def __init__(self, localizer: Localizer):
+        self._localizer = localizer
+
+    @override
+    @classmethod
+    async def new_for_app(cls, app: App) -> Self:
+        return cls(await app.localizer)
+
+    @override
+    async def click_command(self) -> click.Command:
+        description = self.plugin_description()
+
+        @command(
+            self.plugin_id(),
+            short_help=self.plugin_label().localize(self._localizer),
+            help=description.localize(self._localizer)
+            if description
+            else self.plugin_label().localize(self._localizer),
+        )
+        @click.argument(
+            "access_log_file_paths",
+            metavar="ACCESS_LOG...",
+            nargs=-1,
+            required=True,
+            type=click.Path(exists=True, dir_okay=False, path_type=Path),
+        )
+        @click.option(
+            "--top",
+            default=10,
+            show_default=True,
+            type=click.IntRange(min=1),
+            help=_("The number of URLs to show per ranking.").localize(self._localizer),
+        )
+        async def nginx_logs(access_log_file_paths: tuple[Path, ...], top: int) -> None:
+            from betty_nginx.logs import analyze_access_logs
+
+            report = await asyncio.to_thread(
+                analyze_access_logs, access_log_file_paths, top=top
+            )
+            click.echo(self._format_report(report))
+
+        return nginx_logs
+
+    def _format_report(self, report: "AccessLogReport") -> str:
+        lines = [
+            _("Requests: {requests}")
+            .format(requests=str(report.requests))
+            .localize(self._localizer),
+            _("Malformed lines: {malformed_lines}")
+            .format(malformed_lines=str(report.malformed_lines))
+            .localize(self._localizer),
+            "",
+            _("Request times").localize(self._localizer),
+        ]
+        lines.extend(
+            f"  p{percentile}: {latency:.3f}s"
+            for percentile, latency in report.latency_percentiles.items()
+        )
+        lines.append(f"  max: {report.latency_maximum:.3f}s")
+        for heading, breakdown in (
+            (_("Statuses"), report.statuses),
+            (_("Media types"), report.media_types),
+            (_("Locales"), report.locales),
+        ):
+            lines.extend(("", heading.localize(self._localizer)))
+            lines.extend(f"  {key}: {count}" for key, count in breakdown.items())
+        lines.extend(("", _("Top URLs by requests").localize(self._localizer)))
+        lines.extend(f"  {requests:>8}  {url}" for url, requests in report.top_urls)
+        lines.extend(
+            ("", _("Top URLs by total request time").localize(self._localizer))
+        )
+        lines.extend(
+            f"  {request_time:>8.3f}s  {url}"
+            for url, request_time in report.slowest_urls
+        )
+        return "\n".join(lines)
+
+
+@final
+class NginxRelease(ShorthandPluginBase, AppDependentFactory, Command):
+    """
+    A command to release a generated site, and atomically switch nginx over to it.
+    """
+
+    _plugin_id = "nginx-release"
+    _plugin_label = _(
+        "Release a generated site, and atomically switch nginx over to it."
+    )
+
+    def __init__(self, localizer: Localizer):
+        self._localizer = localizer
+
+    @override
+    @classmethod
+    async def new_for_app(cls, app: App) -> Self:
+        return cls(await app.localizer)
+
+    @override
+    async def click_command(self) -> click.Command:
+        description = self.plugin_description()
+
+        @command(
+            self.plugin_id(),
+            short_help=self.plugin_label().localize(self._localizer),
+            help=description.localize(self._localizer)
+            if description
+            else self.plugin_label().localize(self._localizer),
+        )
+        @click.option(
+            "--rollback",
+            is_flag=True,
+            help=_("Switch back to the previous release instead.").localize(
+                self._localizer
+            ),
+        )
+        @click.option(
+            "--reload-command",
+            default="nginx -s reload",
+            show_default=True,
+            help=_(
+                "The command to gracefully reload nginx with after switching releases. Pass an empty string to not reload nginx."
+            ).localize(self._localizer),
+        )
+        @project_option
+        async def nginx_release(
+            project: Project, rollback: bool, reload_command: str
+        ) -> None:
+            from betty_nginx.release import (
+                create_release,
+                prune_releases,
+                reload_nginx,
+                rollback_release,
+                switch_release,
+            )
+
+            nginx = (await project.extensions)[Nginx]
+            if nginx.configuration.releases_directory_path is None:
+                raise click.UsageError(
+                    _(
+                        "The nginx extension has no releases directory configured."
+                    ).localize(self._localizer)
+                )
+            releases_directory_path = Path(nginx.configuration.releases_directory_path)
+            if rollback:
+                release_path = await rollback_release(releases_directory_path)
+            else:
+                release_path = await create_release(
+                    project.configuration.www_directory_path, releases_directory_path
+                )
+                await switch_release(release_path)
+            if reload_command:
+                await reload_nginx(shlex.split(reload_command))
+            click.echo(
+                _('Switched to release "{release}".')
+                .format(release=release_path.name)
+                .localize(self._localizer)
+            )
+            if not rollback:
+                await prune_releases(
+                    releases_directory_path, nginx.configuration.releases_kept
+                )
+
+        return nginx_release
+
+
+@final
+class NginxManifest(ShorthandPluginBase, AppDependentFactory, Command):
+    """
+    A command to build a manifest of a generated site, and list the URLs that changed since a previous manifest.
+    """
+
+    _plugin_id = "nginx-manifest"
+    _plugin_label = _(
+        "Build a manifest of a generated site, and list the URLs that changed since a previous build."
+    )
+
+    def __init__(self, localizer: Localizer):
+        self._localizer = localizer
+
+    @override
+    @classmethod
+    async def new_for_app(cls, app: App) -> Self:
+        return cls(await app.localizer)
+
+    @override
+    async def click_command(self) -> click.Command:
+        description = self.plugin_description()
+
+        @command(
+            self.plugin_id(),
+            short_help=self.plugin_label().localize(self._localizer),
+            help=description.localize(self._localizer)
+            if description
+            else self.plugin_label().localize(self._localizer),
+        )
+        @click.option(
+            "--previous",
+            "previous_manifest_file_path",
+            type=click.Path(exists=True, dir_okay=False, path_type=Path),
+            help=_(
+                "The path to the manifest of the previous build, to list the changed URLs for."
+            ).localize(self._localizer),
+        )
+        @project_option
+        async def nginx_manifest(
+            project: Project, previous_manifest_file_path: Path | None
+        ) -> None:
+            from betty_nginx.manifest import (
+                build_manifest,
+                diff_manifests,
+                MANIFEST_FILE_NAME,
+                read_manifest,
+                write_manifest,
+            )
+
+            locale_aliases = {}
+            if project.configuration.locales.multilingual:
+                locale_aliases = {
+                    locale_configuration.alias: locale_configuration.locale
+                    for locale_configuration in project.configuration.locales.values()
+                }
+            # Read the previous manifest first, because it may be the one this overwrites.
+            previous_manifest = (
+                None
+                if previous_manifest_file_path is None
+                else await asyncio.to_thread(read_manifest, previous_manifest_file_path)
+            )
+            manifest = await asyncio.to_thread(
+                build_manifest,
+                project.configuration.www_directory_path,
+                locale_aliases=locale_aliases,
+            )
+            manifest_file_path = (
+                project.configuration.output_directory_path
+                / "nginx"
+                / MANIFEST_FILE_NAME
+            )
+            await asyncio.to_thread(write_manifest, manifest, manifest_file_path)
+            if previous_manifest is None:
+                click.echo(
+                    _("Wrote a manifest of {file_count} files to {manifest_file}.")
+                    .format(
+                        file_count=str(len(manifest)),
+                        manifest_file=str(manifest_file_path),
+                    )
+                    .localize(self._localizer)
+                )
+            else:
+                click.echo(
+                    self._format_diff(diff_manifests(previous_manifest, manifest)),
+                    nl=False,
+                )
+
+        return nginx_manifest
+
+    def _format_diff(self, diff: "ManifestDiff") -> str:
+        from betty_nginx.manifest import file_urls
+
+        return "".join(
+            f"{status} {url}\n"
+            for status, file_paths in (
+                ("+", diff.added),
+                ("~", diff.changed),
+                ("-", diff.removed),
+            )
+            for file_path in file_paths
+            for url in file_urls(file_path)
+        )
+
+
+@final
+class NginxDedupe(ShorthandPluginBase, AppDependentFactory, Command):
+    """
+    A command to replace identical files in a generated site with hardlinks.
+    """
+
+    _plugin_id = "nginx-dedupe"
+    _plugin_label = _(
+        "Replace identical files in a generated site with hardlinks, so nginx serves them from a single cached copy."
+    )
+
+    def __init__(self, localizer: Localizer):
+        self._localizer = localizer
+
+    @override
+    @classmethod
+    async def new_for_app(cls, app: App) -> Self:
+        return cls(await app.localizer)
+
+    @override
+    async def click_command(self) -> click.Command:
+        description = self.plugin_description()
+
+        @command(
+            self.plugin_id(),
+            short_help=self.plugin_label().localize(self._localizer),
+            help=description.localize(self._localizer)
+            if description
+            else self.plugin_label().localize(self._localizer),
+        )
+        @project_option
+        async def nginx_dedupe(project: Project) -> None:
+            from betty_nginx.dedupe import deduplicate_files
+
+            report = await asyncio.to_thread(
+                deduplicate_files, project.configuration.www_directory_path
+            )
+            click.echo(
+                _(
+                    "Replaced {file_count} duplicate files with hardlinks, saving {byte_count} bytes."
+                )
+                .format(
+                    file_count=str(report.linked_files),
+                    byte_count=str(report.saved_bytes),
+                )
+                .localize(self._localizer)
+            )
+
+        return nginx_dedupe
+
+
+@final
+class NginxImages(ShorthandPluginBase, AppDependentFactory, Command):
+    """
+    A command to generate AVIF and WebP variants of a generated site's images.
+    """
+
+    _plugin_id = "nginx-images"
+    _plugin_label = _(
+        "Generate AVIF and WebP variants of a generated site's images, for nginx to serve to clients that accept them."
+    )
+
+    def __init__(self, localizer: Localizer):
+        self._localizer = localizer
+
+    @override
+    @classmethod
+    async def new_for_app(cls, app: App) -> Self:
+        return cls(await app.localizer)
+
+    @override
+    async def click_command(self) -> click.Command:
+        description = self.plugin_description()
+
+        @command(
+            self.plugin_id(),
+            short_help=self.plugin_label().localize(self._localizer),
+            help=description.localize(self._localizer)
+            if description
+            else self.plugin_label().localize(self._localizer),
+        )
+        @project_option
+        async def nginx_images(project: Project) -> None:
+            from betty_nginx.image import generate_image_variants
+
+            report = await asyncio.to_thread(
+                generate_image_variants, project.configuration.www_directory_path
+            )
+            click.echo(
+                _(
+                    "Generated {written_count} image variants, saving {byte_count} bytes. {unchanged_count} image variants were up to date, and {discarded_count} were discarded because they were not smaller than their images."
+                )
+                .format(
+                    written_count=str(len(report.written)),
+                    byte_count=str(report.saved_bytes),
+                    unchanged_count=str(len(report.unchanged)),
+                    discarded_count=str(len(report.discarded)),
+                )
+                .localize(self._localizer)
+            )
+            if report.failed:
+                click.echo(
+                    _("Skipped {failed_count} images that could not be read.")
+                    .format(failed_count=str(len(report.failed)))
+                    .localize(self._localizer)
+                )
+
+        return nginx_images
+
+
+@final
+class NginxAnalyze(ShorthandPluginBase, AppDependentFactory, Command):
+    """
+    A command to analyze what a project's nginx configuration costs per request.
+    """
+
+    _plugin_id = "nginx-analyze"
+    _plugin_label = _(
+        "Analyze what the generated nginx configuration costs per request, and warn about expensive directives."
+    )
+
+    def __init__(self, localizer: Localizer):
+        self._localizer = localizer
+
+    @override
+    @classmethod
+    async def new_for_app(cls, app: App) -> Self:
+        return cls(await app.localizer)
+
+    @override
+    async def click_command(self) -> click.Command:
+        description = self.plugin_description()
+
+        @command(
+            self.plugin_id(),
+            short_help=self.plugin_label().localize(self._localizer),
+            help=description.localize(self._localizer)
+            if description
+            else self.plugin_label().localize(self._localizer),
+        )
+        @click.option(
+            "--path",
+            "request_paths",
+            multiple=True,
+            help=_(
+                "A URL path to analyze the cost of. Pass this option multiple times to analyze multiple paths. Defaults to the front page and a static file."
+            ).localize(self._localizer),
+        )
+        @click.option(
+            "--strict",
+            is_flag=True,
+            help=_("Fail if there are any warnings.").localize(self._localizer),
+        )
+        @project_option
+        async def nginx_analyze(
+            project: Project, request_paths: tuple[str, ...], strict: bool
+        ) -> None:
+            from betty_nginx.analyze import analyze_configuration
+            from betty_nginx.artifact import _render_configuration_file
+
+            if not request_paths:
+                request_paths = ("/",)
+                if project.configuration.locales.multilingual:
+                    request_paths += (
+                        f"/{project.configuration.locales.default.alias}/",
+                    )
+                request_paths += ("/favicon.ico",)
+            # Analyze the configuration as it would be generated, without overwriting the one in the output directory.
+            analysis = await asyncio.to_thread(
+                analyze_configuration,
+                await _render_configuration_file(project),
+                request_paths,
+            )
+            click.echo(self._format_analysis(analysis))
+            if strict and analysis.warnings:
+                raise click.ClickException(
+                    _("Found {warning_count} warnings.")
+                    .format(warning_count=str(len(analysis.warnings)))
+                    .localize(self._localizer)
+                )
+
+        return nginx_analyze
+
+    def _format_analysis(self, analysis: "ConfigurationAnalysis") -> str:
+        lines: list[str] = []
+        for server in analysis.servers:
+            lines.append(
+                _("Server {server_names}")
+                .format(server_names=" ".join(server.server_names))
+                .localize(self._localizer)
+            )
+            for cost in server.request_costs:
+                lines.append(f"  {cost.path}: {cost.status}")
+                lines.extend(
+                    f"    {line.localize(self._localizer)}"
+                    for line in (
+                        _("Locations: {locations}").format(
+                            locations=", ".join(cost.locations)
+                        ),
+                        _("Regular expression evaluations: {count}").format(
+                            count=str(cost.regex_evaluations)
+                        ),
+                        _("Lua blocks: {count}").format(count=str(cost.lua_blocks)),
+                        _("Filesystem probes: {count}").format(
+                            count=str(cost.filesystem_probes)
+                        ),
+                        _("Internal redirects: {count}").format(
+                            count=str(cost.internal_redirects)
+                        ),
+                        _("Round-trip redirects: {count}").format(
+                            count=str(cost.round_trip_redirects)
+                        ),
+                    )
+                )
+            lines.append("")
+        lines.append(_("Warnings").localize(self._localizer))
+        for warning in analysis.warnings:
+            line = _("Line {line}: {directive}").format(
+                line=str(warning.directive.line), directive=str(warning.directive)
+            )
+            lines.append(f"  {line.localize(self._localizer)}")
+            lines.append(f"    {warning.message.localize(self._localizer)}")
+        return "\n".join(lines)
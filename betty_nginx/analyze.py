@@ -0,0 +1,701 @@
+"""
+Analyze what generated nginx configuration costs per request.
+
+The analysis is static: configuration is parsed, and requests are followed through it the way nginx would, without
+running nginx or touching the disk. Every filesystem probe is assumed to miss, so the costs are those of requests
+for resources that do not exist, which are the requests that error responses, crawlers, and scanners cause.
+"""
+
+import re
+from collections.abc import Iterator, Mapping, Sequence
+from dataclasses import dataclass
+from typing import cast
+
+from betty.locale.localizable import _, Localizable
+
+_MAX_INTERNAL_REDIRECTS = 10
+
+_REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+
+# Lua directives that run in a request phase, as opposed to those that configure OpenResty itself.
+_LUA_PHASE_DIRECTIVE_PATTERN = re.compile(
+    r"(?:set|rewrite|access|content|header_filter|body_filter|log)_by_lua(?:_block|_file)?"
+)
+
+# Lua directives that run once per request, in the location that ends up serving it.
+_LUA_RESPONSE_DIRECTIVE_PATTERN = re.compile(
+    r"(?:header_filter|body_filter|log)_by_lua(?:_block|_file)?"
+)
+
+_VARIABLE_PATTERN = re.compile(r"\$(\{)?(\w+)(?(1)\})")
+
+# PCRE's named groups, which Python spells differently.
+_PCRE_NAMED_GROUP_PATTERN = re.compile(r"\(\?<(?=[A-Za-z_])")
+
+_UNQUOTED_ARG_PATTERN = re.compile(r"[\s;{}'\"]")
+
+_QUOTED_ESCAPES = {'"': '"', "'": "'", "\\": "\\", "n": "\n", "r": "\r", "t": "\t"}
+
+
+class ConfigurationParseError(ValueError):
+    """
+    Raised when nginx configuration cannot be parsed.
+    """
+
+    pass  # pragma: no cover
+
+
+@dataclass(frozen=True)
+class Directive:
+    """
+    A single nginx directive.
+
+    The code of Lua blocks, such as ``set_by_lua_block``, is their last argument.
+    """
+
+    name: str
+    args: Sequence[str]
+    line: int
+    block: Sequence["Directive"] | None = None
+
+    def __str__(self) -> str:
+        args = self.args
+        if self.name.endswith("_by_lua_block"):
+            return " ".join((self.name, *map(_quote, args[:-1]), "{ ... }"))
+        return " ".join((self.name, *map(_quote, args)))
+
+
+def _quote(arg: str) -> str:
+    if arg and not _UNQUOTED_ARG_PATTERN.search(arg):
+        return arg
+    return "'" + arg.replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+
+@dataclass(frozen=True)
+class RequestCost:
+    """
+    What a single request costs nginx.
+    """
+
+    path: str
+    status: int
+    locations: Sequence[str]
+    regex_evaluations: int
+    lua_blocks: int
+    filesystem_probes: int
+    internal_redirects: int
+    round_trip_redirects: int
+
+
+@dataclass(frozen=True)
+class ServerAnalysis:
+    """
+    The analysis of a single server block.
+    """
+
+    server_names: Sequence[str]
+    request_costs: Sequence[RequestCost]
+
+
+@dataclass(frozen=True)
+class ConfigurationWarning:
+    """
+    A directive that makes requests more expensive than they need to be.
+    """
+
+    message: Localizable
+    directive: Directive
+
+
+@dataclass(frozen=True)
+class ConfigurationAnalysis:
+    """
+    The analysis of nginx configuration.
+    """
+
+    servers: Sequence[ServerAnalysis]
+    warnings: Sequence[ConfigurationWarning]
+
+
+def analyze_configuration(
+    configuration: str, request_paths: Sequence[str]
+) -> ConfigurationAnalysis:
+    """
+    Analyze nginx configuration, such as that of :py:func:`betty_nginx.artifact.generate_configuration_file`.
+
+    The configuration may be a complete ``nginx.conf``, or the contents of an ``http`` block.
+
+    :param request_paths: The URL paths to analyze the cost of, for every server.
+    """
+    directives = parse_configuration(configuration)
+    http = _http_directives(directives)
+    servers = [directive for directive in http if directive.name == "server"]
+    return ConfigurationAnalysis(
+        servers=[
+            ServerAnalysis(
+                server_names=[
+                    server_name
+                    for directive in _block(server)
+                    if directive.name == "server_name"
+                    for server_name in directive.args
+                ],
+                request_costs=[
+                    _RequestSimulation(http, server, request_path).run()
+                    for request_path in request_paths
+                ],
+            )
+            for server in servers
+        ],
+        warnings=[
+            *_check_lua(http),
+            *(warning for server in servers for warning in _check_server(http, server)),
+        ],
+    )
+
+
+def parse_configuration(configuration: str) -> Sequence[Directive]:
+    """
+    Parse nginx configuration into its top-level directives.
+    """
+    return _Parser(configuration).parse()
+
+
+class _Parser:
+    def __init__(self, configuration: str):
+        self._configuration = configuration
+        self._position = 0
+        self._line = 1
+
+    def parse(self) -> Sequence[Directive]:
+        return self._parse_block(nested=False)
+
+    def _parse_block(self, *, nested: bool) -> list[Directive]:
+        directives: list[Directive] = []
+        while True:
+            token = self._next_token()
+            if token is None:
+                if nested:
+                    raise ConfigurationParseError(
+                        'Unexpected end of configuration, expected "}".'
+                    )
+                return directives
+            name, line, special = token
+            if special:
+                if name == "}" and nested:
+                    return directives
+                raise ConfigurationParseError(f'Unexpected "{name}" on line {line}.')
+            directives.append(self._parse_directive(name, line))
+
+    def _parse_directive(self, name: str, line: int) -> Directive:
+        args = []
+        while True:
+            token = self._next_token()
+            if token is None:
+                raise ConfigurationParseError(
+                    f'Unexpected end of configuration, expected ";" or "{{" after "{name}" on line {line}.'
+                )
+            value, _, special = token
+            if not special:
+                args.append(value)
+            elif value == ";":
+                return Directive(name, tuple(args), line)
+            elif value == "{":
+                if name.endswith("_by_lua_block"):
+                    return Directive(name, (*args, self._read_lua_block()), line)
+                return Directive(
+                    name, tuple(args), line, self._parse_block(nested=True)
+                )
+            else:
+                raise ConfigurationParseError(
+                    f'Unexpected "{value}" on line {self._line}.'
+                )
+
+    def _next_token(self) -> tuple[str, int, bool] | None:
+        configuration = self._configuration
+        while self._position < len(configuration):
+            character = configuration[self._position]
+            if character == "\n":
+                self._line += 1
+                self._position += 1
+            elif character.isspace():
+                self._position += 1
+            elif character == "#":
+                while (
+                    self._position < len(configuration)
+                    and configuration[self._position] != "\n"
+                ):
+                    self._position += 1
+            elif character in ";{}":
+                self._position += 1
+                return character, self._line, True
+            elif character in "\"'":
+                return self._read_quoted_token(character)
+            else:
+                return self._read_token()
+        return None
+
+    def _read_quoted_token(self, quote: str) -> tuple[str, int, bool]:
+        configuration = self._configuration
+        line = self._line
+        self._position += 1
+        value: list[str] = []
+        while self._position < len(configuration):
+            character = configuration[self._position]
+            if character == quote:
+                self._position += 1
+                return "".join(value), line, False
+            if character == "\\" and self._position + 1 < len(configuration):
+                escaped = configuration[self._position + 1]
+                if escaped in _QUOTED_ESCAPES:
+                    value.append(_QUOTED_ESCAPES[escaped])
+                    self._position += 2
+                    continue
+            if character == "\n":
+                self._line += 1
+            value.append(character)
+            self._position += 1
+        raise ConfigurationParseError(f"Unterminated string on line {line}.")
+
+    def _read_token(self) -> tuple[str, int, bool]:
+        configuration = self._configuration
+        start = self._position
+        while self._position < len(configuration):
+            character = configuration[self._position]
+            if character == "{" and configuration[self._position - 1] == "$":
+                # A variable such as ${name}.
+                self._position = configuration.index("}", self._position) + 1
+                continue
+            if character.isspace() or character in ";{}":
+                break
+            self._position += 1
+        return configuration[start : self._position], self._line, False
+
+    def _read_lua_block(self) -> str:
+        configuration = self._configuration
+        start = self._position
+        depth = 1
+        while self._position < len(configuration):
+            character = configuration[self._position]
+            if character == "\n":
+                self._line += 1
+            elif character in "\"'":
+                self._skip_lua_string(character)
+                continue
+            elif configuration.startswith("--", self._position):
+                self._position = configuration.find("\n", self._position)
+                if self._position == -1:
+                    break
+                continue
+            elif character == "{":
+                depth += 1
+            elif character == "}":
+                depth -= 1
+                if not depth:
+                    self._position += 1
+                    return configuration[start : self._position - 1]
+            self._position += 1
+        raise ConfigurationParseError('Unexpected end of configuration, expected "}".')
+
+    def _skip_lua_string(self, quote: str) -> None:
+        configuration = self._configuration
+        self._position += 1
+        while self._position < len(configuration):
+            character = configuration[self._position]
+            if character == "\\":
+                self._position += 2
+                continue
+            self._position += 1
+            if character == quote:
+                return
+            if character == "\n":
+                self._line += 1
+
+
+def _block(directive: Directive) -> Sequence[Directive]:
+    return directive.block or ()
+
+
+def _http_directives(directives: Sequence[Directive]) -> Sequence[Directive]:
+    for directive in directives:
+        if directive.name == "http":
+            return _block(directive)
+    return directives
+
+
+def _describe_location(location: Directive) -> str:
+    return " ".join(location.args)
+
+
+def _compile_pattern(modifier: str, pattern: str) -> re.Pattern[str]:
+    return re.compile(
+        _PCRE_NAMED_GROUP_PATTERN.sub("(?P<", pattern),
+        re.IGNORECASE if modifier.endswith("*") else 0,
+    )
+
+
+def _compile_location_pattern(location: Directive) -> re.Pattern[str]:
+    return _compile_pattern(location.args[0], location.args[-1])
+
+
+def _if_condition(args: Sequence[str]) -> Sequence[str]:
+    """
+    Strip the parentheses from an ``if`` directive's condition, the way nginx's rewrite module does.
+    """
+    condition = list(args)
+    if condition and condition[0].startswith("("):
+        condition[0] = condition[0][1:]
+        if not condition[0]:
+            del condition[0]
+    if condition and condition[-1].endswith(")"):
+        condition[-1] = condition[-1][:-1]
+        if not condition[-1]:
+            del condition[-1]
+    return condition
+
+
+def _inherited(levels: Sequence[Sequence[Directive]], name: str) -> Sequence[Directive]:
+    """
+    Get the directives of the innermost level that has any of the given name.
+
+    This is how nginx inherits array-like directives, such as ``add_header`` and ``error_page``.
+    """
+    for level in reversed(levels):
+        directives = [directive for directive in level if directive.name == name]
+        if directives:
+            return directives
+    return []
+
+
+class _RequestSimulation:
+    def __init__(self, http: Sequence[Directive], server: Directive, request_path: str):
+        self._http = http
+        self._server = server
+        self._request_path = request_path
+        self._uri = request_path
+        self._variables: dict[str, str] = {}
+        self._locations: list[str] = []
+        self._regex_evaluations = 0
+        self._lua_blocks = 0
+        self._filesystem_probes = 0
+        self._internal_redirects = 0
+        self._round_trip_redirects = 0
+
+    def run(self) -> RequestCost:
+        status = self._serve()
+        if status in _REDIRECT_STATUSES:
+            self._round_trip_redirects += 1
+        return RequestCost(
+            path=self._request_path,
+            status=status,
+            locations=self._locations,
+            regex_evaluations=self._regex_evaluations,
+            lua_blocks=self._lua_blocks,
+            filesystem_probes=self._filesystem_probes,
+            internal_redirects=self._internal_redirects,
+            round_trip_redirects=self._round_trip_redirects,
+        )
+
+    def _serve(self) -> int:
+        named_location = cast("Directive | None", None)
+        internal = False
+        error_status = cast("int | None", None)
+        while True:
+            if named_location is None:
+                # Unlike redirects to named locations, redirects to URIs start over from the server's rewrites.
+                status = self._rewrite(_block(self._server))
+                if status is not None:
+                    self._count_lua([self._http, _block(self._server)], response=True)
+                    return status
+                chain = self._find_location(_block(self._server))
+            else:
+                chain = [named_location]
+            levels = [self._http, _block(self._server), *map(_block, chain)]
+            directives = _block(chain[-1]) if chain else ()
+            if chain:
+                self._locations.append(_describe_location(chain[-1]))
+            redirect = None
+            if not internal and any(
+                directive.name == "internal" for directive in directives
+            ):
+                status = 404
+            else:
+                status = self._rewrite(directives)
+            if status is None:
+                self._count_lua(levels, response=False)
+                status, redirect = self._content(levels, directives)
+            # nginx does not handle errors in error pages, unless recursive_error_pages is enabled.
+            if redirect is None and error_status is None:
+                redirect = self._error_page(levels, status)
+                if redirect is not None:
+                    error_status = status
+            if redirect is None:
+                self._count_lua(levels, response=True)
+                return status if error_status is None else error_status
+            self._internal_redirects += 1
+            if self._internal_redirects > _MAX_INTERNAL_REDIRECTS:
+                return 500
+            internal = True
+            named_location = None
+            if redirect.startswith("@"):
+                named_location = self._find_named_location(redirect)
+                if named_location is None:
+                    return 500
+            else:
+                self._uri = redirect.partition("?")[0]
+
+    def _rewrite(self, directives: Sequence[Directive]) -> int | None:
+        for directive in directives:
+            if directive.name == "set" and len(directive.args) == 2:
+                self._variables[directive.args[0].lstrip("$")] = self._substitute(
+                    directive.args[1]
+                )
+            elif directive.name.startswith("set_by_lua"):
+                self._lua_blocks += 1
+                self._variables.pop(directive.args[0].lstrip("$"), None)
+            elif directive.name == "if" and self._if(_if_condition(directive.args)):
+                # Only the rewrites in if blocks are simulated, not the configuration they override.
+                status = self._rewrite(_block(directive))
+                if status is not None:
+                    return status
+            elif directive.name == "return":
+                # A return with only a URL redirects temporarily.
+                return int(directive.args[0]) if directive.args[0].isdigit() else 302
+        return None
+
+    def _if(self, condition: Sequence[str]) -> bool:
+        if len(condition) == 2:
+            # File tests, such as -f and !-d.
+            self._filesystem_probes += 1
+            return condition[0].startswith("!")
+        value = self._substitute(condition[0])
+        if len(condition) == 1:
+            return value not in ("", "0")
+        operator, operand = condition[1], condition[2]
+        if operator in ("=", "!="):
+            return (value == self._substitute(operand)) is (operator == "=")
+        self._regex_evaluations += 1
+        match = _compile_pattern(operator, operand).search(value)
+        return (match is not None) is not operator.startswith("!")
+
+    def _count_lua(
+        self, levels: Sequence[Sequence[Directive]], *, response: bool
+    ) -> None:
+        # Phase handlers are inherited from the innermost level that has them.
+        handled_phases = set()
+        for level in reversed(levels):
+            for directive in level:
+                # Rewrites run set_by_lua directives instead.
+                if directive.name.startswith(
+                    "set_by_lua"
+                ) or not _LUA_PHASE_DIRECTIVE_PATTERN.fullmatch(directive.name):
+                    continue
+                if (
+                    _LUA_RESPONSE_DIRECTIVE_PATTERN.fullmatch(directive.name) is None
+                ) is response:
+                    continue
+                phase = directive.name.partition("_by_lua")[0]
+                if phase not in handled_phases:
+                    handled_phases.add(phase)
+                    self._lua_blocks += 1
+
+    def _content(
+        self, levels: Sequence[Sequence[Directive]], directives: Sequence[Directive]
+    ) -> tuple[int, str | None]:
+        for directive in directives:
+            if directive.name == "try_files":
+                # Unlike the other arguments, the last one is a fallback rather than a probe.
+                self._filesystem_probes += len(directive.args) - 1
+                fallback = self._substitute(directive.args[-1])
+                if fallback.startswith("="):
+                    return int(fallback[1:]), None
+                return 404, fallback
+        for directive in directives:
+            if directive.name.startswith("content_by_lua") or directive.name in (
+                "stub_status",
+                "proxy_pass",
+            ):
+                return 200, None
+        if self._uri.endswith("/"):
+            self._filesystem_probes += (
+                sum(len(directive.args) for directive in _inherited(levels, "index"))
+                or 1
+            )
+        else:
+            self._filesystem_probes += 1
+        return 404, None
+
+    def _error_page(
+        self, levels: Sequence[Sequence[Directive]], status: int
+    ) -> str | None:
+        for directive in _inherited(levels, "error_page"):
+            if str(status) in directive.args[:-1]:
+                return self._substitute(directive.args[-1])
+        return None
+
+    def _find_named_location(self, name: str) -> Directive | None:
+        for directive in _block(self._server):
+            if directive.name == "location" and directive.args == (name,):
+                return directive
+        return None
+
+    def _find_location(self, directives: Sequence[Directive]) -> list[Directive]:
+        chain, _ = self._find_nested_location(directives)
+        return chain
+
+    def _find_nested_location(
+        self, directives: Sequence[Directive]
+    ) -> tuple[list[Directive], bool]:
+        """
+        Find the location for the current URI, the way ``ngx_http_core_find_location()`` does.
+
+        :return: The matching location and its ancestors, and whether matching is final, such as after an exact or
+            a regular expression match.
+        """
+        locations = [
+            directive
+            for directive in directives
+            if directive.name == "location" and not directive.args[0].startswith("@")
+        ]
+        prefix_location = cast("Directive | None", None)
+        for location in locations:
+            modifier = location.args[0]
+            if modifier == "=":
+                if location.args[1] == self._uri:
+                    return [location], True
+            elif modifier not in ("~", "~*"):
+                prefix = location.args[-1]
+                if self._uri.startswith(prefix) and (
+                    prefix_location is None
+                    or len(prefix) > len(prefix_location.args[-1])
+                ):
+                    prefix_location = location
+        chain: list[Directive] = []
+        if prefix_location is not None:
+            nested_chain, final = self._find_nested_location(_block(prefix_location))
+            chain = [prefix_location, *nested_chain]
+            if final or chain[-1].args[0] == "^~":
+                return chain, True
+        for location in locations:
+            if location.args[0] not in ("~", "~*"):
+                continue
+            self._regex_evaluations += 1
+            match = _compile_location_pattern(location).search(self._uri)
+            if match is not None:
+                self._variables.update(
+                    {
+                        str(index): group
+                        for index, group in enumerate(match.groups(""), 1)
+                    }
+                )
+                self._variables.update(match.groupdict(""))
+                nested_chain, _ = self._find_nested_location(_block(location))
+                return [location, *nested_chain], True
+        return chain, False
+
+    def _substitute(self, value: str) -> str:
+        def _variable(match: re.Match[str]) -> str:
+            name = match.group(0).strip("${}")
+            if name == "uri":
+                return self._uri
+            if name == "request_uri":
+                return self._request_path
+            return self._variables.get(name, match.group(0))
+
+        return _VARIABLE_PATTERN.sub(_variable, value)
+
+
+def _check_lua(directives: Sequence[Directive]) -> Iterator[ConfigurationWarning]:
+    for directive in directives:
+        if _LUA_PHASE_DIRECTIVE_PATTERN.fullmatch(directive.name):
+            yield ConfigurationWarning(
+                _(
+                    "This runs Lua for every request, including those for static files. Consider running it only in the locations that need it."
+                ),
+                directive,
+            )
+
+
+def _check_server(
+    http: Sequence[Directive], server: Directive
+) -> Iterator[ConfigurationWarning]:
+    yield from _check_lua(_block(server))
+    # Servers that only redirect or refuse requests have nothing to compress.
+    if not any(directive.name == "return" for directive in _block(server)) and not any(
+        directive.name == "gzip" and directive.args == ("on",)
+        for directive in (*http, *_block(server))
+    ):
+        yield ConfigurationWarning(_("Responses are not compressed."), server)
+    yield from _check_locations([http, _block(server)], _block(server))
+
+
+def _check_locations(
+    levels: Sequence[Sequence[Directive]], directives: Sequence[Directive]
+) -> Iterator[ConfigurationWarning]:
+    for directive in directives:
+        if directive.name == "try_files":
+            for arg in directive.args[:-1]:
+                if not arg:
+                    yield ConfigurationWarning(
+                        _(
+                            "An empty try_files argument never matches a file, but still costs a filesystem probe."
+                        ),
+                        directive,
+                    )
+                    break
+        if directive.name != "location":
+            continue
+        if directive.args[0] in ("~", "~*") and _VARIABLE_PATTERN.search(
+            directive.args[-1].replace("$)", ")")
+        ):
+            yield ConfigurationWarning(
+                _(
+                    "Location patterns do not support variables, so this pattern may never match."
+                ),
+                directive,
+            )
+        location_levels = [*levels, _block(directive)]
+        yield from _check_headers(levels, location_levels, directive)
+        yield from _check_locations(location_levels, _block(directive))
+
+
+def _check_headers(
+    parent_levels: Sequence[Sequence[Directive]],
+    levels: Sequence[Sequence[Directive]],
+    location: Directive,
+) -> Iterator[ConfigurationWarning]:
+    headers = _header_names(_block(location))
+    if headers:
+        dropped_headers = sorted(
+            _header_names(_inherited(parent_levels, "add_header")).keys()
+            - headers.keys()
+        )
+        if dropped_headers:
+            yield ConfigurationWarning(
+                _(
+                    "This location's add_header directives replace all inherited ones, so its responses lack the {headers} headers."
+                ).format(headers=", ".join(dropped_headers)),
+                location,
+            )
+    if any(
+        directive.name in ("return", "internal", "stub_status")
+        or directive.name.startswith("content_by_lua")
+        for directive in _block(location)
+    ):
+        return
+    if "cache-control" not in _header_names(
+        _inherited(levels, "add_header")
+    ) and not _inherited(levels, "expires"):
+        yield ConfigurationWarning(
+            _(
+                "Responses from this location have no Cache-Control header, so clients must revalidate them on every use."
+            ),
+            location,
+        )
+
+
+def _header_names(directives: Sequence[Directive]) -> Mapping[str, Directive]:
+    return {
+        directive.args[0].lower(): directive
+        for directive in directives
+        if directive.name == "add_header" and directive.args
+    }
@@ -3,15 +3,358 @@ Build nginx and Docker artifacts, such as configuration files.
 """
 
 import asyncio
+import json
+import os
+import re
+import time
+from collections.abc import AsyncIterable, AsyncIterator, Iterator, Sequence
+from contextlib import AbstractContextManager, contextmanager, nullcontext, suppress
+from dataclasses import dataclass, field
+from functools import cache
 from pathlib import Path
-from shutil import copyfile
+from tempfile import mkstemp
+from typing import TYPE_CHECKING, Any, cast
 from urllib.parse import urlparse
+from weakref import ref
 
 import aiofiles
-from aiofiles.os import makedirs
+from aiofiles.os import makedirs, remove, replace, stat
+from aiofiles.threadpool.binary import AsyncBufferedIOBase
 from betty.path import rootname
-from betty.project import Project
-from jinja2 import FileSystemLoader
+from betty.project import Project, ProjectContext, ProjectEvent
+from jinja2 import FileSystemLoader, Template
+
+from betty_nginx.config import RATE_LIMIT_PRESETS
+
+if TYPE_CHECKING:
+    from betty_nginx import Nginx
+
+# Any Lua directive requires OpenResty, e.g. set_by_lua_block, log_by_lua_file, or lua_shared_dict.
+_LUA_DIRECTIVE_PATTERN = re.compile(r"^\s*(?:\w+_by_lua\w*|lua_\w+)\s", re.MULTILINE)
+
+_ASSETS_DIRECTORY_PATH = Path(__file__).parent / "assets"
+
+_WRITE_BUFFER_SIZE = 2**16
+
+# The Lua modules the nginx configuration may require.
+_LUA_MODULE_FILE_NAMES = (
+    "content_negotiation.lua",
+    "error_pages.lua",
+    "metrics.lua",
+    "trace.lua",
+)
+
+# Precompressed files change along with the files they were compressed from.
+_COMPRESSED_FILE_SUFFIXES = ("", ".gz", ".br")
+
+# These files change far less often than the site's HTML and JSON resources.
+_ASSET_FILE_EXTENSIONS = (
+    "avif",
+    "css",
+    "gif",
+    "ico",
+    "jpeg",
+    "jpg",
+    "js",
+    "pdf",
+    "png",
+    "svg",
+    "ttf",
+    "webp",
+    "woff",
+    "woff2",
+)
+
+
+@dataclass
+class _Stopwatch:
+    start: float | None = None
+    elapsed: float = 0.0
+
+
+@dataclass(frozen=True)
+class GenerationSpan:
+    """
+    The time a single step of artifact generation took.
+
+    Steps are ``load_template``, ``compile_template``, ``render``, ``create_directories``,
+    ``write``, and ``copy``. Streamed configuration is rendered while it is written, so the ``render`` span of such a
+    file is the time spent rendering in total, and its ``write`` span excludes that time. Likewise, spans exclude the
+    spans nested in them, such as loading a template while rendering, so the durations of a report's spans never add
+    up to more than the time generation took.
+    """
+
+    step: str
+    file_path: Path | None
+    start: float
+    duration: float
+
+
+@dataclass
+class GenerationReport:
+    """
+    Report which artifact files generation wrote, and which it left alone because they were unchanged.
+
+    The report also records how long each step of generation took.
+    """
+
+    written: list[Path] = field(default_factory=list)
+    unchanged: list[Path] = field(default_factory=list)
+    spans: list[GenerationSpan] = field(default_factory=list)
+    # The durations of the spans nested in each of the spans that are being timed.
+    _nested_durations: list[float] = field(
+        default_factory=list, init=False, repr=False, compare=False
+    )
+
+    @property
+    def changed(self) -> bool:
+        """
+        Whether generation changed any files.
+        """
+        return bool(self.written)
+
+    def extend(self, other: "GenerationReport") -> None:
+        """
+        Add another report's files to this report.
+        """
+        self.written.extend(other.written)
+        self.unchanged.extend(other.unchanged)
+        self.spans.extend(other.spans)
+
+    @contextmanager
+    def span(self, step: str, file_path: Path | None = None) -> Iterator[None]:
+        """
+        Time a step of generation.
+        """
+        stopwatch = _Stopwatch()
+        with self._time(stopwatch):
+            yield
+        self._record(step, file_path, stopwatch)
+
+    @contextmanager
+    def _time(self, stopwatch: _Stopwatch) -> Iterator[None]:
+        """
+        Add the time spent in this context to a stopwatch, excluding the spans nested in it.
+        """
+        start = time.perf_counter()
+        if stopwatch.start is None:
+            stopwatch.start = start
+        self._nested_durations.append(0.0)
+        try:
+            yield
+        finally:
+            nested_duration = self._nested_durations.pop()
+            duration = time.perf_counter() - start
+            stopwatch.elapsed += duration - nested_duration
+            if self._nested_durations:
+                self._nested_durations[-1] += duration
+
+    def _record(self, step: str, file_path: Path | None, stopwatch: _Stopwatch) -> None:
+        assert stopwatch.start is not None
+        self.spans.append(
+            GenerationSpan(step, file_path, stopwatch.start, stopwatch.elapsed)
+        )
+
+
+def _span(
+    report: GenerationReport | None, step: str, file_path: Path | None = None
+) -> AbstractContextManager[None]:
+    if report is None:
+        return nullcontext()
+    return report.span(step, file_path)
+
+
+class PostGenerateArtifactsEvent(ProjectEvent):
+    """
+    Dispatched after the nginx artifacts were generated for a site.
+    """
+
+    def __init__(self, job_context: ProjectContext, report: GenerationReport):
+        super().__init__(job_context)
+        self._report = report
+
+    @property
+    def report(self) -> GenerationReport:
+        """
+        The report of what generation wrote, and how long each step took.
+        """
+        return self._report
+
+
+async def write_generation_profile(
+    report: GenerationReport, destination_file_path: Path
+) -> None:
+    """
+    Write the timing spans of a generation report to a JSON file.
+
+    Spans start at seconds since the first span started.
+    """
+    spans = sorted(report.spans, key=lambda span: span.start)
+    origin = spans[0].start if spans else 0.0
+    step_durations: dict[str, float] = {}
+    for span in spans:
+        step_durations[span.step] = step_durations.get(span.step, 0.0) + span.duration
+    profile = {
+        "steps": step_durations,
+        "spans": [
+            {
+                "step": span.step,
+                "file": None if span.file_path is None else str(span.file_path),
+                "start": span.start - origin,
+                "duration": span.duration,
+            }
+            for span in spans
+        ],
+    }
+    await _write_file(
+        destination_file_path, json.dumps(profile, indent=2), GenerationReport()
+    )
+
+
+async def _write_file(
+    destination_file_path: Path,
+    contents: str | bytes | AsyncIterable[str],
+    report: GenerationReport,
+) -> None:
+    """
+    Write a file, unless it already has the given contents.
+
+    Contents are streamed, and compared to the existing file as they are produced. Nothing is written until the
+    contents differ, and the file is replaced atomically once all contents have been written.
+    """
+    render_stopwatch = _Stopwatch()
+    if not isinstance(contents, str | bytes):
+        contents = _time_chunks(contents, render_stopwatch, report)
+    with report.span("create_directories", destination_file_path):
+        await makedirs(destination_file_path.parent, exist_ok=True)
+    write_stopwatch = _Stopwatch()
+    # Rendering is timed as a span nested in writing, so writing excludes it.
+    with report._time(write_stopwatch):
+        await _replace_file(destination_file_path, contents, report)
+    if render_stopwatch.start is not None:
+        report._record("render", destination_file_path, render_stopwatch)
+    report._record("write", destination_file_path, write_stopwatch)
+
+
+async def _time_chunks(
+    chunks: AsyncIterable[str], stopwatch: _Stopwatch, report: GenerationReport
+) -> AsyncIterator[str]:
+    iterator = aiter(chunks)
+    while True:
+        with report._time(stopwatch):
+            try:
+                chunk = await anext(iterator)
+            except StopAsyncIteration:
+                return
+        yield chunk
+
+
+async def _replace_file(
+    destination_file_path: Path,
+    contents: str | bytes | AsyncIterable[str],
+    report: GenerationReport,
+) -> None:
+    try:
+        existing_file = await aiofiles.open(destination_file_path, "rb")
+    except FileNotFoundError:
+        existing_file = None
+    # Open the temporary file lazily. Cast the initial values, so type checkers do not narrow these to None.
+    temporary_file_path = cast("Path | None", None)
+    temporary_file = cast("AsyncBufferedIOBase | None", None)
+    # The number of leading bytes that are the same in the existing file and the new contents.
+    same_size = 0
+    try:
+        async for chunk in _buffer_chunks(contents):
+            if (
+                temporary_file is None
+                and existing_file is not None
+                and await existing_file.read(len(chunk)) == chunk
+            ):
+                same_size += len(chunk)
+            else:
+                if temporary_file is None:
+                    temporary_file_path, temporary_file = await _open_temporary_file(
+                        destination_file_path, same_size
+                    )
+                await temporary_file.write(chunk)
+        if temporary_file is None:
+            if existing_file is not None and await existing_file.read(1) == b"":
+                report.unchanged.append(destination_file_path)
+                return
+            # The existing file is longer than the new contents, or there is no existing file.
+            temporary_file_path, temporary_file = await _open_temporary_file(
+                destination_file_path, same_size
+            )
+        await temporary_file.close()
+        assert temporary_file_path is not None
+        # Keep the existing file's permissions, because temporary files are private.
+        mode = (
+            0o644
+            if existing_file is None
+            else (await stat(destination_file_path)).st_mode & 0o777
+        )
+        await asyncio.to_thread(os.chmod, temporary_file_path, mode)
+        await replace(temporary_file_path, destination_file_path)
+        report.written.append(destination_file_path)
+    except BaseException:
+        if temporary_file is not None:
+            await temporary_file.close()
+        if temporary_file_path is not None:
+            with suppress(FileNotFoundError):
+                await remove(temporary_file_path)
+        raise
+    finally:
+        if existing_file is not None:
+            await existing_file.close()
+
+
+async def _open_temporary_file(
+    destination_file_path: Path, same_size: int
+) -> tuple[Path, AsyncBufferedIOBase]:
+    # Temporary files must be on the same file system as their destinations, so they can be renamed atomically.
+    file_descriptor, temporary_file_path = mkstemp(
+        dir=destination_file_path.parent, prefix=f".{destination_file_path.name}."
+    )
+    os.close(file_descriptor)
+    temporary_file = await aiofiles.open(temporary_file_path, "wb")
+    # Copy what the existing file and the new contents have in common, because we skipped writing it.
+    await _copy_file_head(destination_file_path, temporary_file, same_size)
+    return Path(temporary_file_path), temporary_file
+
+
+async def _copy_file_head(
+    source_file_path: Path, destination_file: AsyncBufferedIOBase, size: int
+) -> None:
+    if not size:
+        return
+    async with aiofiles.open(source_file_path, "rb") as source_file:
+        while size:
+            chunk = await source_file.read(min(size, _WRITE_BUFFER_SIZE))
+            await destination_file.write(chunk)
+            size -= len(chunk)
+
+
+async def _buffer_chunks(
+    contents: str | bytes | AsyncIterable[str],
+) -> AsyncIterator[bytes]:
+    if isinstance(contents, str):
+        contents = contents.encode("utf-8")
+    if isinstance(contents, bytes):
+        for offset in range(0, len(contents), _WRITE_BUFFER_SIZE):
+            yield contents[offset : offset + _WRITE_BUFFER_SIZE]
+        return
+    # Templates produce many small chunks, so combine them to write (and compare) efficiently.
+    buffer: list[str] = []
+    buffer_size = 0
+    async for chunk in contents:
+        buffer.append(chunk)
+        buffer_size += len(chunk)
+        if buffer_size >= _WRITE_BUFFER_SIZE:
+            yield "".join(buffer).encode("utf-8")
+            buffer.clear()
+            buffer_size = 0
+    if buffer:
+        yield "".join(buffer).encode("utf-8")
 
 
 async def generate_configuration_file(
@@ -19,56 +362,432 @@ async def generate_configuration_file(
     destination_file_path: Path | None = None,
     www_directory_path: str | None = None,
     https: bool | None = None,
-) -> None:
+    debug: bool | None = None,
+) -> GenerationReport:
     """
     Generate an ``nginx.conf`` file to the given destination path.
+
+    Files whose contents would not change are not written, so they keep their modification times.
+
+    :param debug: Whether to add debugging headers. Defaults to the project's debug mode.
     """
-    from betty_nginx import Nginx
+    if destination_file_path is None:
+        destination_file_path = (
+            project.configuration.output_directory_path / "nginx" / "nginx.conf"
+        )
+    report = GenerationReport()
+    await _write_file(
+        destination_file_path,
+        _stream_configuration_file(
+            project,
+            www_directory_path=www_directory_path,
+            https=https,
+            debug=debug,
+            report=report,
+        ),
+        report,
+    )
+    nginx = await _get_nginx(project)
+    if nginx.configuration.replicas is not None:
+        await _generate_front_configuration_file(
+            project, destination_file_path.parent / "front.conf", report
+        )
+    return report
 
-    extensions = await project.extensions
-    nginx = extensions[Nginx]
-    assert isinstance(nginx, Nginx)
+
+async def _generate_front_configuration_file(
+    project: Project, destination_file_path: Path, report: GenerationReport
+) -> None:
+    nginx = await _get_nginx(project)
+    data = {
+        "server_name": urlparse(project.configuration.base_url).netloc,
+        # The front server is the only server that sees the clients' addresses.
+        "rate_limits_http": await _render_rate_limits(
+            project, render_servers=False, report=report
+        ),
+        "rate_limits_server": await _render_rate_limits(
+            project, render_http=False, report=report
+        ),
+        "image_variants": nginx.configuration.image_variants,
+    }
+    template = await _load_template(project, "front.conf.j2", report)
+    with report.span("render", destination_file_path):
+        configuration = await template.render_async(data)
+    await _write_file(destination_file_path, configuration, report)
+
+
+async def generate_multi_site_configuration_file(
+    projects: Sequence[Project],
+    destination_file_path: Path,
+    www_directory_paths: Sequence[str | None] | None = None,
+    https: bool | None = None,
+    debug: bool | None = None,
+) -> GenerationReport:
+    """
+    Generate a single ``nginx.conf`` file that serves multiple projects to the given destination path.
+
+    Each project gets its own server blocks, and requests are routed to them by their ``Host`` header,
+    based on the projects' URLs. Configuration that applies to all servers, such as access logging, is taken
+    from the first project.
+
+    :param www_directory_paths: The projects' web root directory paths, in the same order as the projects.
+    :param debug: Whether to add debugging headers. Defaults to each project's debug mode.
+    """
+    if not projects:
+        raise ValueError("At least one project is required.")
+    if www_directory_paths is None:
+        www_directory_paths = [None] * len(projects)
+    elif len(www_directory_paths) != len(projects):
+        raise ValueError("There must be exactly one web root per project.")
+    report = GenerationReport()
+    await _write_file(
+        destination_file_path,
+        _stream_multi_site_configuration_file(
+            projects, www_directory_paths, https, debug, report
+        ),
+        report,
+    )
+    return report
+
+
+async def _stream_multi_site_configuration_file(
+    projects: Sequence[Project],
+    www_directory_paths: Sequence[str | None],
+    https: bool | None,
+    debug: bool | None,
+    report: GenerationReport,
+) -> AsyncIterator[str]:
+    nginxes = [await _get_nginx(project) for project in projects]
+    async for chunk in _stream_configuration_file(
+        projects[0],
+        https=https,
+        multi_site=True,
+        render_servers=False,
+        metered=any(nginx.configuration.metrics for nginx in nginxes),
+        image_variants_mapped=any(
+            nginx.configuration.image_variants for nginx in nginxes
+        ),
+        traced=any(project.configuration.debug for project in projects)
+        if debug is None
+        else debug,
+        debug=debug,
+        report=report,
+    ):
+        yield chunk
+    for project, www_directory_path in zip(projects, www_directory_paths, strict=True):
+        yield "\n"
+        async for chunk in _stream_configuration_file(
+            project,
+            www_directory_path=www_directory_path,
+            https=https,
+            debug=debug,
+            multi_site=True,
+            render_http=False,
+            http_project=projects[0],
+            report=report,
+        ):
+            yield chunk
+
+
+async def _render_configuration_file(project: Project, **kwargs: Any) -> str:
+    return "".join(
+        [chunk async for chunk in _stream_configuration_file(project, **kwargs)]
+    )
+
+
+async def _stream_configuration_file(
+    project: Project,
+    *,
+    www_directory_path: str | None = None,
+    https: bool | None = None,
+    debug: bool | None = None,
+    multi_site: bool = False,
+    render_http: bool = True,
+    render_servers: bool = True,
+    http_project: Project | None = None,
+    metered: bool | None = None,
+    traced: bool | None = None,
+    image_variants_mapped: bool | None = None,
+    report: GenerationReport | None = None,
+) -> AsyncIterator[str]:
+    nginx = await _get_nginx(project)
+    # Server blocks must match what the http block sets up, which may be rendered for another project.
+    http_nginx = nginx if http_project is None else await _get_nginx(http_project)
+    access_log = None
+    if nginx.configuration.access_log_file_path is not None:
+        access_log = {
+            "file_path": nginx.configuration.access_log_file_path,
+            "buffer_size": nginx.configuration.access_log_buffer_size,
+            "sample_rate": nginx.configuration.access_log_sample_rate,
+        }
+    access_logged = http_nginx.configuration.access_log_file_path is not None
+    metrics = None
+    if nginx.configuration.metrics:
+        metrics = {
+            "allowed_addresses": nginx.configuration.metrics_allowed_addresses,
+        }
+    if metered is None:
+        metered = metrics is not None
+    if debug is None:
+        debug = project.configuration.debug
+    if traced is None:
+        traced = debug
+    if image_variants_mapped is None:
+        image_variants_mapped = nginx.configuration.image_variants
     data = {
         "server_name": urlparse(project.configuration.base_url).netloc,
         "www_directory_path": www_directory_path or nginx.www_directory_path,
-        "https": https or nginx.https,
+        "released": www_directory_path is None
+        and nginx.configuration.releases_directory_path is not None,
+        "https": nginx.https if https is None else https,
+        "debug": debug,
+        "replicated": nginx.configuration.replicas is not None,
+        "multi_site": multi_site,
+        "render_http": render_http,
+        "render_servers": render_servers,
+        "access_log": access_log,
+        "access_logged": access_logged,
+        "metrics": metrics,
+        "metered": metered,
+        "traced": traced,
+        "image_variants": nginx.configuration.image_variants,
+        "image_variants_mapped": image_variants_mapped,
+        "asset_file_extensions": _ASSET_FILE_EXTENSIONS,
+        "error_pages_in_memory": nginx.configuration.error_pages_in_memory,
+        "rejected_path_prefixes": nginx.configuration.rejected_path_prefixes,
+        "rate_limits_http": "",
+        "rate_limits_server": "",
     }
-    if destination_file_path is None:
-        destination_file_path = (
-            project.configuration.output_directory_path / "nginx" / "nginx.conf"
+    # With replicas, the front server applies rate limits instead.
+    if nginx.configuration.replicas is None:
+        if render_http:
+            data["rate_limits_http"] = await _render_rate_limits(
+                project, render_servers=False, report=report
+            )
+        if render_servers:
+            data["rate_limits_server"] = await _render_rate_limits(
+                http_project or project, render_http=False, report=report
+            )
+    template = await _load_template(project, "nginx.conf.j2", report)
+    async for chunk in template.generate_async(data):
+        yield chunk
+
+
+async def _render_rate_limits(
+    project: Project,
+    *,
+    render_http: bool = True,
+    render_servers: bool = True,
+    report: GenerationReport | None = None,
+) -> str:
+    nginx = await _get_nginx(project)
+    if nginx.configuration.rate_limit is None:
+        return ""
+    data = {
+        "preset": RATE_LIMIT_PRESETS[nginx.configuration.rate_limit],
+        "allowed_addresses": nginx.configuration.rate_limit_allowed_addresses,
+        "asset_file_extensions": _ASSET_FILE_EXTENSIONS,
+        "crawler_user_agent_pattern": "|".join(
+            re.escape(user_agent).replace('"', '\\"')
+            for user_agent in nginx.configuration.rate_limit_crawler_user_agents
+        ),
+        "render_http": render_http,
+        "render_servers": render_servers,
+    }
+    template = await _load_template(project, "rate_limits.conf.j2", report)
+    with _span(report, "render", _ASSETS_DIRECTORY_PATH / "rate_limits.conf.j2"):
+        return await template.render_async(data)
+
+
+async def _get_nginx(project: Project) -> "Nginx":
+    from betty_nginx import Nginx
+
+    extensions = await project.extensions
+    nginx = extensions[Nginx]
+    assert isinstance(nginx, Nginx)
+    return nginx
+
+
+async def _load_template(
+    project: Project, template_file_name: str, report: GenerationReport | None = None
+) -> Template:
+    with _span(report, "load_template", _ASSETS_DIRECTORY_PATH / template_file_name):
+        return await _load_cached_template(project, template_file_name, report)
+
+
+async def _load_cached_template(
+    project: Project, template_file_name: str, report: GenerationReport | None
+) -> Template:
+    jinja2_environment = await project.jinja2_environment
+    loader = _template_loader()
+    template_name = _template_name(template_file_name)
+    # Compiled templates are bound to their environment, so we cache them in the environment's own template cache,
+    # keyed like Jinja2 does. That way, they never outlive their environment.
+    cache_key = (ref(loader), template_name)
+    templates = jinja2_environment.cache
+    if templates is not None:
+        template = templates.get(cache_key)
+        # A template is up to date as long as its file's modification time is unchanged.
+        if template is not None and template.is_up_to_date:
+            return template
+    # Loading honors the environment's bytecode cache, if it has one.
+    with _span(report, "compile_template", _ASSETS_DIRECTORY_PATH / template_file_name):
+        template = loader.load(
+            jinja2_environment, template_name, jinja2_environment.globals
         )
-    root_path = rootname(Path(__file__))
-    configuration_file_template_name = "/".join(
-        (Path(__file__).parent / "assets" / "nginx.conf.j2")
-        .relative_to(root_path)
+    if templates is not None:
+        templates[cache_key] = template
+    return template
+
+
+@cache
+def _template_loader() -> FileSystemLoader:
+    return FileSystemLoader(rootname(Path(__file__)))
+
+
+@cache
+def _template_name(template_file_name: str) -> str:
+    return "/".join(
+        (_ASSETS_DIRECTORY_PATH / template_file_name)
+        .relative_to(rootname(Path(__file__)))
         .parts
     )
-    jinja2_environment = await project.jinja2_environment
-    template = FileSystemLoader(root_path).load(
-        jinja2_environment, configuration_file_template_name, jinja2_environment.globals
+
+
+def requires_lua(configuration: str) -> bool:
+    """
+    Check if nginx configuration uses Lua, and must therefore be served by OpenResty.
+    """
+    return _LUA_DIRECTIVE_PATTERN.search(configuration) is not None
+
+
+def _uses_lua(project: Project, nginx: "Nginx") -> bool:
+    """
+    Check if a project's nginx configuration uses Lua, without rendering it.
+
+    These are the options that ``nginx.conf.j2`` renders Lua directives for.
+    """
+    return (
+        project.configuration.clean_urls
+        or nginx.configuration.metrics
+        or nginx.configuration.error_pages_in_memory
     )
-    await makedirs(destination_file_path.parent, exist_ok=True)
-    configuration_file_contents = await template.render_async(data)
-    async with aiofiles.open(destination_file_path, "w", encoding="utf-8") as f:
-        await f.write(configuration_file_contents)
 
 
 async def generate_dockerfile_file(
-    project: Project, destination_file_path: Path | None = None
-) -> None:
+    project: Project,
+    destination_file_path: Path | None = None,
+    production: bool | None = None,
+    lua: bool | None = None,
+) -> GenerationReport:
     """
     Generate a ``Dockerfile`` to the given destination path.
+
+    Files whose contents would not change are not written, so they keep their modification times.
+
+    Images are based on OpenResty if the nginx configuration uses Lua, and on plain nginx otherwise.
+
+    :param production: Whether to generate a Dockerfile for a production image. Defaults to the extension's
+        configuration. See :py:attr:`betty_nginx.config.NginxConfiguration.production_image`. Production
+        Dockerfiles use the output directory as their build context, so they must be generated inside it.
+    :param lua: Whether the image must support Lua. Defaults to whether the project's nginx configuration
+        uses Lua.
     """
     if destination_file_path is None:
         destination_file_path = (
             project.configuration.output_directory_path / "nginx" / "Dockerfile"
         )
-    await makedirs(destination_file_path.parent, exist_ok=True)
-    await asyncio.to_thread(
-        copyfile, Path(__file__).parent / "assets" / "Dockerfile", destination_file_path
-    )
-    await asyncio.to_thread(
-        copyfile,
-        Path(__file__).parent / "assets" / "content_negotiation.lua",
-        destination_file_path.parent / "content_negotiation.lua",
-    )
+    report = GenerationReport()
+    nginx = await _get_nginx(project)
+    if production is None:
+        production = nginx.configuration.production_image
+    if lua is None:
+        lua = _uses_lua(project, nginx)
+    if production:
+        await _generate_production_dockerfile_file(
+            project, destination_file_path, lua, report
+        )
+    else:
+        template = await _load_template(project, "Dockerfile.j2", report)
+        with report.span("render", destination_file_path):
+            dockerfile = await template.render_async(
+                {"lua": lua, "lua_module_file_names": _LUA_MODULE_FILE_NAMES}
+            )
+        await _write_file(destination_file_path, dockerfile, report)
+    for lua_module_file_name in _LUA_MODULE_FILE_NAMES:
+        lua_module_file_path = destination_file_path.parent / lua_module_file_name
+        with report.span("copy", lua_module_file_path):
+            async with aiofiles.open(
+                _ASSETS_DIRECTORY_PATH / lua_module_file_name, "rb"
+            ) as f:
+                lua_module = await f.read()
+        await _write_file(lua_module_file_path, lua_module, report)
+    if nginx.configuration.replicas is not None:
+        await _generate_compose_file(project, destination_file_path, production, report)
+    return report
+
+
+async def _generate_compose_file(
+    project: Project,
+    dockerfile_file_path: Path,
+    production: bool,
+    report: GenerationReport,
+) -> None:
+    nginx = await _get_nginx(project)
+    nginx_directory_path = dockerfile_file_path.parent
+    output_directory_path = project.configuration.output_directory_path
+    data = {
+        "production": production,
+        "replicas": nginx.configuration.replicas,
+        "output_directory_path": Path(
+            os.path.relpath(output_directory_path, nginx_directory_path)
+        ).as_posix(),
+        # The Dockerfile may be generated elsewhere, such as when serving the project.
+        "dockerfile_context_path": Path(
+            os.path.relpath(dockerfile_file_path, output_directory_path)
+        ).as_posix(),
+        "nginx_configuration_file_name": "nginx.conf",
+        "www_directory_path": nginx.www_directory_path,
+        "www_directory_host_path": Path(
+            os.path.relpath(
+                project.configuration.www_directory_path, nginx_directory_path
+            )
+        ).as_posix(),
+    }
+    compose_file_path = nginx_directory_path / "compose.yaml"
+    template = await _load_template(project, "compose.yaml.j2", report)
+    with report.span("render", compose_file_path):
+        compose = await template.render_async(data)
+    await _write_file(compose_file_path, compose, report)
+
+
+async def _generate_production_dockerfile_file(
+    project: Project, destination_file_path: Path, lua: bool, report: GenerationReport
+) -> None:
+    nginx = await _get_nginx(project)
+    output_directory_path = project.configuration.output_directory_path
+    # The image is built with the output directory as its context, and a Dockerfile can only copy files from there.
+    if not destination_file_path.parent.is_relative_to(output_directory_path):
+        raise ValueError(
+            f'A production Dockerfile must be inside its build context, which is the output directory "{output_directory_path}", but "{destination_file_path}" is not.'
+        )
+    data = {
+        "lua": lua,
+        "lua_module_file_names": _LUA_MODULE_FILE_NAMES,
+        "www_directory_path": nginx.www_directory_path,
+        "www_directory_context_path": project.configuration.www_directory_path.relative_to(
+            output_directory_path
+        ).as_posix(),
+        "nginx_directory_context_path": destination_file_path.parent.relative_to(
+            output_directory_path
+        ).as_posix(),
+        "asset_file_expression": " -o ".join(
+            f"-name '*.{extension}{suffix}'"
+            for extension in _ASSET_FILE_EXTENSIONS
+            for suffix in _COMPRESSED_FILE_SUFFIXES
+        ),
+    }
+    template = await _load_template(project, "Dockerfile.production.j2", report)
+    with report.span("render", destination_file_path):
+        dockerfile = await template.render_async(data)
+    await _write_file(destination_file_path, dockerfile, report)
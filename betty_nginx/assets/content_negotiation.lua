@@ -15,9 +15,10 @@ function Cone.negotiate(header, available_values)
     unacceptable_values = {}
     for qualified_value in header:gmatch('([^,]+)') do
         value, quality = Cone.parse_qualified_value(qualified_value)
+        -- Ignore values with malformed qualities, which cannot be compared to other qualities.
         if quality == 0 then
             table.insert(unacceptable_values, value)
-        else
+        elseif quality ~= nil then
             table.insert(acceptable_values, { value, quality})
         end
     end
@@ -0,0 +1,39 @@
+local ErrorPages = {}
+
+local media_types = {
+    html = 'text/html',
+    json = 'application/json',
+}
+
+-- Error pages, keyed by their file paths. Pages that do not exist are cached as false.
+local pages = {}
+
+-- Read an error page from disk, once per worker.
+function ErrorPages.load(file_path)
+    local page = pages[file_path]
+    if page == nil then
+        page = false
+        local file = io.open(file_path, 'rb')
+        if file then
+            page = file:read('*a')
+            file:close()
+        end
+        pages[file_path] = page
+    end
+    return page
+end
+
+-- Respond with an error page from memory.
+function ErrorPages.serve(status, file_path)
+    local page = ErrorPages.load(file_path)
+    if not page then
+        -- Let nginx respond with its own error page instead.
+        return ngx.exit(status)
+    end
+    ngx.status = status
+    ngx.header['Content-Type'] = media_types[file_path:match('%.(%w+)$')] or 'application/octet-stream'
+    ngx.header['Content-Length'] = #page
+    ngx.print(page)
+end
+
+return ErrorPages
@@ -0,0 +1,122 @@
+local Cone = require('content_negotiation')
+
+local Metrics = {}
+
+Metrics.DICTIONARY = 'betty_metrics'
+
+-- The upper bounds of the latency histogram buckets, in seconds.
+Metrics.NEGOTIATION_DURATION_BUCKETS = { 0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001 }
+Metrics.REQUEST_DURATION_BUCKETS = { 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5 }
+
+-- The metric families to expose, in the order to expose them in.
+Metrics.FAMILIES = {
+    { 'betty_negotiations_total', 'counter', 'Content negotiations, per negotiated header and outcome.' },
+    { 'betty_negotiation_duration_seconds', 'histogram', 'The CPU time spent on content negotiation.' },
+    { 'betty_requests_total', 'counter', 'Requests, per location and response status.' },
+    { 'betty_request_duration_seconds', 'histogram', 'Request processing times, per location.' },
+}
+
+local function dictionary()
+    return ngx.shared[Metrics.DICTIONARY]
+end
+
+local function escape_label_value(value)
+    return (tostring(value):gsub('\\', '\\\\'):gsub('"', '\\"'):gsub('\n', '\\n'))
+end
+
+local function format_labels(labels)
+    local names = {}
+    for name in pairs(labels) do
+        table.insert(names, name)
+    end
+    table.sort(names)
+    local formatted_labels = {}
+    for _, name in ipairs(names) do
+        table.insert(formatted_labels, name .. '="' .. escape_label_value(labels[name]) .. '"')
+    end
+    return '{' .. table.concat(formatted_labels, ',') .. '}'
+end
+
+function Metrics.increment(name, labels, value)
+    dictionary():incr(name .. format_labels(labels), value or 1, 0)
+end
+
+function Metrics.observe(name, labels, buckets, value)
+    for _, bucket in ipairs(buckets) do
+        if value <= bucket then
+            labels.le = bucket
+            Metrics.increment(name .. '_bucket', labels)
+        end
+    end
+    labels.le = '+Inf'
+    Metrics.increment(name .. '_bucket', labels)
+    labels.le = nil
+    Metrics.increment(name .. '_sum', labels, value)
+    Metrics.increment(name .. '_count', labels)
+end
+
+function Metrics.negotiate(header_name, header, available_values)
+    local start = os.clock()
+    local negotiated_value = Cone.negotiate(header, available_values)
+    local labels = { header = header_name }
+    Metrics.observe('betty_negotiation_duration_seconds', labels, Metrics.NEGOTIATION_DURATION_BUCKETS, os.clock() - start)
+    labels.outcome = negotiated_value or 'none'
+    Metrics.increment('betty_negotiations_total', labels)
+    return negotiated_value
+end
+
+-- Record a request. Call this from the log phase.
+function Metrics.log(location)
+    Metrics.increment('betty_requests_total', { location = location, status = ngx.status })
+    Metrics.observe(
+        'betty_request_duration_seconds',
+        { location = location },
+        Metrics.REQUEST_DURATION_BUCKETS,
+        ngx.now() - ngx.req.start_time()
+    )
+end
+
+local function family_of(key)
+    for _, family in ipairs(Metrics.FAMILIES) do
+        local name = family[1]
+        if key:sub(1, #name) == name then
+            local suffix = key:sub(#name + 1)
+            if suffix:sub(1, 1) == '{' or suffix:match('^_%a+{') then
+                return name
+            end
+        end
+    end
+    return nil
+end
+
+-- Render all metrics in the Prometheus text exposition format.
+function Metrics.render()
+    local samples = {}
+    for _, key in ipairs(dictionary():get_keys(0)) do
+        local family = family_of(key)
+        if family ~= nil then
+            samples[family] = samples[family] or {}
+            table.insert(samples[family], key)
+        end
+    end
+    local lines = {}
+    for _, family in ipairs(Metrics.FAMILIES) do
+        local name, type, help = family[1], family[2], family[3]
+        table.insert(lines, '# HELP ' .. name .. ' ' .. help)
+        table.insert(lines, '# TYPE ' .. name .. ' ' .. type)
+        local keys = samples[name] or {}
+        table.sort(keys)
+        for _, key in ipairs(keys) do
+            table.insert(lines, key .. ' ' .. tostring(dictionary():get(key) or 0))
+        end
+    end
+    -- nginx's own connection metrics, as also reported by stub_status.
+    table.insert(lines, '# HELP nginx_connections The current client connections, per state.')
+    table.insert(lines, '# TYPE nginx_connections gauge')
+    for _, state in ipairs({ 'active', 'reading', 'writing', 'waiting' }) do
+        table.insert(lines, 'nginx_connections{state="' .. state .. '"} ' .. (ngx.var['connections_' .. state] or 0))
+    end
+    return table.concat(lines, '\n') .. '\n'
+end
+
+return Metrics
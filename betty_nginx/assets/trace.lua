@@ -0,0 +1,39 @@
+local Cone = require('content_negotiation')
+
+local Trace = {}
+
+-- Explain why content negotiation resulted in the given value.
+function Trace.reason(header, negotiated_value)
+    if negotiated_value == nil then
+        return 'nothing available'
+    end
+    if header == nil then
+        return 'no header'
+    end
+    header = header:gsub('%s+', '')
+    if header == '' then
+        return 'no header'
+    end
+    for qualified_value in header:gmatch('([^,]+)') do
+        local value, quality = Cone.parse_qualified_value(qualified_value)
+        if value == negotiated_value and quality ~= 0 then
+            return 'accepted'
+        end
+    end
+    return 'fallback'
+end
+
+-- Record a content negotiation for the debug headers.
+function Trace.negotiation(header_name, header, negotiated_value, duration)
+    local trace = header_name .. '=' .. tostring(negotiated_value) .. ' (' .. Trace.reason(header, negotiated_value) .. ')'
+    if ngx.var.betty_negotiation_trace ~= '' then
+        trace = ngx.var.betty_negotiation_trace .. ', ' .. trace
+    end
+    ngx.var.betty_negotiation_trace = trace
+    ngx.var.betty_negotiation_duration = string.format(
+        '%.3f',
+        (tonumber(ngx.var.betty_negotiation_duration) or 0) + duration * 1000
+    )
+end
+
+return Trace
@@ -1,19 +1,124 @@
 """Integrate Betty with `nginx <https://nginx.org/>`_."""
 
+import re
+from collections.abc import Mapping, Sequence
+from dataclasses import dataclass
+from typing import Any
+
 from betty.assertion import (
+    AssertionChain,
     OptionalField,
     assert_record,
+    assert_sequence,
     assert_or,
     assert_bool,
+    assert_int,
     assert_none,
+    assert_positive_number,
     assert_setattr,
     assert_str,
 )
+from betty.assertion.error import AssertionFailed
 from betty.config import Configuration
+from betty.locale.localizable import _
 from betty.serde.dump import Dump
 from typing_extensions import override
 
 
+def _assert_sample_rate() -> AssertionChain[Any, float]:
+    def _assert_sample_rate_range(sample_rate: float) -> float:
+        if sample_rate > 1:
+            raise AssertionFailed(_("This must be a number of at most 1."))
+        return sample_rate
+
+    return assert_positive_number() | _assert_sample_rate_range
+
+
+@dataclass(frozen=True)
+class RateLimitPreset:
+    """
+    Request rate and connection limits for each client.
+
+    Rates are in nginx's notation, such as ``10r/s`` or ``30r/m``. Bursts are the numbers of requests that may
+    exceed the rate before nginx responds with ``429 Too Many Requests``.
+    """
+
+    page_rate: str
+    page_burst: int
+    asset_rate: str
+    asset_burst: int
+    crawler_rate: str
+    crawler_burst: int
+    connections: int
+
+
+RATE_LIMIT_PRESETS: Mapping[str, RateLimitPreset] = {
+    "relaxed": RateLimitPreset(
+        page_rate="20r/s",
+        page_burst=40,
+        asset_rate="100r/s",
+        asset_burst=200,
+        crawler_rate="2r/s",
+        crawler_burst=10,
+        connections=50,
+    ),
+    "moderate": RateLimitPreset(
+        page_rate="10r/s",
+        page_burst=20,
+        asset_rate="50r/s",
+        asset_burst=100,
+        crawler_rate="1r/s",
+        crawler_burst=5,
+        connections=20,
+    ),
+    "strict": RateLimitPreset(
+        page_rate="5r/s",
+        page_burst=10,
+        asset_rate="20r/s",
+        asset_burst=40,
+        crawler_rate="30r/m",
+        crawler_burst=2,
+        connections=10,
+    ),
+}
+"""
+The available rate limit presets, keyed by their names.
+"""
+
+
+def _assert_rate_limit() -> AssertionChain[Any, str]:
+    def _assert_rate_limit_preset(rate_limit: str) -> str:
+        if rate_limit not in RATE_LIMIT_PRESETS:
+            raise AssertionFailed(
+                _(
+                    '"{rate_limit}" is not a rate limit preset. Choose one of {presets}.'
+                ).format(
+                    rate_limit=rate_limit,
+                    presets=", ".join(RATE_LIMIT_PRESETS),
+                )
+            )
+        return rate_limit
+
+    return assert_str() | _assert_rate_limit_preset
+
+
+# Characters that would end a location prefix in nginx configuration.
+_PATH_PREFIX_PATTERN = re.compile(r"/[^\s\"';{}]*")
+
+
+def _assert_path_prefix() -> AssertionChain[Any, str]:
+    def _assert_path_prefix_syntax(path_prefix: str) -> str:
+        if _PATH_PREFIX_PATTERN.fullmatch(path_prefix) is None:
+            raise AssertionFailed(
+                _(
+                    '"{path_prefix}" is not a URL path prefix. It must start with a slash, and must not contain whitespace, quotes, semicolons, or braces.'
+                ).format(path_prefix=path_prefix)
+            )
+        return path_prefix
+
+    return assert_str() | _assert_path_prefix_syntax
+
+
 class NginxConfiguration(Configuration):
     """
     Provide configuration for the :py:class:`betty_nginx.Nginx` extension.
@@ -24,10 +129,47 @@ class NginxConfiguration(Configuration):
         *,
         www_directory_path: str | None = None,
         https: bool | None = None,
+        production_image: bool = False,
+        replicas: int | None = None,
+        access_log_file_path: str | None = None,
+        access_log_buffer_size: str | None = "64k",
+        access_log_sample_rate: float = 1.0,
+        metrics: bool = False,
+        metrics_allowed_addresses: Sequence[str] = ("127.0.0.1", "::1"),
+        rate_limit: str | None = None,
+        rate_limit_allowed_addresses: Sequence[str] = ("127.0.0.1", "::1"),
+        rate_limit_crawler_user_agents: Sequence[str] = (
+            "bot",
+            "crawl",
+            "spider",
+            "slurp",
+        ),
+        releases_directory_path: str | None = None,
+        releases_kept: int = 3,
+        image_variants: bool = False,
+        generation_profile: bool = False,
+        error_pages_in_memory: bool = False,
+        rejected_path_prefixes: Sequence[str] = (),
     ):
         super().__init__()
         self._https = https
         self.www_directory_path = www_directory_path
+        self.production_image = production_image
+        self.replicas = replicas
+        self.access_log_file_path = access_log_file_path
+        self.access_log_buffer_size = access_log_buffer_size
+        self.access_log_sample_rate = access_log_sample_rate
+        self.metrics = metrics
+        self.metrics_allowed_addresses = metrics_allowed_addresses
+        self.rate_limit = rate_limit
+        self.rate_limit_allowed_addresses = rate_limit_allowed_addresses
+        self.rate_limit_crawler_user_agents = rate_limit_crawler_user_agents
+        self.releases_directory_path = releases_directory_path
+        self.releases_kept = releases_kept
+        self.image_variants = image_variants
+        self.generation_profile = generation_profile
+        self.error_pages_in_memory = error_pages_in_memory
+        self.rejected_path_prefixes = rejected_path_prefixes
 
     @property
     def https(self) -> bool | None:
@@ -54,6 +196,227 @@ class NginxConfiguration(Configuration):
     def www_directory_path(self, www_directory_path: str | None) -> None:
         self._www_directory_path = www_directory_path
 
+    @property
+    def production_image(self) -> bool:
+        """
+        Whether the generated Dockerfile builds a production image.
+
+        Production images contain the nginx configuration and the site itself, so they do not need any
+        volumes. Their Dockerfile must be built with the project's output directory as the build context.
+        """
+        return self._production_image
+
+    @production_image.setter
+    def production_image(self, production_image: bool) -> None:
+        self._production_image = production_image
+
+    @property
+    def replicas(self) -> int | None:
+        """
+        The number of nginx replicas to deploy with Docker Compose.
+
+        If set, a Docker Compose file and a front nginx configuration are generated as well. The front
+        server balances requests over the replicas and caches their responses. TLS must be terminated
+        before the front server, so the replicas and the front server listen for plain HTTP.
+
+        :return: The number of replicas, or ``None`` to not generate a Docker Compose deployment.
+        """
+        return self._replicas
+
+    @replicas.setter
+    def replicas(self, replicas: int | None) -> None:
+        self._replicas = replicas
+
+    @property
+    def access_log_file_path(self) -> str | None:
+        """
+        The path to the file nginx writes structured JSON access logs to.
+
+        :return: The path, or ``None`` to keep nginx's default access logging.
+        """
+        return self._access_log_file_path
+
+    @access_log_file_path.setter
+    def access_log_file_path(self, access_log_file_path: str | None) -> None:
+        self._access_log_file_path = access_log_file_path
+
+    @property
+    def access_log_buffer_size(self) -> str | None:
+        """
+        The size of nginx's access log buffer, such as ``64k``.
+
+        Buffered log entries are written once the buffer is full, or after at most five seconds.
+
+        :return: The buffer size, or ``None`` to write every log entry immediately.
+        """
+        return self._access_log_buffer_size
+
+    @access_log_buffer_size.setter
+    def access_log_buffer_size(self, access_log_buffer_size: str | None) -> None:
+        self._access_log_buffer_size = access_log_buffer_size
+
+    @property
+    def access_log_sample_rate(self) -> float:
+        """
+        The fraction of requests to log, greater than 0 and at most 1.
+        """
+        return self._access_log_sample_rate
+
+    @access_log_sample_rate.setter
+    def access_log_sample_rate(self, access_log_sample_rate: float) -> None:
+        self._access_log_sample_rate = access_log_sample_rate
+
+    @property
+    def metrics(self) -> bool:
+        """
+        Whether to collect request and content negotiation metrics.
+
+        Metrics are exposed in the Prometheus text format at ``/.metrics``, and nginx's own connection status at
+        ``/.metrics/stub_status``. Collecting metrics requires OpenResty.
+        """
+        return self._metrics
+
+    @metrics.setter
+    def metrics(self, metrics: bool) -> None:
+        self._metrics = metrics
+
+    @property
+    def metrics_allowed_addresses(self) -> Sequence[str]:
+        """
+        The addresses or CIDR ranges that may access the metrics.
+        """
+        return self._metrics_allowed_addresses
+
+    @metrics_allowed_addresses.setter
+    def metrics_allowed_addresses(
+        self, metrics_allowed_addresses: Sequence[str]
+    ) -> None:
+        self._metrics_allowed_addresses = list(metrics_allowed_addresses)
+
+    @property
+    def rate_limit(self) -> str | None:
+        """
+        The name of the rate limit preset to apply to each client.
+
+        Pages and assets are limited separately, and crawlers are limited further. With replicas, limits
+        are applied by the front server, because that is the only server that sees the clients' addresses.
+
+        :return: One of :py:data:`betty_nginx.config.RATE_LIMIT_PRESETS`, or ``None`` to not limit clients.
+        """
+        return self._rate_limit
+
+    @rate_limit.setter
+    def rate_limit(self, rate_limit: str | None) -> None:
+        self._rate_limit = rate_limit
+
+    @property
+    def rate_limit_allowed_addresses(self) -> Sequence[str]:
+        """
+        The addresses or CIDR ranges that are never rate limited.
+        """
+        return self._rate_limit_allowed_addresses
+
+    @rate_limit_allowed_addresses.setter
+    def rate_limit_allowed_addresses(
+        self, rate_limit_allowed_addresses: Sequence[str]
+    ) -> None:
+        self._rate_limit_allowed_addresses = list(rate_limit_allowed_addresses)
+
+    @property
+    def rate_limit_crawler_user_agents(self) -> Sequence[str]:
+        """
+        The case-insensitive ``User-Agent`` substrings that identify crawlers.
+        """
+        return self._rate_limit_crawler_user_agents
+
+    @rate_limit_crawler_user_agents.setter
+    def rate_limit_crawler_user_agents(
+        self, rate_limit_crawler_user_agents: Sequence[str]
+    ) -> None:
+        self._rate_limit_crawler_user_agents = list(rate_limit_crawler_user_agents)
+
+    @property
+    def releases_directory_path(self) -> str | None:
+        """
+        The path to the directory to keep versioned releases of the site in.
+
+        If set, nginx serves the release that the ``current`` symlink in this directory points to, and
+        ``betty nginx-release`` copies a generated site into a new release and atomically switches to it.
+        This directory must not be inside the project's output directory, because that is removed when
+        the site is generated. It takes precedence over :py:attr:`betty_nginx.config.NginxConfiguration.www_directory_path`.
+        """
+        return self._releases_directory_path
+
+    @releases_directory_path.setter
+    def releases_directory_path(self, releases_directory_path: str | None) -> None:
+        self._releases_directory_path = releases_directory_path
+
+    @property
+    def releases_kept(self) -> int:
+        """
+        The number of previous releases to keep for rolling back to.
+        """
+        return self._releases_kept
+
+    @releases_kept.setter
+    def releases_kept(self, releases_kept: int) -> None:
+        self._releases_kept = releases_kept
+
+    @property
+    def image_variants(self) -> bool:
+        """
+        Whether to serve AVIF and WebP variants of JPEG and PNG images to clients that accept them.
+
+        Generate the variants with ``betty nginx-images`` after generating the site. Images without variants are
+        served as they are.
+        """
+        return self._image_variants
+
+    @image_variants.setter
+    def image_variants(self, image_variants: bool) -> None:
+        self._image_variants = image_variants
+
+    @property
+    def generation_profile(self) -> bool:
+        """
+        Whether to write a JSON profile of how long each step of generating the nginx artifacts took.
+
+        The profile is written to ``generation-profile.json``, next to ``nginx.conf``.
+        """
+        return self._generation_profile
+
+    @generation_profile.setter
+    def generation_profile(self, generation_profile: bool) -> None:
+        self._generation_profile = generation_profile
+
+    @property
+    def error_pages_in_memory(self) -> bool:
+        """
+        Whether to serve error pages from memory rather than from disk.
+
+        Each nginx worker reads each error page once, and serves it from memory from then on, without any
+        filesystem probes or internal redirects. This requires OpenResty. Reload nginx after changing error pages.
+        """
+        return self._error_pages_in_memory
+
+    @error_pages_in_memory.setter
+    def error_pages_in_memory(self, error_pages_in_memory: bool) -> None:
+        self._error_pages_in_memory = error_pages_in_memory
+
+    @property
+    def rejected_path_prefixes(self) -> Sequence[str]:
+        """
+        The URL path prefixes to respond to with a 404 error page right away, such as ``/wp-admin`` or ``/.git``.
+
+        These are paths that scanners commonly probe, but that the site does not have. Their requests skip all
+        filesystem probes and regular expression locations.
+        """
+        return self._rejected_path_prefixes
+
+    @rejected_path_prefixes.setter
+    def rejected_path_prefixes(self, rejected_path_prefixes: Sequence[str]) -> None:
+        self._rejected_path_prefixes = list(rejected_path_prefixes)
+
     @override
     def load(self, dump: Dump) -> None:
         assert_record(
@@ -68,6 +431,84 @@ class NginxConfiguration(Configuration):
                     assert_str() | assert_setattr(self, "www_directory_path"),
                 ),
             ),
+            OptionalField(
+                "production_image",
+                assert_bool() | assert_setattr(self, "production_image"),
+            ),
+            OptionalField(
+                "replicas",
+                assert_or(
+                    assert_none(),
+                    assert_int() | assert_positive_number(),
+                )
+                | assert_setattr(self, "replicas"),
+            ),
+            OptionalField(
+                "access_log_file",
+                assert_or(assert_none(), assert_str())
+                | assert_setattr(self, "access_log_file_path"),
+            ),
+            OptionalField(
+                "access_log_buffer_size",
+                assert_or(assert_none(), assert_str())
+                | assert_setattr(self, "access_log_buffer_size"),
+            ),
+            OptionalField(
+                "access_log_sample_rate",
+                _assert_sample_rate() | assert_setattr(self, "access_log_sample_rate"),
+            ),
+            OptionalField(
+                "metrics",
+                assert_bool() | assert_setattr(self, "metrics"),
+            ),
+            OptionalField(
+                "metrics_allowed_addresses",
+                assert_sequence(assert_str())
+                | assert_setattr(self, "metrics_allowed_addresses"),
+            ),
+            OptionalField(
+                "rate_limit",
+                assert_or(assert_none(), _assert_rate_limit())
+                | assert_setattr(self, "rate_limit"),
+            ),
+            OptionalField(
+                "rate_limit_allowed_addresses",
+                assert_sequence(assert_str())
+                | assert_setattr(self, "rate_limit_allowed_addresses"),
+            ),
+            OptionalField(
+                "rate_limit_crawler_user_agents",
+                assert_sequence(assert_str())
+                | assert_setattr(self, "rate_limit_crawler_user_agents"),
+            ),
+            OptionalField(
+                "releases_directory",
+                assert_or(assert_none(), assert_str())
+                | assert_setattr(self, "releases_directory_path"),
+            ),
+            OptionalField(
+                "releases_kept",
+                assert_int()
+                | assert_positive_number()
+                | assert_setattr(self, "releases_kept"),
+            ),
+            OptionalField(
+                "image_variants",
+                assert_bool() | assert_setattr(self, "image_variants"),
+            ),
+            OptionalField(
+                "generation_profile",
+                assert_bool() | assert_setattr(self, "generation_profile"),
+            ),
+            OptionalField(
+                "error_pages_in_memory",
+                assert_bool() | assert_setattr(self, "error_pages_in_memory"),
+            ),
+            OptionalField(
+                "rejected_path_prefixes",
+                assert_sequence(_assert_path_prefix())
+                | assert_setattr(self, "rejected_path_prefixes"),
+            ),
         )(dump)
 
     @override
@@ -79,4 +520,20 @@ class NginxConfiguration(Configuration):
                 if self.www_directory_path is None
                 else str(self.www_directory_path)
             ),
+            "production_image": self.production_image,
+            "replicas": self.replicas,
+            "access_log_file": self.access_log_file_path,
+            "access_log_buffer_size": self.access_log_buffer_size,
+            "access_log_sample_rate": self.access_log_sample_rate,
+            "metrics": self.metrics,
+            "metrics_allowed_addresses": list(self.metrics_allowed_addresses),
+            "rate_limit": self.rate_limit,
+            "rate_limit_allowed_addresses": list(self.rate_limit_allowed_addresses),
+            "rate_limit_crawler_user_agents": list(self.rate_limit_crawler_user_agents),
+            "releases_directory": self.releases_directory_path,
+            "releases_kept": self.releases_kept,
+            "image_variants": self.image_variants,
+            "generation_profile": self.generation_profile,
+            "error_pages_in_memory": self.error_pages_in_memory,
+            "rejected_path_prefixes": list(self.rejected_path_prefixes),
         }
@@ -0,0 +1,72 @@
+"""
+Deduplicate generated files.
+
+Multilingual sites contain many identical files in each locale's directory. Replacing duplicates with hardlinks saves
+disk space, and because hardlinks share their data, the operating system caches that data only once, regardless of
+the locale it is requested for.
+"""
+
+import os
+from dataclasses import dataclass
+from pathlib import Path
+
+from betty_nginx.manifest import build_manifest
+
+
+@dataclass(frozen=True)
+class DeduplicationReport:
+    """
+    The results of deduplicating files.
+    """
+
+    linked_files: int
+    saved_bytes: int
+
+
+def deduplicate_files(
+    www_directory_path: Path, *, max_workers: int | None = None
+) -> DeduplicationReport:
+    """
+    Replace identical files in a generated site with hardlinks to a single file.
+
+    Files that cannot be hardlinked, such as on file systems without hardlink support, are left alone. This blocks,
+    so run it in a thread from asynchronous code.
+
+    :param max_workers: The maximum number of files to hash concurrently. Defaults to the number of CPUs.
+    """
+    manifest = build_manifest(www_directory_path, max_workers=max_workers)
+    original_file_paths: dict[tuple[str, int], Path] = {}
+    linked_files = 0
+    saved_bytes = 0
+    for file_path, entry in manifest.items():
+        # Linking empty files saves no space.
+        if not entry.size:
+            continue
+        duplicate_file_path = www_directory_path / file_path
+        original_file_path = original_file_paths.setdefault(
+            (entry.hash, entry.size), duplicate_file_path
+        )
+        if original_file_path == duplicate_file_path or original_file_path.samefile(
+            duplicate_file_path
+        ):
+            continue
+        try:
+            _link(original_file_path, duplicate_file_path)
+        except OSError:
+            continue
+        linked_files += 1
+        saved_bytes += entry.size
+    return DeduplicationReport(linked_files=linked_files, saved_bytes=saved_bytes)
+
+
+def _link(original_file_path: Path, duplicate_file_path: Path) -> None:
+    # Link next to the duplicate first, and then move the link over it, so the duplicate is replaced atomically.
+    link_file_path = duplicate_file_path.with_name(
+        f".{duplicate_file_path.name}.{os.getpid()}.link"
+    )
+    link_file_path.hardlink_to(original_file_path)
+    try:
+        link_file_path.replace(duplicate_file_path)
+    except BaseException:
+        link_file_path.unlink(missing_ok=True)
+        raise
@@ -3,32 +3,61 @@ Integrate Betty with Docker.
 """
 
 import asyncio
+import time
+from collections.abc import Callable, Iterator, Mapping
+from contextlib import contextmanager, suppress
+from http.client import HTTPConnection, HTTPException
 from pathlib import Path
 from types import TracebackType
 from typing import cast
 
 import docker
+from docker.errors import DockerException
 from docker.models.containers import Container as DockerContainer
 
 
+WWW_DIRECTORY_PATH = "/var/www/betty"
+"""
+The path to the web root within containers.
+"""
+
+
+class ContainerNotReadyError(RuntimeError):
+    """
+    Raised when a container's nginx server does not accept connections in time.
+    """
+
+    pass  # pragma: no cover
+
+
 class Container:
     """
     A Docker container with nginx, configured to serve a Betty site.
+
+    The web root is mounted at :py:const:`betty_nginx.docker.WWW_DIRECTORY_PATH`. Multiple web roots
+    may be given, keyed by the names of their directories within it.
     """
 
     _IMAGE_TAG = "betty-nginx-serve"
+    _READINESS_INITIAL_INTERVAL = 0.01
+    _READINESS_MAXIMUM_INTERVAL = 1.0
 
     def __init__(
         self,
-        www_directory_path: Path,
+        www_directory_path: Path | Mapping[str, Path],
         docker_directory_path: Path,
         nginx_configuration_file_path: Path,
+        *,
+        readiness_timeout: float = 30.0,
     ):
         self._docker_directory_path = docker_directory_path
         self._nginx_configuration_file_path = nginx_configuration_file_path
         self._www_directory_path = www_directory_path
+        self._readiness_timeout = readiness_timeout
         self._client = docker.from_env()
         self.__container: DockerContainer | None = None
+        self._image_size = 0
+        self._timings: dict[str, float] = {}
 
     async def __aenter__(self) -> None:
         await self.start()
@@ -48,11 +77,100 @@ class Container:
         await asyncio.to_thread(self._start)
 
     def _start(self) -> None:
-        self._client.images.build(
-            path=str(self._docker_directory_path), tag=self._IMAGE_TAG
+        with self._time("build"):
+            image, _ = self._client.images.build(
+                path=str(self._docker_directory_path), tag=self._IMAGE_TAG
+            )
+        self._image_size = image.attrs["Size"]
+        with self._time("create"):
+            container = self._container
+        # Callers never exit a container that failed to start, so clean it up here.
+        try:
+            with self._time("start"):
+                container.start()
+                container.exec_run(["nginx", "-s", "reload"])
+            with self._time("ready"):
+                self._wait_until(
+                    self._is_ready,
+                    f"nginx did not accept connections within {self._readiness_timeout} seconds.",
+                )
+        except BaseException:
+            self._discard()
+            raise
+
+    async def reload(self) -> None:
+        """
+        Gracefully reload nginx, and wait until all requests are served with the new configuration.
+        """
+        await asyncio.to_thread(self._reload)
+
+    def _reload(self) -> None:
+        previous_worker_pids = self._worker_pids()
+        exit_code, output = self._container.exec_run(["nginx", "-s", "reload"])
+        if exit_code != 0:
+            raise ContainerNotReadyError(output.decode("utf-8"))
+        # Old worker processes finish their current requests before they exit.
+        self._wait_until(
+            lambda: not previous_worker_pids & self._worker_pids(),
+            f"nginx did not finish reloading within {self._readiness_timeout} seconds.",
         )
-        self._container.start()
-        self._container.exec_run(["nginx", "-s", "reload"])
+        self._wait_until(
+            self._is_ready,
+            f"nginx did not accept connections within {self._readiness_timeout} seconds.",
+        )
+
+    def _worker_pids(self) -> set[str]:
+        _, output = self._container.exec_run(["pgrep", "-f", "nginx: worker process"])
+        return set(output.decode("utf-8").split())
+
+    @contextmanager
+    def _time(self, phase: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._timings[phase] = time.perf_counter() - start
+
+    def _wait_until(self, condition: Callable[[], bool], failure_message: str) -> None:
+        deadline = time.monotonic() + self._readiness_timeout
+        interval = self._READINESS_INITIAL_INTERVAL
+        while True:
+            if condition():
+                return
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise ContainerNotReadyError(failure_message)
+            time.sleep(min(interval, remaining))
+            interval = min(interval * 2, self._READINESS_MAXIMUM_INTERVAL)
+
+    def _is_ready(self) -> bool:
+        connection = HTTPConnection(self.ip, timeout=self._READINESS_MAXIMUM_INTERVAL)
+        try:
+            # Any response at all, including error responses, means nginx is serving requests.
+            connection.request("HEAD", "/")
+            connection.getresponse()
+        except (HTTPException, OSError):
+            return False
+        finally:
+            connection.close()
+        return True
+
+    @property
+    def image_size(self) -> int:
+        """
+        The size of the container's image, in bytes.
+        """
+        return self._image_size
+
+    @property
+    def timings(self) -> Mapping[str, float]:
+        """
+        The durations of the container's startup phases, in seconds, keyed by phase name.
+
+        The phases are ``build``, ``create``, ``start``, and ``ready``, in that order. The
+        ``ready`` phase ends when nginx responds to its first request.
+        """
+        return self._timings
 
     async def stop(self) -> None:
         """
@@ -61,8 +179,19 @@ class Container:
         await asyncio.to_thread(self._stop)
 
     def _stop(self) -> None:
-        if self._container is not None:
-            self._container.stop()
+        if self.__container is not None:
+            self.__container.stop()
+
+    def _discard(self) -> None:
+        container = self.__container
+        if container is None:
+            return
+        self.__container = None
+        # The container may never have started, or Docker may already be removing it.
+        with suppress(DockerException):
+            container.stop()
+        with suppress(DockerException):
+            container.remove(force=True)
 
     @property
     def _container(self) -> DockerContainer:
@@ -76,14 +205,28 @@ class Container:
                         "bind": "/etc/nginx/conf.d/betty.conf",
                         "mode": "ro",
                     },
-                    self._www_directory_path: {
-                        "bind": "/var/www/betty",
-                        "mode": "ro",
-                    },
+                    **self._www_volumes,
                 },
             )
         return self.__container
 
+    @property
+    def _www_volumes(self) -> Mapping[Path, Mapping[str, str]]:
+        if isinstance(self._www_directory_path, Mapping):
+            return {
+                www_directory_path: {
+                    "bind": f"{WWW_DIRECTORY_PATH}/{name}",
+                    "mode": "ro",
+                }
+                for name, www_directory_path in self._www_directory_path.items()
+            }
+        return {
+            self._www_directory_path: {
+                "bind": WWW_DIRECTORY_PATH,
+                "mode": "ro",
+            },
+        }
+
     @property
     def ip(self) -> str:
         """
@@ -0,0 +1,216 @@
+"""
+Generate AVIF and WebP variants of generated images.
+
+Variants are written next to their original images, with their format's file extension appended, such as
+``portrait.jpg.webp``. That is where nginx looks for them if
+:py:attr:`betty_nginx.config.NginxConfiguration.image_variants` is enabled. Variants that are not smaller than their
+images are discarded, and an empty hidden file such as ``.portrait.jpg.webp.discarded`` records that until the image
+changes.
+"""
+
+import importlib
+import logging
+import os
+from collections.abc import Mapping, Sequence
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing, suppress
+from dataclasses import dataclass, field
+from pathlib import Path
+from tempfile import mkstemp
+from typing import Any
+
+from PIL import Image, ImageOps
+
+IMAGE_FILE_EXTENSIONS = (".jpeg", ".jpg", ".png")
+"""
+The file extensions of the images to generate variants of.
+"""
+
+# The variant file extensions and encoder options, keyed by Pillow format, in the order of preference.
+_VARIANT_FORMATS: Mapping[str, tuple[str, Mapping[str, Any]]] = {
+    "AVIF": (".avif", {"quality": 60}),
+    "WEBP": (".webp", {"quality": 80, "method": 4}),
+}
+
+
+@dataclass
+class ImageVariantReport:
+    """
+    The results of generating image variants.
+    """
+
+    written: list[Path] = field(default_factory=list)
+    unchanged: list[Path] = field(default_factory=list)
+    discarded: list[Path] = field(default_factory=list)
+    failed: dict[Path, str] = field(default_factory=dict)
+    saved_bytes: int = 0
+
+    def extend(self, other: "ImageVariantReport") -> None:
+        """
+        Add another report's results to this one.
+        """
+        self.written.extend(other.written)
+        self.unchanged.extend(other.unchanged)
+        self.discarded.extend(other.discarded)
+        self.failed.update(other.failed)
+        self.saved_bytes += other.saved_bytes
+
+
+def variant_formats() -> Sequence[str]:
+    """
+    Get the Pillow formats of the variants that can be generated, in the order of preference.
+
+    Pillow supports WebP out of the box. AVIF requires the ``pillow-avif-plugin`` package.
+    """
+    with suppress(ImportError):
+        importlib.import_module("pillow_avif")
+    Image.init()
+    return [
+        variant_format
+        for variant_format in _VARIANT_FORMATS
+        if variant_format in Image.SAVE
+    ]
+
+
+def generate_image_variants(
+    www_directory_path: Path, *, max_workers: int | None = None
+) -> ImageVariantReport:
+    """
+    Generate variants of all images in a generated site.
+
+    Images are encoded in parallel processes. Variants that are newer than their images are left alone, and
+    variants that are not smaller than their images are discarded, and not encoded again until their images change.
+    Images that cannot be read are skipped with a warning. This blocks, so run it in a thread from asynchronous code.
+
+    :param max_workers: The maximum number of images to encode concurrently. Defaults to the number of CPUs.
+    """
+    formats = variant_formats()
+    image_file_paths = [
+        Path(directory_path) / file_name
+        for directory_path, _, file_names in os.walk(www_directory_path)
+        for file_name in file_names
+        if Path(file_name).suffix.lower() in IMAGE_FILE_EXTENSIONS
+    ]
+    report = ImageVariantReport()
+    if not formats or not image_file_paths:
+        return report
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        for image_report in executor.map(
+            _generate_variants,
+            image_file_paths,
+            [formats] * len(image_file_paths),
+            chunksize=16,
+        ):
+            report.extend(image_report)
+    for image_file_path, reason in report.failed.items():
+        logging.getLogger(__name__).warning(
+            "Skipped %s, because it could not be read: %s", image_file_path, reason
+        )
+    return report
+
+
+def _generate_variants(
+    image_file_path: Path, formats: Sequence[str]
+) -> ImageVariantReport:
+    report = ImageVariantReport()
+    image_stat = image_file_path.stat()
+    pending_formats = []
+    for variant_format in formats:
+        variant_file_path = _variant_file_path(image_file_path, variant_format)
+        if _is_up_to_date(variant_file_path, image_stat):
+            report.unchanged.append(variant_file_path)
+        elif _is_up_to_date(_discarded_file_path(variant_file_path), image_stat):
+            report.discarded.append(variant_file_path)
+        else:
+            pending_formats.append(variant_format)
+    if not pending_formats:
+        return report
+    # A single unreadable image must not fail the other images.
+    try:
+        image = _load_image(image_file_path)
+    except OSError as error:
+        report.failed[image_file_path] = str(error)
+        return report
+    with closing(image):
+        icc_profile = image.info.get("icc_profile")
+        # Variants carry no EXIF metadata, so apply the image's orientation to its pixels.
+        ImageOps.exif_transpose(image, in_place=True)
+        variant_image: Image.Image = image
+        if variant_image.mode not in ("RGB", "RGBA"):
+            variant_image = variant_image.convert(
+                "RGBA" if variant_image.has_transparency_data else "RGB"
+            )
+        for variant_format in pending_formats:
+            variant_file_path = _variant_file_path(image_file_path, variant_format)
+            variant_size = _save_variant(
+                variant_image,
+                variant_file_path,
+                variant_format,
+                icc_profile,
+                image_stat.st_size,
+            )
+            discarded_file_path = _discarded_file_path(variant_file_path)
+            if variant_size is None:
+                discarded_file_path.touch()
+                report.discarded.append(variant_file_path)
+            else:
+                discarded_file_path.unlink(missing_ok=True)
+                report.written.append(variant_file_path)
+                report.saved_bytes += image_stat.st_size - variant_size
+    return report
+
+
+def _load_image(image_file_path: Path) -> Image.Image:
+    image = Image.open(image_file_path)
+    try:
+        # Decode the image now, so that truncated or corrupt images fail here rather than once a variant is encoded.
+        image.load()
+    except BaseException:
+        image.close()
+        raise
+    return image
+
+
+def _is_up_to_date(file_path: Path, image_stat: os.stat_result) -> bool:
+    try:
+        return file_path.stat().st_mtime >= image_stat.st_mtime
+    except FileNotFoundError:
+        return False
+
+
+def _variant_file_path(image_file_path: Path, variant_format: str) -> Path:
+    file_extension, _ = _VARIANT_FORMATS[variant_format]
+    return image_file_path.with_name(image_file_path.name + file_extension)
+
+
+def _discarded_file_path(variant_file_path: Path) -> Path:
+    return variant_file_path.with_name(f".{variant_file_path.name}.discarded")
+
+
+def _save_variant(
+    image: Image.Image,
+    variant_file_path: Path,
+    variant_format: str,
+    icc_profile: bytes | None,
+    image_size: int,
+) -> int | None:
+    _, options = _VARIANT_FORMATS[variant_format]
+    if icc_profile:
+        options = {**options, "icc_profile": icc_profile}
+    # Encode to a temporary file, so that nginx never serves a partially written variant.
+    file_descriptor, temporary_file_path_str = mkstemp(
+        dir=variant_file_path.parent, prefix=f".{variant_file_path.name}."
+    )
+    os.close(file_descriptor)
+    temporary_file_path = Path(temporary_file_path_str)
+    try:
+        image.save(temporary_file_path, format=variant_format, **options)
+        variant_size = temporary_file_path.stat().st_size
+        if variant_size >= image_size:
+            variant_file_path.unlink(missing_ok=True)
+            return None
+        temporary_file_path.chmod(0o644)
+        temporary_file_path.replace(variant_file_path)
+        return variant_size
+    finally:
+        temporary_file_path.unlink(missing_ok=True)
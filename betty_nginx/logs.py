@@ -0,0 +1,210 @@
+"""
+Analyze nginx's structured JSON access logs.
+
+Logs are streamed line by line, and all statistics are kept in fixed-size sketches, so that even multi-gigabyte
+logs are analyzed in constant memory.
+"""
+
+import gzip
+import heapq
+import json
+import math
+from collections import Counter
+from collections.abc import Iterable, Iterator, Mapping, Sequence
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Generic, TypeVar
+
+_T = TypeVar("_T")
+
+_GZIP_MAGIC_NUMBER = b"\x1f\x8b"
+
+# Keep many more candidates than are reported, so that the reported top entries are (nearly) exact.
+_TOP_COUNTER_CAPACITY_FACTOR = 100
+
+_PERCENTILES = (50, 90, 95, 99)
+
+
+class LatencyHistogram:
+    """
+    A logarithmically bucketed histogram of request times.
+
+    Percentiles are estimated within the given relative accuracy, regardless of how many values are added.
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01):
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self._buckets: Counter[int] = Counter()
+        self._zero_count = 0
+        self._count = 0
+        self._maximum = 0.0
+
+    def add(self, value: float) -> None:
+        """
+        Add a value, in seconds.
+        """
+        self._count += 1
+        self._maximum = max(self._maximum, value)
+        if value <= 0:
+            self._zero_count += 1
+        else:
+            self._buckets[math.ceil(math.log(value) / self._log_gamma)] += 1
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def maximum(self) -> float:
+        """
+        The largest value added so far.
+        """
+        return self._maximum
+
+    def percentile(self, percentile: float) -> float:
+        """
+        Estimate the value at the given percentile.
+
+        :param percentile: A percentile from 0 up to and including 100.
+        """
+        if not self._count:
+            return 0.0
+        if percentile >= 100:
+            return self._maximum
+        rank = percentile / 100 * (self._count - 1)
+        seen = self._zero_count
+        if rank < seen:
+            return 0.0
+        for index in sorted(self._buckets):
+            seen += self._buckets[index]
+            if rank < seen:
+                return min(2 * self._gamma**index / (self._gamma + 1), self._maximum)
+        return self._maximum
+
+
+class TopCounter(Generic[_T]):
+    """
+    Track the heaviest keys of a stream using the Space-Saving algorithm.
+
+    At most ``capacity`` keys are tracked. When a new key arrives and the counter is full, it replaces the lightest
+    tracked key and inherits its weight, so the weights of frequent keys are never underestimated.
+    """
+
+    def __init__(self, capacity: int):
+        self._capacity = capacity
+        self._weights: dict[_T, float] = {}
+        # A min-heap of (weight, insertion order, key). Weights in it may be stale, but never too large.
+        self._heap: list[tuple[float, int, _T]] = []
+        self._insertions = 0
+
+    def add(self, key: _T, weight: float = 1) -> None:
+        """
+        Add weight to a key.
+        """
+        if key in self._weights:
+            self._weights[key] += weight
+            return
+        if len(self._weights) < self._capacity:
+            self._weights[key] = weight
+            self._push(key, weight)
+            return
+        lightest_weight, lightest_key = self._pop_lightest()
+        del self._weights[lightest_key]
+        self._weights[key] = lightest_weight + weight
+        self._push(key, lightest_weight + weight)
+
+    def _push(self, key: _T, weight: float) -> None:
+        self._insertions += 1
+        heapq.heappush(self._heap, (weight, self._insertions, key))
+
+    def _pop_lightest(self) -> tuple[float, _T]:
+        while True:
+            weight, _, key = heapq.heappop(self._heap)
+            actual_weight = self._weights[key]
+            if weight == actual_weight:
+                return weight, key
+            self._push(key, actual_weight)
+
+    def most_common(self, n: int) -> Sequence[tuple[_T, float]]:
+        """
+        Get the ``n`` heaviest keys, and their weights.
+        """
+        return heapq.nlargest(n, self._weights.items(), key=lambda item: item[1])
+
+
+@dataclass(frozen=True)
+class AccessLogReport:
+    """
+    The results of analyzing access logs.
+    """
+
+    requests: int
+    malformed_lines: int
+    latency_percentiles: Mapping[int, float]
+    latency_maximum: float
+    statuses: Mapping[int, int]
+    media_types: Mapping[str, int]
+    locales: Mapping[str, int]
+    top_urls: Sequence[tuple[str, int]]
+    slowest_urls: Sequence[tuple[str, float]]
+
+
+def analyze_access_logs(
+    file_paths: Iterable[Path], *, top: int = 10
+) -> AccessLogReport:
+    """
+    Analyze structured JSON access logs, as written by nginx for :py:attr:`betty_nginx.config.NginxConfiguration.access_log_file_path`.
+
+    Logs may be gzipped. This blocks, so run it in a thread from asynchronous code.
+
+    :param top: The number of URLs to report for each URL ranking.
+    """
+    latencies = LatencyHistogram()
+    statuses: Counter[int] = Counter()
+    media_types: Counter[str] = Counter()
+    locales: Counter[str] = Counter()
+    url_requests = TopCounter[str](top * _TOP_COUNTER_CAPACITY_FACTOR)
+    url_request_times = TopCounter[str](top * _TOP_COUNTER_CAPACITY_FACTOR)
+    malformed_lines = 0
+    for line in _read_lines(file_paths):
+        if not line.strip():
+            continue
+        try:
+            entry = json.loads(line)
+            uri = str(entry["uri"])
+            status = int(entry["status"])
+            request_time = float(entry["request_time"])
+        except (ValueError, TypeError, KeyError):
+            malformed_lines += 1
+            continue
+        latencies.add(request_time)
+        statuses[status] += 1
+        media_types[entry.get("media_type_extension") or "-"] += 1
+        locales[entry.get("locale") or "-"] += 1
+        url_requests.add(uri)
+        url_request_times.add(uri, request_time)
+    return AccessLogReport(
+        requests=len(latencies),
+        malformed_lines=malformed_lines,
+        latency_percentiles={
+            percentile: latencies.percentile(percentile) for percentile in _PERCENTILES
+        },
+        latency_maximum=latencies.maximum,
+        statuses=dict(sorted(statuses.items())),
+        media_types=dict(media_types.most_common()),
+        locales=dict(locales.most_common()),
+        top_urls=[
+            (url, int(requests)) for url, requests in url_requests.most_common(top)
+        ],
+        slowest_urls=url_request_times.most_common(top),
+    )
+
+
+def _read_lines(file_paths: Iterable[Path]) -> Iterator[bytes]:
+    for file_path in file_paths:
+        with open(file_path, "rb") as f:
+            if f.peek(len(_GZIP_MAGIC_NUMBER)).startswith(_GZIP_MAGIC_NUMBER):
+                with gzip.open(f) as gzip_f:
+                    yield from gzip_f
+            else:
+                yield from f
@@ -0,0 +1,164 @@
+"""
+Describe generated sites in manifests, and compare them to find out which URLs changed.
+
+This allows deployments to purge CDN caches for and upload only the files that changed between two builds.
+"""
+
+import hashlib
+import json
+import mimetypes
+import os
+from collections.abc import Mapping, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, asdict
+from pathlib import Path, PurePosixPath
+
+MANIFEST_FILE_NAME = "manifest.json"
+"""
+The name of the manifest file, which is generated next to the nginx configuration.
+"""
+
+_DEFAULT_MEDIA_TYPE = "application/octet-stream"
+
+
+@dataclass(frozen=True)
+class ManifestEntry:
+    """
+    Describe a single generated file.
+    """
+
+    size: int
+    hash: str
+    media_type: str
+    locale: str | None
+
+
+Manifest = Mapping[str, ManifestEntry]
+"""
+Manifest entries, keyed by the files' POSIX paths relative to the web root.
+"""
+
+
+@dataclass(frozen=True)
+class ManifestDiff:
+    """
+    The file paths that differ between two manifests.
+    """
+
+    added: Sequence[str]
+    changed: Sequence[str]
+    removed: Sequence[str]
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.changed or self.removed)
+
+
+def build_manifest(
+    www_directory_path: Path,
+    *,
+    locale_aliases: Mapping[str, str] | None = None,
+    max_workers: int | None = None,
+) -> Manifest:
+    """
+    Build the manifest for a generated site.
+
+    Files are hashed in parallel. This blocks, so run it in a thread from asynchronous code.
+
+    :param locale_aliases: The locales of multilingual sites, keyed by their aliases, which are the names of the
+        localized directories in the web root.
+    :param max_workers: The maximum number of files to hash concurrently. Defaults to the number of CPUs.
+    """
+    if locale_aliases is None:
+        locale_aliases = {}
+    file_paths = [
+        PurePosixPath(Path(directory_path).relative_to(www_directory_path).as_posix())
+        / file_name
+        for directory_path, _, file_names in os.walk(www_directory_path)
+        for file_name in file_names
+    ]
+    file_paths.sort()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        entries = executor.map(
+            lambda file_path: _build_manifest_entry(
+                www_directory_path, file_path, locale_aliases
+            ),
+            file_paths,
+        )
+        return {
+            str(file_path): entry
+            for file_path, entry in zip(file_paths, entries, strict=True)
+        }
+
+
+def _build_manifest_entry(
+    www_directory_path: Path,
+    file_path: PurePosixPath,
+    locale_aliases: Mapping[str, str],
+) -> ManifestEntry:
+    with open(www_directory_path / file_path, "rb") as f:
+        # This releases the GIL while hashing, so that files are hashed in parallel.
+        digest = hashlib.file_digest(f, "sha256").hexdigest()
+        size = f.tell()
+    media_type, _ = mimetypes.guess_type(file_path.name)
+    return ManifestEntry(
+        size=size,
+        hash=digest,
+        media_type=media_type or _DEFAULT_MEDIA_TYPE,
+        locale=locale_aliases.get(file_path.parts[0])
+        if len(file_path.parts) > 1
+        else None,
+    )
+
+
+def write_manifest(manifest: Manifest, manifest_file_path: Path) -> None:
+    """
+    Write a manifest to a JSON file.
+    """
+    manifest_file_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(manifest_file_path, "w") as f:
+        json.dump(
+            {file_path: asdict(entry) for file_path, entry in manifest.items()},
+            f,
+            separators=(",", ":"),
+        )
+
+
+def read_manifest(manifest_file_path: Path) -> Manifest:
+    """
+    Read a manifest from a JSON file.
+    """
+    with open(manifest_file_path) as f:
+        return {
+            file_path: ManifestEntry(**entry)
+            for file_path, entry in json.load(f).items()
+        }
+
+
+def diff_manifests(previous: Manifest, current: Manifest) -> ManifestDiff:
+    """
+    Compare two manifests.
+    """
+    return ManifestDiff(
+        added=sorted(current.keys() - previous.keys()),
+        changed=sorted(
+            file_path
+            for file_path in current.keys() & previous.keys()
+            if current[file_path].hash != previous[file_path].hash
+        ),
+        removed=sorted(previous.keys() - current.keys()),
+    )
+
+
+def file_urls(file_path: str) -> Sequence[str]:
+    """
+    Get the URL paths a file is served at.
+
+    Index files are also served at their directory's URL path, through which nginx negotiates between the
+    different media types of clean URLs.
+    """
+    urls = [f"/{file_path}"]
+    path = PurePosixPath(file_path)
+    if path.stem == "index":
+        directory_path = str(path.parent)
+        urls.append("/" if directory_path == "." else f"/{directory_path}/")
+    return urls
@@ -0,0 +1,202 @@
+"""
+Switch the site nginx serves between versioned releases.
+
+Each release is a complete copy of a generated site in its own directory. nginx serves the release that the
+``current`` symlink points to, and because that symlink is replaced atomically, requests are always served from
+exactly one complete release.
+"""
+
+import asyncio
+import os
+import shutil
+from collections.abc import Callable, Sequence
+from datetime import datetime, UTC
+from pathlib import Path
+
+CURRENT_RELEASE_NAME = "current"
+"""
+The name of the symlink to the release that nginx serves.
+"""
+
+_RELEASE_NAME_FORMAT = "%Y%m%dT%H%M%S%fZ"
+
+
+class ReleaseError(RuntimeError):
+    """
+    Raised when releases cannot be switched.
+    """
+
+    pass  # pragma: no cover
+
+
+def current_release_directory_path(releases_directory_path: Path) -> Path:
+    """
+    Get the path to the symlink to the release that nginx serves.
+    """
+    return releases_directory_path / CURRENT_RELEASE_NAME
+
+
+def list_releases(releases_directory_path: Path) -> Sequence[Path]:
+    """
+    List all releases, from oldest to newest.
+    """
+    if not releases_directory_path.is_dir():
+        return []
+    return sorted(
+        path
+        for path in releases_directory_path.iterdir()
+        if path.is_dir() and not path.is_symlink() and not path.name.startswith(".")
+    )
+
+
+def get_current_release(releases_directory_path: Path) -> Path | None:
+    """
+    Get the release that nginx serves, if there is one.
+    """
+    current_path = current_release_directory_path(releases_directory_path)
+    if not current_path.is_symlink():
+        return None
+    return releases_directory_path / os.readlink(current_path)
+
+
+async def create_release(
+    www_directory_path: Path, releases_directory_path: Path
+) -> Path:
+    """
+    Copy a generated site into a new release.
+
+    The release is copied into a hidden directory first, so that an interrupted copy never shows up as a release.
+    Hardlinks between files, such as those made by :py:func:`betty_nginx.dedupe.deduplicate_files`, are preserved.
+
+    :return: The new release's directory path.
+    """
+    return await asyncio.to_thread(
+        _create_release, www_directory_path, releases_directory_path
+    )
+
+
+def _create_release(www_directory_path: Path, releases_directory_path: Path) -> Path:
+    releases_directory_path.mkdir(parents=True, exist_ok=True)
+    release_name = datetime.now(UTC).strftime(_RELEASE_NAME_FORMAT)
+    release_path = releases_directory_path / release_name
+    if release_path.exists():
+        raise ReleaseError(f'Release "{release_name}" already exists.')
+    staging_path = releases_directory_path / f".{release_name}"
+    try:
+        shutil.copytree(
+            www_directory_path,
+            staging_path,
+            symlinks=True,
+            copy_function=_copy_preserving_hardlinks(),
+        )
+        staging_path.rename(release_path)
+    finally:
+        shutil.rmtree(staging_path, ignore_errors=True)
+    return release_path
+
+
+def _copy_preserving_hardlinks() -> Callable[[str, str], object]:
+    destination_file_paths: dict[tuple[int, int], str] = {}
+
+    def _copy(source_file_path: str, destination_file_path: str) -> object:
+        source_stat = Path(source_file_path).stat()
+        if source_stat.st_nlink > 1:
+            inode = (source_stat.st_dev, source_stat.st_ino)
+            if inode in destination_file_paths:
+                Path(destination_file_path).hardlink_to(destination_file_paths[inode])
+                return destination_file_path
+            destination_file_paths[inode] = destination_file_path
+        return shutil.copy2(source_file_path, destination_file_path)
+
+    return _copy
+
+
+async def switch_release(release_path: Path) -> None:
+    """
+    Point the ``current`` symlink at the given release.
+
+    A new symlink is created next to it first, and then moved over it, so the switch is atomic.
+    """
+    await asyncio.to_thread(_switch_release, release_path)
+
+
+def _switch_release(release_path: Path) -> None:
+    if not release_path.is_dir():
+        raise ReleaseError(f'Release "{release_path}" does not exist.')
+    releases_directory_path = release_path.parent
+    current_path = current_release_directory_path(releases_directory_path)
+    temporary_current_path = (
+        releases_directory_path / f".{CURRENT_RELEASE_NAME}-{os.getpid()}"
+    )
+    temporary_current_path.unlink(missing_ok=True)
+    # Use a relative target, so the releases directory can be mounted elsewhere, such as in a container.
+    temporary_current_path.symlink_to(release_path.name, target_is_directory=True)
+    try:
+        temporary_current_path.replace(current_path)
+    except BaseException:
+        temporary_current_path.unlink(missing_ok=True)
+        raise
+
+
+async def rollback_release(releases_directory_path: Path) -> Path:
+    """
+    Switch back to the release before the current one.
+
+    :return: The directory path of the release that was switched to.
+    """
+    current_release = get_current_release(releases_directory_path)
+    previous_releases = [
+        release
+        for release in list_releases(releases_directory_path)
+        if current_release is None or release.name < current_release.name
+    ]
+    if not previous_releases:
+        raise ReleaseError("There is no previous release to roll back to.")
+    await switch_release(previous_releases[-1])
+    return previous_releases[-1]
+
+
+async def prune_releases(releases_directory_path: Path, kept: int) -> Sequence[Path]:
+    """
+    Remove old releases.
+
+    The current release and the releases after it are always kept, as are up to ``kept`` releases before it.
+
+    :return: The directory paths of the removed releases.
+    """
+    return await asyncio.to_thread(_prune_releases, releases_directory_path, kept)
+
+
+def _prune_releases(releases_directory_path: Path, kept: int) -> Sequence[Path]:
+    current_release = get_current_release(releases_directory_path)
+    if current_release is None:
+        return []
+    previous_releases = [
+        release
+        for release in list_releases(releases_directory_path)
+        if release.name < current_release.name
+    ]
+    pruned_releases = previous_releases[: max(len(previous_releases) - kept, 0)]
+    for release in pruned_releases:
+        shutil.rmtree(release)
+    return pruned_releases
+
+
+async def reload_nginx(command: Sequence[str]) -> None:
+    """
+    Gracefully reload nginx.
+
+    Workers finish the requests they are serving, and new workers serve new requests from the new release.
+
+    :param command: The command to reload nginx with, such as ``nginx -s reload``.
+    """
+    process = await asyncio.create_subprocess_exec(
+        *command,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.STDOUT,
+    )
+    output, _ = await process.communicate()
+    if process.returncode != 0:
+        raise ReleaseError(
+            f"Reloading nginx failed with exit code {process.returncode}: {output.decode('utf-8', 'replace')}"
+        )
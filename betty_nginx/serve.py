@@ -3,10 +3,14 @@ Integrate the nginx extension with Betty's Serve API.
 """
 
 import logging
+import time
+from collections.abc import Mapping, Sequence
 from contextlib import AsyncExitStack
 from pathlib import Path
 from typing import final, Self
+from urllib.parse import urlparse
 
+import aiofiles
 import docker
 from aiofiles.os import makedirs
 from aiofiles.tempfile import TemporaryDirectory
@@ -17,82 +21,82 @@ from betty.serve import NoPublicUrlBecauseServerNotStartedError, Server
 from docker.errors import DockerException
 from typing_extensions import override
 
-from betty_nginx import Nginx
-from betty_nginx.artifact import generate_dockerfile_file, generate_configuration_file
-from betty_nginx.config import NginxConfiguration
-from betty_nginx.docker import Container
+from betty_nginx.artifact import (
+    generate_configuration_file,
+    generate_dockerfile_file,
+    generate_multi_site_configuration_file,
+    requires_lua,
+)
+from betty_nginx.docker import Container, WWW_DIRECTORY_PATH
 
 
-@final
-class DockerizedNginxServer(ProjectDependentFactory, Server):
-    """
-    An nginx server that runs within a Docker container.
-    """
-
-    def __init__(self, localizer: Localizer, project: Project) -> None:
+class _DockerizedNginxServerBase(Server):
+    def __init__(self, localizer: Localizer) -> None:
         super().__init__(localizer)
-        self._project = project
         self._exit_stack = AsyncExitStack()
         self._container: Container | None = None
+        self._timings: dict[str, float] = {}
+        self._lua = False
 
-    @override
-    @classmethod
-    async def new_for_project(cls, project: Project) -> Self:
-        return cls(await project.app.localizer, project)
-
-    @override
-    async def start(self) -> None:
-        logging.getLogger(__name__).info("Starting a Dockerized nginx web server...")
-
-        await makedirs(self._project.configuration.www_directory_path, exist_ok=True)
-
+    async def _new_output_directory(self) -> Path:
         output_directory_path_str: str = await self._exit_stack.enter_async_context(
             TemporaryDirectory()  # type: ignore[arg-type]
         )
-
-        isolated_project: Project = await self._exit_stack.enter_async_context(
-            Project.new_temporary(self._project.app, ancestry=self._project.ancestry)
-        )
-        isolated_project.configuration.configuration_file_path = (
-            self._project.configuration.configuration_file_path
-        )
-        isolated_project.configuration.load(self._project.configuration.dump())
-        isolated_project.configuration.debug = True
-
-        # Work around https://github.com/bartfeenstra/betty/issues/1056.
-        nginx_configuration = isolated_project.configuration.extensions[
-            Nginx
-        ].extension_configuration
-        assert isinstance(nginx_configuration, NginxConfiguration)
-        nginx_configuration.https = False
-
-        await self._exit_stack.enter_async_context(isolated_project)
-
-        nginx_configuration_file_path = Path(output_directory_path_str) / "nginx.conf"
-        docker_directory_path = Path(output_directory_path_str)
-        dockerfile_file_path = docker_directory_path / "Dockerfile"
-
-        await generate_configuration_file(
-            isolated_project,
-            destination_file_path=nginx_configuration_file_path,
-            https=False,
-            www_directory_path="/var/www/betty",
-        )
+        return Path(output_directory_path_str)
+
+    async def _generate_dockerfile_file(
+        self, project: Project, output_directory_path: Path
+    ) -> None:
+        async with aiofiles.open(
+            output_directory_path / "nginx.conf", encoding="utf-8"
+        ) as f:
+            self._lua = requires_lua(await f.read())
         await generate_dockerfile_file(
-            isolated_project,
-            destination_file_path=dockerfile_file_path,
+            project,
+            destination_file_path=output_directory_path / "Dockerfile",
+            production=False,
+            lua=self._lua,
         )
+
+    async def _start_container(
+        self,
+        start: float,
+        www_directory_path: Path | Mapping[str, Path],
+        docker_directory_path: Path,
+        nginx_configuration_file_path: Path,
+    ) -> None:
+        self._timings["configure"] = time.perf_counter() - start
         self._container = Container(
-            isolated_project.configuration.www_directory_path,
+            www_directory_path,
             docker_directory_path,
             nginx_configuration_file_path,
         )
         await self._exit_stack.enter_async_context(self._container)
+        self._timings.update(self._container.timings)
+        logging.getLogger(__name__).info(
+            "Started a Dockerized %s web server from a %.1f MB image in %.3f seconds (%s).",
+            "OpenResty" if self._lua else "nginx",
+            self._container.image_size / 1_000_000,
+            time.perf_counter() - start,
+            ", ".join(
+                f"{phase}: {duration:.3f}s" for phase, duration in self._timings.items()
+            ),
+        )
 
     @override
     async def stop(self) -> None:
         await self._exit_stack.aclose()
 
+    @property
+    def timings(self) -> Mapping[str, float]:
+        """
+        The durations of the server's startup phases, in seconds, keyed by phase name.
+
+        The ``configure`` phase covers generating the nginx and Docker artifacts. The remaining
+        phases are those of :py:attr:`betty_nginx.docker.Container.timings`.
+        """
+        return self._timings
+
     @override
     @property
     def public_url(self) -> str:
@@ -111,3 +115,107 @@ class DockerizedNginxServer(ProjectDependentFactory, Server):
         except DockerException as e:
             logging.getLogger(__name__).warning(e)
             return False
+
+
+@final
+class DockerizedNginxServer(ProjectDependentFactory, _DockerizedNginxServerBase):
+    """
+    An nginx server that runs within a Docker container.
+    """
+
+    def __init__(self, localizer: Localizer, project: Project) -> None:
+        super().__init__(localizer)
+        self._project = project
+
+    @override
+    @classmethod
+    async def new_for_project(cls, project: Project) -> Self:
+        return cls(await project.app.localizer, project)
+
+    @override
+    async def start(self) -> None:
+        logging.getLogger(__name__).info("Starting a Dockerized nginx web server...")
+        start = time.perf_counter()
+
+        output_directory_path = await self._new_output_directory()
+        await makedirs(self._project.configuration.www_directory_path, exist_ok=True)
+
+        # Render the configuration straight from the project, overriding what differs when serving it locally.
+        nginx_configuration_file_path = output_directory_path / "nginx.conf"
+        await generate_configuration_file(
+            self._project,
+            destination_file_path=nginx_configuration_file_path,
+            https=False,
+            debug=True,
+            www_directory_path=WWW_DIRECTORY_PATH,
+        )
+        await self._generate_dockerfile_file(self._project, output_directory_path)
+        await self._start_container(
+            start,
+            self._project.configuration.www_directory_path,
+            output_directory_path,
+            nginx_configuration_file_path,
+        )
+
+
+@final
+class DockerizedNginxMultiSiteServer(_DockerizedNginxServerBase):
+    """
+    An nginx server that serves multiple projects from a single Docker container.
+
+    Requests are routed to projects by their ``Host`` header, which must be the host of the project's URL.
+    """
+
+    def __init__(self, localizer: Localizer, projects: Sequence[Project]) -> None:
+        super().__init__(localizer)
+        self._projects = projects
+
+    @classmethod
+    async def new_for_projects(cls, projects: Sequence[Project]) -> Self:
+        """
+        Create a new instance for the given projects.
+        """
+        return cls(await projects[0].app.localizer, projects)
+
+    @override
+    async def start(self) -> None:
+        logging.getLogger(__name__).info(
+            "Starting a Dockerized nginx web server for %d sites...",
+            len(self._projects),
+        )
+        start = time.perf_counter()
+
+        output_directory_path = await self._new_output_directory()
+        for project in self._projects:
+            await makedirs(project.configuration.www_directory_path, exist_ok=True)
+
+        nginx_configuration_file_path = output_directory_path / "nginx.conf"
+        await generate_multi_site_configuration_file(
+            self._projects,
+            nginx_configuration_file_path,
+            www_directory_paths=[
+                f"{WWW_DIRECTORY_PATH}/{index}" for index in range(len(self._projects))
+            ],
+            https=False,
+            debug=True,
+        )
+        await self._generate_dockerfile_file(self._projects[0], output_directory_path)
+        await self._start_container(
+            start,
+            {
+                str(index): project.configuration.www_directory_path
+                for index, project in enumerate(self._projects)
+            },
+            output_directory_path,
+            nginx_configuration_file_path,
+        )
+
+    @property
+    def hosts(self) -> Sequence[str]:
+        """
+        The ``Host`` header values to route requests to each of the projects, in the same order as the projects.
+        """
+        return [
+            urlparse(project.configuration.base_url).netloc
+            for project in self._projects
+        ]
@@ -2,4 +2,181 @@
 Pytest configuration.
 """
 
+import asyncio
+import hashlib
+import os
+import shutil
+from collections.abc import AsyncIterator, Iterator
+from contextlib import asynccontextmanager
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import pytest
+from betty.project import Project
 from betty.test_utils.conftest import *  # noqa F403
+from filelock import AsyncFileLock
+
+from betty_nginx.artifact import generate_configuration_file, generate_dockerfile_file
+from betty_nginx.docker import Container
+
+
+class NginxContainerLease:
+    """
+    A pooled nginx container, leased to a single test.
+    """
+
+    def __init__(self, container: Container):
+        self._container = container
+
+    @property
+    def public_url(self) -> str:
+        """
+        The container's public URL.
+        """
+        return f"http://{self._container.ip}"
+
+
+class _NginxContainerSlot:
+    def __init__(
+        self, directory_path: Path, docker_directory_path: Path, image_key: str
+    ):
+        self.image_key = image_key
+        self.www_directory_path = directory_path / "www"
+        self.nginx_configuration_file_path = directory_path / "nginx.conf"
+        self.www_directory_path.mkdir(parents=True)
+        self.nginx_configuration_file_path.touch()
+        self.container = Container(
+            self.www_directory_path,
+            docker_directory_path,
+            self.nginx_configuration_file_path,
+        )
+        self.started = False
+
+
+class NginxContainerPool:
+    """
+    Keep warm nginx containers around for the entire test session.
+
+    Each lease swaps a project's nginx configuration and web root into an idle container and
+    gracefully reloads nginx, which is much cheaper than building and starting a new container.
+    """
+
+    def __init__(self, directory_path: Path, image_lock_file_path: Path, size: int):
+        self._directory_path = directory_path
+        self._image_lock = AsyncFileLock(image_lock_file_path)
+        self._size = size
+        self._idle_slots: dict[str, list[_NginxContainerSlot]] = {}
+        self._slots: list[_NginxContainerSlot] = []
+
+    @asynccontextmanager
+    async def lease(self, project: Project) -> AsyncIterator[NginxContainerLease]:
+        """
+        Lease a container that serves the given project's generated site.
+        """
+        with TemporaryDirectory(
+            dir=self._directory_path
+        ) as artifacts_directory_path_str:
+            artifacts_directory_path = Path(artifacts_directory_path_str)
+            slot = await self._acquire(project, artifacts_directory_path)
+        ready = False
+        try:
+            self._clear_directory(slot.www_directory_path)
+            shutil.copytree(
+                project.configuration.www_directory_path,
+                slot.www_directory_path,
+                dirs_exist_ok=True,
+            )
+            if slot.started:
+                await slot.container.reload()
+            else:
+                async with self._image_lock:
+                    await slot.container.start()
+                slot.started = True
+            ready = True
+            yield NginxContainerLease(slot.container)
+        finally:
+            await self._release(slot, ready)
+
+    async def _acquire(
+        self, project: Project, artifacts_directory_path: Path
+    ) -> _NginxContainerSlot:
+        await generate_dockerfile_file(
+            project,
+            destination_file_path=artifacts_directory_path / "Dockerfile",
+            production=False,
+        )
+        await generate_configuration_file(
+            project,
+            destination_file_path=artifacts_directory_path / "nginx.conf",
+            https=False,
+            www_directory_path="/var/www/betty",
+        )
+        nginx_configuration = (artifacts_directory_path / "nginx.conf").read_bytes()
+        (artifacts_directory_path / "nginx.conf").unlink()
+        image_key = self._image_key(artifacts_directory_path)
+        idle_slots = self._idle_slots.setdefault(image_key, [])
+        if idle_slots:
+            slot = idle_slots.pop()
+        else:
+            slot_directory_path = self._directory_path / "slots" / str(len(self._slots))
+            docker_directory_path = slot_directory_path / "docker"
+            shutil.copytree(artifacts_directory_path, docker_directory_path)
+            slot = _NginxContainerSlot(
+                slot_directory_path, docker_directory_path, image_key
+            )
+            self._slots.append(slot)
+        # Write the configuration in place, because the container bind-mounts this very file.
+        slot.nginx_configuration_file_path.write_bytes(nginx_configuration)
+        return slot
+
+    def _clear_directory(self, directory_path: Path) -> None:
+        # Keep the directory itself, because the container bind-mounts it.
+        for path in directory_path.iterdir():
+            if path.is_dir() and not path.is_symlink():
+                shutil.rmtree(path)
+            else:
+                path.unlink()
+
+    async def _release(self, slot: _NginxContainerSlot, reusable: bool) -> None:
+        idle_slots = self._idle_slots[slot.image_key]
+        if reusable and len(idle_slots) < self._size:
+            idle_slots.append(slot)
+        else:
+            await self._stop(slot)
+
+    def _image_key(self, artifacts_directory_path: Path) -> str:
+        image_hash = hashlib.sha256()
+        for file_path in sorted(artifacts_directory_path.iterdir()):
+            image_hash.update(file_path.name.encode("utf-8"))
+            image_hash.update(file_path.read_bytes())
+        return image_hash.hexdigest()
+
+    async def _stop(self, slot: _NginxContainerSlot) -> None:
+        if slot.started:
+            slot.started = False
+            await slot.container.stop()
+
+    async def close(self) -> None:
+        """
+        Stop all containers in the pool.
+        """
+        await asyncio.gather(*(self._stop(slot) for slot in self._slots))
+
+
+@pytest.fixture(scope="session")
+def nginx_container_pool(
+    tmp_path_factory: pytest.TempPathFactory,
+) -> Iterator[NginxContainerPool]:
+    """
+    Provide a session-wide pool of warm nginx containers.
+
+    Under pytest-xdist every worker has its own pool, and workers take turns building the image.
+    """
+    pool = NginxContainerPool(
+        tmp_path_factory.mktemp("nginx-container-pool"),
+        # With pytest-xdist, this is the temporary directory shared by all workers.
+        tmp_path_factory.getbasetemp().parent / "betty-nginx-image.lock",
+        int(os.environ.get("BETTY_NGINX_TEST_CONTAINER_POOL_SIZE", 2)),
+    )
+    yield pool
+    asyncio.run(pool.close())
@@ -1,4 +1,7 @@
+import json
+
 from betty.app import App
+from betty.event_dispatcher import EventHandlerRegistry
 from betty.project import Project
 from betty.project.config import ExtensionConfiguration
 from betty.project.generate import generate
@@ -6,6 +9,8 @@ from betty.test_utils.project.extension import ExtensionTestBase
 from typing_extensions import override
 
 from betty_nginx import Nginx
+from betty_nginx.artifact import PostGenerateArtifactsEvent
+from betty_nginx.config import NginxConfiguration
 
 
 class TestNginx(ExtensionTestBase[Nginx]):
@@ -30,3 +35,52 @@ class TestNginx(ExtensionTestBase[Nginx]):
                 assert (
                     project.configuration.output_directory_path / "nginx" / "Dockerfile"
                 ).exists()
+
+    async def test_generate_should_dispatch_post_generate_artifacts_event(
+        self, new_temporary_app: App
+    ):
+        events = []
+
+        async def _handler(event: PostGenerateArtifactsEvent) -> None:
+            events.append(event)
+
+        async with Project.new_temporary(new_temporary_app) as project:
+            project.configuration.url = "http://example.com"
+            project.configuration.extensions.append(ExtensionConfiguration(Nginx))
+            async with project:
+                registry = EventHandlerRegistry()
+                registry.add_handler(PostGenerateArtifactsEvent, _handler)
+                project.event_dispatcher.add_registry(registry)
+                await generate(project)
+        (event,) = events
+        assert (
+            project.configuration.output_directory_path / "nginx" / "nginx.conf"
+            in event.report.written
+        )
+        assert event.report.spans
+        assert not (
+            project.configuration.output_directory_path
+            / "nginx"
+            / "generation-profile.json"
+        ).exists()
+
+    async def test_generate_with_generation_profile(self, new_temporary_app: App):
+        async with Project.new_temporary(new_temporary_app) as project:
+            project.configuration.url = "http://example.com"
+            project.configuration.extensions.append(
+                ExtensionConfiguration(
+                    Nginx,
+                    extension_configuration=NginxConfiguration(generation_profile=True),
+                )
+            )
+            async with project:
+                await generate(project)
+                profile = json.loads(
+                    (
+                        project.configuration.output_directory_path
+                        / "nginx"
+                        / "generation-profile.json"
+                    ).read_text()
+                )
+        assert {"load_template", "render", "write", "copy"} <= profile["steps"].keys()
+        assert profile["spans"][0]["start"] == 0.0
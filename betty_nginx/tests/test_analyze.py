@@ -0,0 +1,461 @@
+import pytest
+from betty.app import App
+from betty.project import Project
+from betty.project.config import ExtensionConfiguration
+
+from betty_nginx import Nginx
+from betty_nginx.analyze import (
+    analyze_configuration,
+    ConfigurationParseError,
+    Directive,
+    parse_configuration,
+    RequestCost,
+)
+from betty_nginx.artifact import _render_configuration_file
+from betty_nginx.config import NginxConfiguration
+
+
+def _analyze_request(configuration: str, request_path: str) -> RequestCost:
+    analysis = analyze_configuration(configuration, [request_path])
+    (server,) = analysis.servers
+    (cost,) = server.request_costs
+    return cost
+
+
+def _warnings(configuration: str) -> list[tuple[int, str]]:
+    return [
+        (warning.directive.line, warning.directive.name)
+        for warning in analyze_configuration(configuration, []).warnings
+    ]
+
+
+class TestParseConfiguration:
+    async def test(self) -> None:
+        actual = parse_configuration(
+            """
+# A comment.
+server {
+    listen 80;
+    location / {
+        try_files $uri =404;
+    }
+}
+"""
+        )
+        assert actual == (
+            [
+                Directive(
+                    "server",
+                    (),
+                    3,
+                    [
+                        Directive("listen", ("80",), 4),
+                        Directive(
+                            "location",
+                            ("/",),
+                            5,
+                            [Directive("try_files", ("$uri", "=404"), 6)],
+                        ),
+                    ],
+                )
+            ]
+        )
+
+    async def test_quoted_arguments(self) -> None:
+        (directive,) = parse_configuration(
+            """add_header Cache-Control "max-age=86400" 'it\\'s' "a\\.b" '';"""
+        )
+        assert directive.args == ("Cache-Control", "max-age=86400", "it's", "a\\.b", "")
+
+    async def test_variables_with_braces(self) -> None:
+        (directive,) = parse_configuration("set $a ${b}c;")
+        assert directive.args == ("$a", "${b}c")
+
+    async def test_lua_block(self) -> None:
+        (directive, next_directive) = parse_configuration(
+            """
+set_by_lua_block $a {
+    local values = {'}', "{"} -- }
+    return values[1]
+}
+index index.html;
+"""
+        )
+        assert directive.name == "set_by_lua_block"
+        assert directive.args[0] == "$a"
+        assert "return values[1]" in directive.args[1]
+        assert next_directive == Directive("index", ("index.html",), 6)
+
+    @pytest.mark.parametrize(
+        "configuration",
+        [
+            "server {",
+            "}",
+            "listen 80",
+            "listen 80 };",
+            "add_header Vary 'Accept;",
+            "set_by_lua_block $a { return '}'",
+        ],
+    )
+    async def test_with_invalid_configuration(self, configuration: str) -> None:
+        with pytest.raises(ConfigurationParseError):
+            parse_configuration(configuration)
+
+
+class TestDirective:
+    @pytest.mark.parametrize(
+        ("expected", "directive"),
+        [
+            ("listen 80", Directive("listen", ("80",), 1)),
+            ("try_files '' @named", Directive("try_files", ("", "@named"), 1)),
+            (
+                "set_by_lua_block $a { ... }",
+                Directive("set_by_lua_block", ("$a", "return 1"), 1),
+            ),
+        ],
+    )
+    async def test___str__(self, expected: str, directive: Directive) -> None:
+        assert str(directive) == expected
+
+
+class TestAnalyzeConfiguration:
+    async def test_with_http_block(self) -> None:
+        analysis = analyze_configuration(
+            """
+events {}
+http {
+    server {
+        server_name example.com www.example.com;
+    }
+}
+""",
+            [],
+        )
+        (server,) = analysis.servers
+        assert server.server_names == ["example.com", "www.example.com"]
+
+    async def test_exact_location(self) -> None:
+        cost = _analyze_request(
+            """
+server {
+    location ~ \\.html$ {}
+    location = / {
+        return 200;
+    }
+}
+""",
+            "/",
+        )
+        assert cost.status == 200
+        assert cost.locations == ["= /"]
+        assert cost.regex_evaluations == 0
+
+    async def test_regex_locations(self) -> None:
+        cost = _analyze_request(
+            """
+server {
+    location / {
+        location ~ ^/nested {}
+    }
+    location ~ \\.json$ {}
+    location ~* \\.HTML$ {
+        return 200;
+    }
+    location ~ \\.txt$ {}
+}
+""",
+            "/index.html",
+        )
+        assert cost.status == 200
+        assert cost.locations == ["~* \\.HTML$"]
+        assert cost.regex_evaluations == 3
+
+    async def test_prefix_location_without_regex(self) -> None:
+        cost = _analyze_request(
+            """
+server {
+    location / {}
+    location ^~ /static/ {
+        return 200;
+    }
+    location ~ \\.css$ {}
+}
+""",
+            "/static/style.css",
+        )
+        assert cost.locations == ["^~ /static/"]
+        assert cost.regex_evaluations == 0
+
+    async def test_try_files(self) -> None:
+        cost = _analyze_request(
+            """
+server {
+    set_by_lua_block $a { return 'a' }
+    location / {
+        try_files $uri $uri/ @fallback;
+    }
+    location @fallback {
+        log_by_lua_block { ngx.log(ngx.INFO, 'fallback') }
+        return 307 /elsewhere;
+    }
+}
+""",
+            "/missing",
+        )
+        assert cost.status == 307
+        assert cost.locations == ["/", "@fallback"]
+        assert cost.filesystem_probes == 2
+        assert cost.internal_redirects == 1
+        assert cost.round_trip_redirects == 1
+        # Redirects to named locations do not run the server's rewrites again.
+        assert cost.lua_blocks == 2
+
+    async def test_error_page(self) -> None:
+        cost = _analyze_request(
+            """
+server {
+    set_by_lua_block $a { return 'a' }
+    index index.html index.json;
+    location ~ ^/(?<locale>en|nl)/ {
+        error_page 404 /$locale/.error/404.html;
+        location ~ ^/(en|nl)/\\.error/ {
+            internal;
+        }
+    }
+}
+""",
+            "/nl/",
+        )
+        assert cost.status == 404
+        assert cost.locations == ["~ ^/(?<locale>en|nl)/", "~ ^/(en|nl)/\\.error/"]
+        assert cost.regex_evaluations == 4
+        assert cost.filesystem_probes == 3
+        assert cost.internal_redirects == 1
+        # Redirects to URIs run the server's rewrites again.
+        assert cost.lua_blocks == 2
+
+    async def test_internal_location(self) -> None:
+        cost = _analyze_request(
+            """
+server {
+    location /.error {
+        internal;
+    }
+}
+""",
+            "/.error/404.html",
+        )
+        assert cost.status == 404
+        assert cost.filesystem_probes == 0
+
+    async def test_server_return(self) -> None:
+        cost = _analyze_request(
+            """
+server {
+    return 301 https://example.com$request_uri;
+    location / {}
+}
+""",
+            "/",
+        )
+        assert cost.status == 301
+        assert cost.locations == []
+        assert cost.round_trip_redirects == 1
+
+    async def test_redirect_loop(self) -> None:
+        cost = _analyze_request(
+            """
+server {
+    location / {
+        try_files $uri /loop;
+    }
+}
+""",
+            "/",
+        )
+        assert cost.status == 500
+        assert cost.internal_redirects == 11
+
+    @pytest.mark.parametrize(
+        ("expected_lua_blocks", "expected_regex_evaluations", "request_path"),
+        [
+            (1, 1, "/"),
+            (0, 1, "/style.css"),
+        ],
+    )
+    async def test_if(
+        self,
+        expected_lua_blocks: int,
+        expected_regex_evaluations: int,
+        request_path: str,
+    ) -> None:
+        cost = _analyze_request(
+            """
+server {
+    if ($uri !~* "\\.css$") {
+        set_by_lua_block $a { return 'a' }
+    }
+    location / {
+        return 200;
+    }
+}
+""",
+            request_path,
+        )
+        assert cost.status == 200
+        assert cost.lua_blocks == expected_lua_blocks
+        assert cost.regex_evaluations == expected_regex_evaluations
+
+    @pytest.mark.parametrize(
+        ("expected", "condition"),
+        [
+            (403, "($a)"),
+            (200, "( $b )"),
+            (403, "($a = a)"),
+            (200, "($a != a)"),
+            (403, "(!-f $request_filename)"),
+            (200, "(-d $request_filename)"),
+        ],
+    )
+    async def test_if_conditions(self, expected: int, condition: str) -> None:
+        cost = _analyze_request(
+            f"""
+server {{
+    set $a a;
+    set $b '';
+    if {condition} {{
+        return 403;
+    }}
+    location / {{
+        return 200;
+    }}
+}}
+""",
+            "/",
+        )
+        assert cost.status == expected
+
+    async def test_warnings(self) -> None:
+        assert _warnings(
+            """
+server {
+    set_by_lua_block $a { return 'a' }
+    add_header Cache-Control "max-age=86400";
+    add_header Vary Accept-Language;
+    location = / {
+        try_files '' @named;
+    }
+    location ~ ^/$a/ {
+        add_header Vary Accept;
+    }
+}
+"""
+        ) == [
+            (3, "set_by_lua_block"),
+            (2, "server"),
+            (7, "try_files"),
+            (9, "location"),
+            (9, "location"),
+            (9, "location"),
+        ]
+
+    async def test_warnings_without_issues(self) -> None:
+        assert (
+            _warnings(
+                """
+gzip on;
+server {
+    return 301 https://example.com$request_uri;
+}
+server {
+    expires 1d;
+    location / {
+        try_files $uri =404;
+    }
+}
+"""
+            )
+            == []
+        )
+
+    async def test_with_generated_configuration(self, new_temporary_app: App) -> None:
+        async with Project.new_temporary(new_temporary_app) as project:
+            project.configuration.url = "http://example.com"
+            project.configuration.extensions.append(ExtensionConfiguration(Nginx))
+            async with project:
+                configuration = await _render_configuration_file(project)
+        analysis = analyze_configuration(configuration, ["/"])
+        assert analysis.warnings == []
+        (server,) = analysis.servers
+        assert server.request_costs == [
+            RequestCost(
+                path="/",
+                status=404,
+                locations=["/", "/.error"],
+                regex_evaluations=0,
+                lua_blocks=0,
+                filesystem_probes=3,
+                internal_redirects=1,
+                round_trip_redirects=0,
+            )
+        ]
+
+    async def test_with_generated_clean_urls_configuration(
+        self, new_temporary_app: App
+    ) -> None:
+        async with Project.new_temporary(new_temporary_app) as project:
+            project.configuration.url = "http://example.com"
+            project.configuration.clean_urls = True
+            project.configuration.extensions.append(ExtensionConfiguration(Nginx))
+            async with project:
+                configuration = await _render_configuration_file(project)
+        analysis = analyze_configuration(configuration, ["/", "/css/style.css"])
+        assert analysis.warnings == []
+        (server,) = analysis.servers
+        (page_cost, asset_cost) = server.request_costs
+        # Error pages do not negotiate the media type again.
+        assert page_cost.lua_blocks == 1
+        # Asset requests do not negotiate a media type at all.
+        assert asset_cost.lua_blocks == 0
+
+    async def test_with_generated_configuration_with_error_pages_in_memory(
+        self, new_temporary_app: App
+    ) -> None:
+        async with Project.new_temporary(new_temporary_app) as project:
+            project.configuration.url = "http://example.com"
+            project.configuration.extensions.append(
+                ExtensionConfiguration(
+                    Nginx,
+                    extension_configuration=NginxConfiguration(
+                        error_pages_in_memory=True,
+                        rejected_path_prefixes=["/wp-admin"],
+                    ),
+                )
+            )
+            async with project:
+                configuration = await _render_configuration_file(project)
+        analysis = analyze_configuration(configuration, ["/", "/wp-admin/index.php"])
+        assert analysis.warnings == []
+        (server,) = analysis.servers
+        assert server.request_costs == [
+            RequestCost(
+                path="/",
+                status=404,
+                locations=["/", "@default_error_404"],
+                regex_evaluations=0,
+                lua_blocks=1,
+                filesystem_probes=2,
+                internal_redirects=1,
+                round_trip_redirects=0,
+            ),
+            RequestCost(
+                path="/wp-admin/index.php",
+                status=404,
+                locations=["^~ /wp-admin", "@default_error_404"],
+                regex_evaluations=0,
+                lua_blocks=1,
+                filesystem_probes=0,
+                internal_redirects=1,
+                round_trip_redirects=0,
+            ),
+        ]
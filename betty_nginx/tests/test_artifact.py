@@ -1,41 +1,168 @@
+import asyncio
+import json
 import re
+import time
+import tracemalloc
+from collections.abc import AsyncIterator, Iterator, Sequence
+from pathlib import Path
 from typing import Optional
 
+import pytest
+from babel.localedata import locale_identifiers
+
 from betty.app import App
 from betty.project import Project
+from pytest_mock import MockerFixture
 from betty.project.config import ExtensionConfiguration, LocaleConfiguration
 
 from betty_nginx import Nginx
-from betty_nginx.artifact import generate_configuration_file, generate_dockerfile_file
+from betty_nginx.analyze import (
+    Directive,
+    _if_condition,
+    analyze_configuration,
+    parse_configuration,
+)
+from betty_nginx.artifact import (
+    _WRITE_BUFFER_SIZE,
+    _get_nginx,
+    _load_template,
+    _render_configuration_file,
+    _uses_lua,
+    _write_file,
+    GenerationReport,
+    GenerationSpan,
+    _template_loader,
+    _template_name,
+    generate_configuration_file,
+    generate_dockerfile_file,
+    generate_multi_site_configuration_file,
+    requires_lua,
+    write_generation_profile,
+)
 from betty_nginx.config import NginxConfiguration
 
 
-class TestGenerateConfigurationFile:
-    _LEADING_WHITESPACE_PATTERN = re.compile(r"^\s*(.*?)$")
+_LEADING_WHITESPACE_PATTERN = re.compile(r"^\s*(.*?)$")
 
-    def _normalize_configuration(self, configuration: str) -> str:
-        return "\n".join(
-            filter(
-                None,
-                map(self._normalize_configuration_line, configuration.splitlines()),
-            )
+
+def _normalize_configuration(configuration: str) -> str:
+    return "\n".join(
+        filter(
+            None,
+            map(_normalize_configuration_line, configuration.splitlines()),
         )
+    )
+
+
+def _normalize_configuration_line(line: str) -> Optional[str]:
+    match = _LEADING_WHITESPACE_PATTERN.fullmatch(line)
+    if match is None:
+        return None
+    return match.group(1)
+
+
+def _walk_directives(directives: Sequence[Directive]) -> Iterator[Directive]:
+    for directive in directives:
+        yield directive
+        yield from _walk_directives(directive.block or ())
 
-    def _normalize_configuration_line(self, line: str) -> Optional[str]:
-        match = self._LEADING_WHITESPACE_PATTERN.fullmatch(line)
-        if match is None:
-            return None
-        return match.group(1)
 
+def _rewrite_server_variables(
+    configuration: str, uri: str, variables: dict[str, str]
+) -> dict[str, str]:
+    """
+    Run a server's rewrites for a request, such as an internal redirect that starts with the given variables.
+
+    Variables that Lua sets are set to ``"lua"``.
+    """
+    variables = {**variables, "uri": uri}
+
+    def _substitute(value: str, captures: Sequence[str]) -> str:
+        return re.sub(
+            r"\$(\w+)",
+            lambda match: captures[int(match.group(1))]
+            if match.group(1).isdigit()
+            else variables[match.group(1)],
+            value,
+        )
+
+    def _rewrite(directives: Sequence[Directive], captures: Sequence[str]) -> None:
+        for directive in directives:
+            if directive.name == "set":
+                variables[directive.args[0][1:]] = _substitute(
+                    directive.args[1], captures
+                )
+            elif directive.name == "set_by_lua_block":
+                variables[directive.args[0][1:]] = "lua"
+            elif directive.name == "if":
+                variable, operator, pattern = _if_condition(directive.args)
+                match = re.search(
+                    pattern,
+                    _substitute(variable, ()),
+                    re.IGNORECASE if operator.endswith("*") else 0,
+                )
+                if (match is None) is operator.startswith("!"):
+                    _rewrite(
+                        directive.block or (),
+                        (match.group(0), *match.groups(default="")) if match else (),
+                    )
+
+    (server,) = (
+        directive
+        for directive in _walk_directives(parse_configuration(configuration))
+        if directive.name == "server"
+        and any(child.name == "root" for child in directive.block or ())
+    )
+    _rewrite(server.block or (), ())
+    return variables
+
+
+def _resolve_image_file(
+    configuration: str, uri: str, accept: str, file_paths: set[str]
+) -> str | None:
+    """
+    Resolve the file nginx serves for an image request, given the files that exist.
+    """
+    directives = list(_walk_directives(parse_configuration(configuration)))
+    variables = {"$uri": uri}
+    for directive in directives:
+        if directive.name == "map" and directive.args[0] == "$http_accept":
+            entries = {entry.name: entry.args[0] for entry in directive.block or ()}
+            variables[directive.args[1]] = next(
+                (
+                    value
+                    for pattern, value in entries.items()
+                    if pattern.startswith("~*")
+                    and re.search(pattern[2:], accept, re.IGNORECASE)
+                ),
+                entries["default"],
+            )
+    (image_location,) = (
+        directive
+        for directive in directives
+        if directive.name == "location" and directive.args[-1] == r"\.(?:jpe?g|png)$"
+    )
+    (try_files,) = (
+        directive
+        for directive in image_location.block or ()
+        if directive.name == "try_files"
+    )
+    for candidate in try_files.args[:-1]:
+        for name, value in variables.items():
+            candidate = candidate.replace(name, value)
+        if candidate in file_paths:
+            return candidate
+    return None
+
+
+class TestGenerateConfigurationFile:
     async def _assert_configuration_equals(self, expected: str, project: Project):
         await generate_configuration_file(project)
         with open(
             project.configuration.output_directory_path / "nginx" / "nginx.conf"
         ) as f:
             actual = f.read()
-        assert self._normalize_configuration(expected) == self._normalize_configuration(
-            actual
-        )
+        assert _normalize_configuration(expected) == _normalize_configuration(actual)
 
     async def test(self, new_temporary_app: App):
         async with Project.new_temporary(new_temporary_app) as project:
@@ -182,13 +309,22 @@ server {
     gzip_vary on;
     gzip_types text/css application/javascript application/json application/xml;
 
-    set_by_lua_block $media_type_extension {
-        local available_media_types = {'text/html', 'application/json'}
-        local media_type_extensions = {}
-        media_type_extensions['text/html'] = 'html'
-        media_type_extensions['application/json'] = 'json'
-        local media_type = require('content_negotiation').negotiate(ngx.req.get_headers()['Accept'], available_media_types)
-        return media_type_extensions[media_type]
+    # Only negotiate the media type for requests that may serve a directory index or an error page in either
+    # media type. Asset requests never enter Lua, and their error pages are HTML. Error pages carry their media
+    # type in their URIs already, so redirects to them take it from there.
+    set $media_type_extension html;
+    if ($uri ~ "/\.error/[^/]*\.(html|json)$") {
+        set $media_type_extension $1;
+    }
+    if ($uri !~* "(\.(avif|css|gif|ico|jpeg|jpg|js|pdf|png|svg|ttf|webp|woff|woff2)|/\.error/[^/]*)$") {
+        set_by_lua_block $media_type_extension {
+            local available_media_types = {'text/html', 'application/json'}
+            local media_type_extensions = {}
+            media_type_extensions['text/html'] = 'html'
+            media_type_extensions['application/json'] = 'json'
+            local media_type = require('content_negotiation').negotiate(ngx.req.get_headers()['Accept'], available_media_types)
+            return media_type_extensions[media_type]
+        }
     }
     index index.$media_type_extension;
     location @localized_redirect {
@@ -268,13 +404,22 @@ server {
     gzip_vary on;
     gzip_types text/css application/javascript application/json application/xml;
 
-    set_by_lua_block $media_type_extension {
-        local available_media_types = {'text/html', 'application/json'}
-        local media_type_extensions = {}
-        media_type_extensions['text/html'] = 'html'
-        media_type_extensions['application/json'] = 'json'
-        local media_type = require('content_negotiation').negotiate(ngx.req.get_headers()['Accept'], available_media_types)
-        return media_type_extensions[media_type]
+    # Only negotiate the media type for requests that may serve a directory index or an error page in either
+    # media type. Asset requests never enter Lua, and their error pages are HTML. Error pages carry their media
+    # type in their URIs already, so redirects to them take it from there.
+    set $media_type_extension html;
+    if ($uri ~ "/\.error/[^/]*\.(html|json)$") {
+        set $media_type_extension $1;
+    }
+    if ($uri !~* "(\.(avif|css|gif|ico|jpeg|jpg|js|pdf|png|svg|ttf|webp|woff|woff2)|/\.error/[^/]*)$") {
+        set_by_lua_block $media_type_extension {
+            local available_media_types = {'text/html', 'application/json'}
+            local media_type_extensions = {}
+            media_type_extensions['text/html'] = 'html'
+            media_type_extensions['application/json'] = 'json'
+            local media_type = require('content_negotiation').negotiate(ngx.req.get_headers()['Accept'], available_media_types)
+            return media_type_extensions[media_type]
+        }
     }
     index index.$media_type_extension;
 
@@ -386,6 +531,732 @@ server {
             async with project:
                 await self._assert_configuration_equals(expected, project)
 
+    async def test_with_replicas(self, new_temporary_app: App) -> None:
+        async with Project.new_temporary(new_temporary_app) as project:
+            project.configuration.url = "https://example.com"
+            project.configuration.extensions.append(
+                ExtensionConfiguration(
+                    Nginx,
+                    extension_configuration=NginxConfiguration(replicas=3),
+                )
+            )
+            async with project:
+                await generate_configuration_file(project)
+                nginx_directory_path = (
+                    project.configuration.output_directory_path / "nginx"
+                )
+                with open(nginx_directory_path / "nginx.conf") as f:
+                    configuration = _normalize_configuration(f.read())
+                with open(nginx_directory_path / "front.conf") as f:
+                    front_configuration = _normalize_configuration(f.read())
+        # TLS is terminated before the front server.
+        assert "listen 80;" in configuration
+        assert "ssl" not in configuration
+        assert "return 301" not in configuration
+        assert "location = /.health {" in configuration
+        assert "server replica:80" in front_configuration
+        assert "keepalive 32;" in front_configuration
+        assert "proxy_cache betty;" in front_configuration
+        assert "location = /.health {" in front_configuration
+
+    async def test_with_replicas_and_image_variants(
+        self, new_temporary_app: App
+    ) -> None:
+        async with Project.new_temporary(new_temporary_app) as project:
+            project.configuration.extensions.append(
+                ExtensionConfiguration(
+                    Nginx,
+                    extension_configuration=NginxConfiguration(
+                        replicas=3, image_variants=True
+                    ),
+                )
+            )
+            async with project:
+                await generate_configuration_file(project)
+                with open(
+                    project.configuration.output_directory_path / "nginx" / "front.conf"
+                ) as f:
+                    front_configuration = f.read()
+        assert (
+            'proxy_cache_key "$scheme$host$request_uri|$http_accept|$http_accept_language";'
+            in front_configuration
+        )
+
+    async def test_with_access_log(self, new_temporary_app: App) -> None:
+        async with Project.new_temporary(new_temporary_app) as project:
+            project.configuration.extensions.append(
+                ExtensionConfiguration(
+                    Nginx,
+                    extension_configuration=NginxConfiguration(
+                        access_log_file_path="/var/log/nginx/betty.json",
+                        access_log_sample_rate=0.125,
+                    ),
+                )
+            )
+            async with project:
+                await generate_configuration_file(project)
+                with open(
+                    project.configuration.output_directory_path / "nginx" / "nginx.conf"
+                ) as f:
+                    configuration = _normalize_configuration(f.read())
+        assert "log_format betty_json escape=json '{'" in configuration
+        assert "'\"request_time\":$request_time,'" in configuration
+        assert "12.50% 1;" in configuration
+        assert (
+            "access_log /var/log/nginx/betty.json betty_json buffer=64k flush=5s if=$betty_access_log_sampled;"
+            in configuration
+        )
+        assert "set $locale '';" in configuration
+
+    async def test_with_unbuffered_unsampled_access_log(
+        self, new_temporary_app: App
+    ) -> None:
+        async with Project.new_temporary(new_temporary_app) as project:
+            project.configuration.extensions.append(
+                ExtensionConfiguration(
+                    Nginx,
+                    extension_configuration=NginxConfiguration(
+                        access_log_file_path="/var/log/nginx/betty.json",
+                        access_log_buffer_size=None,
+                    ),
+                )
+            )
+            async with project:
+                await generate_configuration_file(project)
+                with open(
+                    project.configuration.output_directory_path / "nginx" / "nginx.conf"
+                ) as f:
+                    configuration = _normalize_configuration(f.read())
+        assert "split_clients" not in configuration
+        assert "access_log /var/log/nginx/betty.json betty_json;" in configuration
+
+    async def test_with_metrics(self, new_temporary_app: App) -> None:
+        async with Project.new_temporary(new_temporary_app) as project:
+            project.configuration.clean_urls = True
+            project.configuration.locales.append(
+                LocaleConfiguration("nl-NL", alias="nl"),
+            )
+            project.configuration.extensions.append(
+                ExtensionConfiguration(
+                    Nginx,
+                    extension_configuration=NginxConfiguration(
+                        metrics=True,
+                        metrics_allowed_addresses=["10.0.0.0/8"],
+                    ),
+                )
+            )
+            async with project:
+                await generate_configuration_file(project)
+                with open(
+                    project.configuration.output_directory_path / "nginx" / "nginx.conf"
+                ) as f:
+                    configuration = _normalize_configuration(f.read())
+        assert "lua_shared_dict betty_metrics 1m;" in configuration
+        assert "location = /.metrics {" in configuration
+        assert "location = /.metrics/stub_status {" in configuration
+        assert "stub_status;" in configuration
+        assert "allow 10.0.0.0/8;" in configuration
+        assert "deny all;" in configuration
+        assert "require('metrics').negotiate('Accept'," in configuration
+        assert "require('metrics').negotiate('Accept-Language'," in configuration
+        for location in ("localized_redirect", "front_page", "localized", "static"):
+            assert f"require('metrics').log('{location}')" in configuration
+        assert requires_lua(configuration)
+
+    async def test_with_debug(self, new_temporary_app: App) -> None:
+        async with Project.new_temporary(new_temporary_app) as project:
+            project.configuration.debug = True
+            project.configuration.clean_urls = True
+            project.configuration.extensions.append(ExtensionConfiguration(Nginx))
+            async with project:
+                await generate_configuration_file(project)
+                with open(
+                    project.configuration.output_directory_path / "nginx" / "nginx.conf"
+                ) as f:
+                    configuration = _normalize_configuration(f.read())
+        assert "map $request_time $betty_request_time_ms {" in configuration
+        assert (
+            'add_header Server-Timing "total;desc=\\"Total\\";dur=$betty_request_time_ms, negotiation;desc=\\"Content negotiation\\";dur=$betty_negotiation_duration" always;'
+            in configuration
+        )
+        assert "add_header X-Betty-Location $betty_location always;" in configuration
+        assert (
+            "add_header X-Betty-Negotiation $betty_negotiation_trace always;"
+            in configuration
+        )
+        assert "set $betty_location default;" in configuration
+        assert "set $betty_location default_error;" in configuration
+        assert "require('trace').negotiation('Accept'," in configuration
+
+    @pytest.mark.parametrize(
+        ("expected_media_type_extension", "uri"),
+        [
+            ("json", "/.error/404.json"),
+            ("html", "/.error/404.html"),
+        ],
+    )
+    async def test_with_debug_should_keep_negotiation_for_error_pages(
+        self, expected_media_type_extension: str, uri: str, new_temporary_app: App
+    ) -> None:
+        async with Project.new_temporary(new_temporary_app) as project:
+            project.configuration.debug = True
+            project.configuration.clean_urls = True
+            project.configuration.extensions.append(ExtensionConfiguration(Nginx))
+            async with project:
+                configuration = await _render_configuration_file(project)
+        variables = _rewrite_server_variables(configuration, "/person/I0001/", {})
+        assert variables["media_type_extension"] == "lua"
+        assert variables["betty_negotiation_trace"] == ""
+        # Pretend Lua negotiated the media type, before the request failed and nginx redirected it to an error page.
+        variables["betty_negotiation_trace"] = "Accept=application/json (accepted)"
+        variables["betty_negotiation_duration"] = "0.123"
+        variables = _rewrite_server_variables(configuration, uri, variables)
+        assert variables["media_type_extension"] == expected_media_type_extension
+        assert (
+            variables["betty_negotiation_trace"] == "Accept=application/json (accepted)"
+        )
+        assert variables["betty_negotiation_duration"] == "0.123"
+
+    async def test_with_debug_without_clean_urls(self, new_temporary_app: App) -> None:
+        async with Project.new_temporary(new_temporary_app) as project:
+            project.configuration.debug = True
+            project.configuration.extensions.append(ExtensionConfiguration(Nginx))
+            async with project:
+                await generate_configuration_file(project)
+                with open(
+                    project.configuration.output_directory_path / "nginx" / "nginx.conf"
+                ) as f:
+                    configuration = f.read()
+        assert 'dur=$betty_request_time_ms" always;' in configuration
+        assert "negotiation" not in configuration
+        # Debugging must not require OpenResty.
+        assert not requires_lua(configuration)
+
+    async def test_with_releases(self, new_temporary_app: App) -> None:
+        async with Project.new_temporary(new_temporary_app) as project:
+            project.configuration.debug = True
+            project.configuration.extensions.append(
+                ExtensionConfiguration(
+                    Nginx,
+                    extension_configuration=NginxConfiguration(
+                        releases_directory_path="/srv/betty/releases",
+                    ),
+                )
+            )
+            async with project:
+                await generate_configuration_file(project)
+                with open(
+                    project.configuration.output_directory_path / "nginx" / "nginx.conf"
+                ) as f:
+                    configuration = _normalize_configuration(f.read())
+        assert "root /srv/betty/releases/current;" in configuration
+        assert "open_file_cache off;" in configuration
+        assert "add_header X-Betty-Release $realpath_root always;" in configuration
+
+    async def test_with_image_variants(self, new_temporary_app: App) -> None:
+        async with Project.new_temporary(new_temporary_app) as project:
+            project.configuration.extensions.append(
+                ExtensionConfiguration(
+                    Nginx,
+                    extension_configuration=NginxConfiguration(
+                        image_variants=True,
+                    ),
+                )
+            )
+            async with project:
+                await generate_configuration_file(project)
+                with open(
+                    project.configuration.output_directory_path / "nginx" / "nginx.conf"
+                ) as f:
+                    configuration = _normalize_configuration(f.read())
+        assert "map $http_accept $betty_image_variant_avif {" in configuration
+        assert "map $http_accept $betty_image_variant_webp {" in configuration
+        assert "location ~* \\.(?:jpe?g|png)$ {" in configuration
+        assert "add_header Vary Accept;" in configuration
+        assert (
+            "try_files $uri$betty_image_variant_avif $uri$betty_image_variant_webp $uri =404;"
+            in configuration
+        )
+
+    @pytest.mark.parametrize(
+        ("expected", "accept", "file_paths"),
+        [
+            (
+                "/portrait.jpg.avif",
+                "image/avif,image/webp,*/*",
+                {"/portrait.jpg", "/portrait.jpg.avif", "/portrait.jpg.webp"},
+            ),
+            (
+                "/portrait.jpg.webp",
+                "image/avif,image/webp,*/*",
+                {"/portrait.jpg", "/portrait.jpg.webp"},
+            ),
+            (
+                "/portrait.jpg.webp",
+                "image/webp,*/*",
+                {"/portrait.jpg", "/portrait.jpg.avif", "/portrait.jpg.webp"},
+            ),
+            (
+                "/portrait.jpg.avif",
+                "image/avif,*/*",
+                {"/portrait.jpg", "/portrait.jpg.avif", "/portrait.jpg.webp"},
+            ),
+            (
+                "/portrait.jpg",
+                "image/avif,*/*",
+                {"/portrait.jpg", "/portrait.jpg.webp"},
+            ),
+            (
+                "/portrait.jpg",
+                "*/*",
+                {"/portrait.jpg", "/portrait.jpg.avif", "/portrait.jpg.webp"},
+            ),
+        ],
+    )
+    async def test_with_image_variants_should_serve_accepted_variant(
+        self,
+        expected: str,
+        accept: str,
+        file_paths: set[str],
+        new_temporary_app: App,
+    ) -> None:
+        async with Project.new_temporary(new_temporary_app) as project:
+            project.configuration.extensions.append(
+                ExtensionConfiguration(
+                    Nginx,
+                    extension_configuration=NginxConfiguration(
+                        image_variants=True,
+                    ),
+                )
+            )
+            async with project:
+                configuration = await _render_configuration_file(project)
+        assert (
+            _resolve_image_file(configuration, "/portrait.jpg", accept, file_paths)
+            == expected
+        )
+
+    async def test_with_image_variants_and_multilingual(
+        self, new_temporary_app: App
+    ) -> None:
+        async with Project.new_temporary(new_temporary_app) as project:
+            project.configuration.locales.replace(
+                LocaleConfiguration("en-US", alias="en"),
+                LocaleConfiguration("nl-NL", alias="nl"),
+            )
+            project.configuration.extensions.append(
+                ExtensionConfiguration(
+                    Nginx,
+                    extension_configuration=NginxConfiguration(
+                        image_variants=True,
+                    ),
+                )
+            )
+            async with project:
+                configuration = await _render_configuration_file(project)
+        (_, server) = analyze_configuration(
+            configuration, ["/nl/portrait.jpg", "/portrait.jpg"]
+        ).servers
+        (localized_image, static_image) = server.request_costs
+        assert localized_image.locations[0] == "~* ^/(en|nl)/.*\\.(?:jpe?g|png)$"
+        assert static_image.locations[0] == "~* \\.(?:jpe?g|png)$"
+        configuration = _normalize_configuration(configuration)
+        assert (
+            'add_header Vary Accept;\nadd_header Content-Language "$locale" always;'
+            in configuration
+        )
+
+    async def test_with_error_pages_in_memory(self, new_temporary_app: App) -> None:
+        async with Project.new_temporary(new_temporary_app) as project:
+            project.configuration.extensions.append(
+                ExtensionConfiguration(
+                    Nginx,
+                    extension_configuration=NginxConfiguration(
+                        error_pages_in_memory=True,
+                    ),
+                )
+            )
+            async with project:
+                await generate_configuration_file(project)
+                with open(
+                    project.configuration.output_directory_path / "nginx" / "nginx.conf"
+                ) as f:
+                    configuration = _normalize_configuration(f.read())
+        assert "error_page 404 @default_error_404;" in configuration
+        assert "location @default_error_404 {" in configuration
+        assert (
+            "require('error_pages').serve(404, ngx.var.document_root .. '' .. '/.error/404.' .. ngx.var.media_type_extension)"
+            in configuration
+        )
+        assert "error_page 404 /.error/404.$media_type_extension;" not in configuration
+        assert requires_lua(configuration)
+
+    async def test_multilingual_with_error_pages_in_memory(
+        self, new_temporary_app: App
+    ) -> None:
+        async with Project.new_temporary(new_temporary_app) as project:
+            project.configuration.locales.replace(
+                LocaleConfiguration("en-US", alias="en"),
+                LocaleConfiguration("nl-NL", alias="nl"),
+            )
+            project.configuration.extensions.append(
+                ExtensionConfiguration(
+                    Nginx,
+                    extension_configuration=NginxConfiguration(
+                        error_pages_in_memory=True,
+                        releases_directory_path="/srv/betty/releases",
+                    ),
+                )
+            )
+            async with project:
+                await generate_configuration_file(project)
+                with open(
+                    project.configuration.output_directory_path / "nginx" / "nginx.conf"
+                ) as f:
+                    configuration = _normalize_configuration(f.read())
+        assert "error_page 404 @localized_error_404;" in configuration
+        assert "error_page 404 @static_error_404;" in configuration
+        assert (
+            "require('error_pages').serve(404, ngx.var.realpath_root .. '/' .. ngx.var.locale .. '/.error/404.' .. ngx.var.media_type_extension)"
+            in configuration
+        )
+        assert (
+            "require('error_pages').serve(404, ngx.var.realpath_root .. '/en' .. '/.error/404.' .. ngx.var.media_type_extension)"
+            in configuration
+        )
+
+    async def test_with_rejected_path_prefixes(self, new_temporary_app: App) -> None:
+        async with Project.new_temporary(new_temporary_app) as project:
+            project.configuration.extensions.append(
+                ExtensionConfiguration(
+                    Nginx,
+                    extension_configuration=NginxConfiguration(
+                        rejected_path_prefixes=["/wp-admin", "/.git/"],
+                    ),
+                )
+            )
+            async with project:
+                await generate_configuration_file(project)
+                with open(
+                    project.configuration.output_directory_path / "nginx" / "nginx.conf"
+                ) as f:
+                    configuration = _normalize_configuration(f.read())
+        assert "location ^~ /wp-admin {" in configuration
+        assert "location ^~ /.git/ {" in configuration
+        assert "return 404;" in configuration
+        assert not requires_lua(configuration)
+
+    async def test_without_image_variants(self, new_temporary_app: App) -> None:
+        async with Project.new_temporary(new_temporary_app) as project:
+            project.configuration.extensions.append(ExtensionConfiguration(Nginx))
+            async with project:
+                await generate_configuration_file(project)
+                with open(
+                    project.configuration.output_directory_path / "nginx" / "nginx.conf"
+                ) as f:
+                    configuration = f.read()
+        assert "betty_image_variant" not in configuration
+
+    async def test_with_rate_limit(self, new_temporary_app: App) -> None:
+        async with Project.new_temporary(new_temporary_app) as project:
+            project.configuration.extensions.append(
+                ExtensionConfiguration(
+                    Nginx,
+                    extension_configuration=NginxConfiguration(
+                        rate_limit="strict",
+                        rate_limit_allowed_addresses=["192.0.2.0/24"],
+                        rate_limit_crawler_user_agents=["Googlebot", "Bing Preview"],
+                    ),
+                )
+            )
+            async with project:
+                await generate_configuration_file(project)
+                with open(
+                    project.configuration.output_directory_path / "nginx" / "nginx.conf"
+                ) as f:
+                    configuration = _normalize_configuration(f.read())
+        assert "192.0.2.0/24 1;" in configuration
+        assert '"~*(Googlebot|Bing\\ Preview)" $betty_limit_client;' in configuration
+        assert (
+            "limit_req_zone $betty_limit_page_key zone=betty_pages:10m rate=5r/s;"
+            in configuration
+        )
+        assert (
+            "limit_req_zone $betty_limit_crawler_key zone=betty_crawlers:10m rate=30r/m;"
+            in configuration
+        )
+        assert "limit_req zone=betty_pages burst=10 nodelay;" in configuration
+        assert "limit_req zone=betty_crawlers burst=2;" in configuration
+        assert "limit_conn betty_connections 10;" in configuration
+        assert "limit_req_status 429;" in configuration
+        # The zones must be declared in the http context, before any server.
+        assert configuration.index("limit_req_zone") < configuration.index("server {")
+
+    async def test_with_rate_limit_and_replicas(self, new_temporary_app: App) -> None:
+        async with Project.new_temporary(new_temporary_app) as project:
+            project.configuration.extensions.append(
+                ExtensionConfiguration(
+                    Nginx,
+                    extension_configuration=NginxConfiguration(
+                        rate_limit="moderate",
+                        replicas=2,
+                    ),
+                )
+            )
+            async with project:
+                await generate_configuration_file(project)
+                nginx_directory_path = (
+                    project.configuration.output_directory_path / "nginx"
+                )
+                with open(nginx_directory_path / "nginx.conf") as f:
+                    configuration = f.read()
+                with open(nginx_directory_path / "front.conf") as f:
+                    front_configuration = _normalize_configuration(f.read())
+        # Replicas only see the front server's address.
+        assert "limit_req" not in configuration
+        assert (
+            "limit_req_zone $betty_limit_page_key zone=betty_pages:10m rate=10r/s;"
+            in front_configuration
+        )
+        assert "limit_req zone=betty_pages burst=20 nodelay;" in front_configuration
+
+    async def test_without_changes(self, new_temporary_app: App) -> None:
+        async with Project.new_temporary(new_temporary_app) as project:
+            project.configuration.extensions.append(
+                ExtensionConfiguration(
+                    Nginx, extension_configuration=NginxConfiguration(replicas=2)
+                )
+            )
+            async with project:
+                nginx_directory_path = (
+                    project.configuration.output_directory_path / "nginx"
+                )
+                first_report = await generate_configuration_file(project)
+                modification_times = {
+                    file_path: file_path.stat().st_mtime_ns
+                    for file_path in first_report.written
+                }
+                second_report = await generate_configuration_file(project)
+                for file_path, modification_time in modification_times.items():
+                    assert file_path.stat().st_mtime_ns == modification_time
+        assert set(first_report.written) == {
+            nginx_directory_path / "nginx.conf",
+            nginx_directory_path / "front.conf",
+        }
+        assert not second_report.changed
+        assert set(second_report.unchanged) == set(first_report.written)
+
+    async def test_with_changes(self, new_temporary_app: App) -> None:
+        async with Project.new_temporary(new_temporary_app) as project:
+            project.configuration.extensions.append(ExtensionConfiguration(Nginx))
+            async with project:
+                configuration_file_path = (
+                    project.configuration.output_directory_path / "nginx" / "nginx.conf"
+                )
+                await generate_configuration_file(project)
+                # Make the existing file longer than the generated one.
+                with open(configuration_file_path, "a") as f:
+                    f.write("# A local change.\n")
+                report = await generate_configuration_file(project)
+                with open(configuration_file_path) as f:
+                    configuration = f.read()
+        assert report.written == [configuration_file_path]
+        assert "# A local change." not in configuration
+
+    async def test_should_time_steps(self, new_temporary_app: App) -> None:
+        async with Project.new_temporary(new_temporary_app) as project:
+            project.configuration.extensions.append(ExtensionConfiguration(Nginx))
+            async with project:
+                report = await generate_configuration_file(project)
+        configuration_file_path = (
+            project.configuration.output_directory_path / "nginx" / "nginx.conf"
+        )
+        steps = [span.step for span in report.spans]
+        assert steps.count("load_template") == 1
+        assert steps.count("compile_template") == 1
+        assert [
+            span.step
+            for span in report.spans
+            if span.file_path == configuration_file_path
+        ] == ["create_directories", "render", "write"]
+        assert all(span.duration >= 0 for span in report.spans)
+
+    async def test_should_stream(self, new_temporary_app: App) -> None:
+        async with Project.new_temporary(new_temporary_app) as project:
+            project.configuration.clean_urls = True
+            project.configuration.locales.replace(
+                *(
+                    LocaleConfiguration(locale)
+                    for locale in sorted(
+                        locale_identifier.replace("_", "-")
+                        for locale_identifier in locale_identifiers()
+                    )[:100]
+                )
+            )
+            project.configuration.extensions.append(
+                ExtensionConfiguration(
+                    Nginx,
+                    extension_configuration=NginxConfiguration(
+                        rejected_path_prefixes=[
+                            f"/scanner-{index}/" for index in range(2000)
+                        ],
+                    ),
+                )
+            )
+            async with project:
+                # Compile the templates first.
+                await generate_configuration_file(project)
+                await generate_dockerfile_file(project)
+                configuration_file_path = (
+                    project.configuration.output_directory_path / "nginx" / "nginx.conf"
+                )
+                configuration_file_path.unlink()
+                tracemalloc.start()
+                try:
+                    await generate_configuration_file(project)
+                    await generate_dockerfile_file(project)
+                    _, peak_memory = tracemalloc.get_traced_memory()
+                finally:
+                    tracemalloc.stop()
+                configuration_size = configuration_file_path.stat().st_size
+        assert configuration_size > 8 * _WRITE_BUFFER_SIZE
+        # Neither step may hold the whole configuration in memory, but only a few write buffers' worth of it.
+        assert peak_memory < 8 * _WRITE_BUFFER_SIZE
+
+    async def test_without_replicas(self, new_temporary_app: App) -> None:
+        async with Project.new_temporary(new_temporary_app) as project:
+            project.configuration.extensions.append(ExtensionConfiguration(Nginx))
+            async with project:
+                await generate_configuration_file(project)
+                assert not (
+                    project.configuration.output_directory_path / "nginx" / "front.conf"
+                ).exists()
+
+
+class TestGenerateMultiSiteConfigurationFile:
+    async def test(self, new_temporary_app: App, tmp_path: Path) -> None:
+        async with Project.new_temporary(
+            new_temporary_app
+        ) as project_one, Project.new_temporary(new_temporary_app) as project_two:
+            project_one.configuration.url = "http://example.com"
+            project_one.configuration.extensions.append(ExtensionConfiguration(Nginx))
+            project_two.configuration.url = "http://example.org"
+            project_two.configuration.extensions.append(ExtensionConfiguration(Nginx))
+            expected = r"""
+server_names_hash_bucket_size 128;
+
+# Refuse requests for unknown sites.
+server {
+    listen 80 default_server;
+    return 444;
+}
+server {
+    add_header Vary Accept-Language;
+    add_header Cache-Control "max-age=86400";
+    listen 80;
+    server_name example.com;
+    root /var/www/betty/0;
+    gzip on;
+    gzip_disable "msie6";
+    gzip_vary on;
+    gzip_types text/css application/javascript application/json application/xml;
+
+    set $media_type_extension html;
+    index index.$media_type_extension;
+
+    location / {
+        # Handle HTTP error responses.
+        error_page 401 /.error/401.$media_type_extension;
+        error_page 403 /.error/403.$media_type_extension;
+        error_page 404 /.error/404.$media_type_extension;
+        location /.error {
+            internal;
+        }
+
+        try_files $uri $uri/ =404;
+    }
+}
+server {
+    add_header Vary Accept-Language;
+    add_header Cache-Control "max-age=86400";
+    listen 80;
+    server_name example.org;
+    root /var/www/betty/1;
+    gzip on;
+    gzip_disable "msie6";
+    gzip_vary on;
+    gzip_types text/css application/javascript application/json application/xml;
+
+    set $media_type_extension html;
+    index index.$media_type_extension;
+
+    location / {
+        # Handle HTTP error responses.
+        error_page 401 /.error/401.$media_type_extension;
+        error_page 403 /.error/403.$media_type_extension;
+        error_page 404 /.error/404.$media_type_extension;
+        location /.error {
+            internal;
+        }
+
+        try_files $uri $uri/ =404;
+    }
+}
+"""
+            async with project_one, project_two:
+                await generate_multi_site_configuration_file(
+                    [project_one, project_two],
+                    tmp_path / "nginx.conf",
+                    www_directory_paths=["/var/www/betty/0", "/var/www/betty/1"],
+                )
+                with open(tmp_path / "nginx.conf") as f:
+                    actual = f.read()
+            assert _normalize_configuration(expected) == _normalize_configuration(
+                actual
+            )
+
+    async def test_with_rate_limit(
+        self, new_temporary_app: App, tmp_path: Path
+    ) -> None:
+        async with Project.new_temporary(
+            new_temporary_app
+        ) as project_one, Project.new_temporary(new_temporary_app) as project_two:
+            project_one.configuration.url = "http://example.com"
+            project_one.configuration.extensions.append(
+                ExtensionConfiguration(
+                    Nginx,
+                    extension_configuration=NginxConfiguration(rate_limit="strict"),
+                )
+            )
+            project_two.configuration.url = "http://example.org"
+            project_two.configuration.extensions.append(ExtensionConfiguration(Nginx))
+            async with project_one, project_two:
+                await generate_multi_site_configuration_file(
+                    [project_one, project_two], tmp_path / "nginx.conf"
+                )
+                with open(tmp_path / "nginx.conf") as f:
+                    configuration = f.read()
+        # The zones are shared, so every server is limited like the first project.
+        assert configuration.count("limit_req_zone $betty_limit_page_key") == 1
+        assert configuration.count("limit_req zone=betty_pages burst=10 nodelay;") == 2
+
+    async def test_without_projects(self, tmp_path: Path) -> None:
+        with pytest.raises(ValueError):  # noqa PT011
+            await generate_multi_site_configuration_file([], tmp_path / "nginx.conf")
+
+    async def test_with_too_few_www_directory_paths(
+        self, new_temporary_app: App, tmp_path: Path
+    ) -> None:
+        async with Project.new_temporary(new_temporary_app) as project:
+            project.configuration.extensions.append(ExtensionConfiguration(Nginx))
+            async with project:
+                with pytest.raises(ValueError):  # noqa PT011
+                    await generate_multi_site_configuration_file(
+                        [project, project],
+                        tmp_path / "nginx.conf",
+                        www_directory_paths=["/var/www/betty/0"],
+                    )
+
 
 class TestGenerateDockerfileFile:
     async def test(self, new_temporary_app: App) -> None:
@@ -405,6 +1276,477 @@ class TestGenerateDockerfileFile:
                     / "nginx"
                     / "content_negotiation.lua"
                 ).exists()
+                assert (
+                    project.configuration.output_directory_path
+                    / "nginx"
+                    / "metrics.lua"
+                ).exists()
                 assert (
                     project.configuration.output_directory_path / "nginx" / "Dockerfile"
                 ).exists()
+
+    async def test_without_changes(self, new_temporary_app: App) -> None:
+        async with Project.new_temporary(new_temporary_app) as project:
+            project.configuration.extensions.append(ExtensionConfiguration(Nginx))
+            async with project:
+                first_report = await generate_dockerfile_file(project)
+                second_report = await generate_dockerfile_file(project)
+        assert first_report.changed
+        assert not second_report.changed
+        assert set(second_report.unchanged) == set(first_report.written)
+
+    async def test_without_lua(self, new_temporary_app: App) -> None:
+        async with Project.new_temporary(new_temporary_app) as project:
+            project.configuration.extensions.append(ExtensionConfiguration(Nginx))
+            async with project:
+                await generate_dockerfile_file(project)
+                with open(
+                    project.configuration.output_directory_path / "nginx" / "Dockerfile"
+                ) as f:
+                    actual = f.read()
+        assert "FROM nginx:alpine" in actual
+        assert "openresty" not in actual
+
+    async def test_with_lua(self, new_temporary_app: App) -> None:
+        async with Project.new_temporary(new_temporary_app) as project:
+            project.configuration.clean_urls = True
+            project.configuration.extensions.append(ExtensionConfiguration(Nginx))
+            async with project:
+                await generate_dockerfile_file(project)
+                with open(
+                    project.configuration.output_directory_path / "nginx" / "Dockerfile"
+                ) as f:
+                    actual = f.read()
+        assert "FROM openresty/openresty:alpine" in actual
+        assert "COPY content_negotiation.lua" in actual
+        assert "COPY metrics.lua" in actual
+        assert "COPY error_pages.lua" in actual
+
+    async def test_with_production_image(self, new_temporary_app: App) -> None:
+        async with Project.new_temporary(new_temporary_app) as project:
+            project.configuration.extensions.append(
+                ExtensionConfiguration(
+                    Nginx,
+                    extension_configuration=NginxConfiguration(
+                        www_directory_path="/var/www/betty",
+                        production_image=True,
+                    ),
+                )
+            )
+            async with project:
+                await generate_dockerfile_file(project)
+                with open(
+                    project.configuration.output_directory_path / "nginx" / "Dockerfile"
+                ) as f:
+                    actual = f.read()
+        assert "FROM alpine:3 AS site" in actual
+        assert "COPY www /layers/resources" in actual
+        assert "-name '*.css' -o -name '*.css.gz' -o -name '*.css.br'" in actual
+        assert actual.index("COPY nginx/nginx.conf /etc/nginx/conf.d/betty.conf") < (
+            actual.index("COPY --from=site /layers/assets /var/www/betty")
+        )
+        assert actual.index("COPY --from=site /layers/assets /var/www/betty") < (
+            actual.index("COPY --from=site /layers/resources /var/www/betty")
+        )
+
+    async def test_with_production_image_outside_output_directory(
+        self, new_temporary_app: App, tmp_path: Path
+    ) -> None:
+        destination_file_path = tmp_path / "Dockerfile"
+        async with Project.new_temporary(new_temporary_app) as project:
+            project.configuration.extensions.append(
+                ExtensionConfiguration(
+                    Nginx,
+                    extension_configuration=NginxConfiguration(
+                        production_image=True,
+                    ),
+                )
+            )
+            async with project:
+                with pytest.raises(
+                    ValueError, match="must be inside its build context"
+                ):
+                    await generate_dockerfile_file(project, destination_file_path)
+        assert not destination_file_path.exists()
+
+    async def test_without_production_image(self, new_temporary_app: App) -> None:
+        async with Project.new_temporary(new_temporary_app) as project:
+            project.configuration.extensions.append(
+                ExtensionConfiguration(
+                    Nginx,
+                    extension_configuration=NginxConfiguration(
+                        production_image=True,
+                    ),
+                )
+            )
+            async with project:
+                await generate_dockerfile_file(project, production=False)
+                with open(
+                    project.configuration.output_directory_path / "nginx" / "Dockerfile"
+                ) as f:
+                    actual = f.read()
+        assert "AS site" not in actual
+
+    async def test_with_replicas(self, new_temporary_app: App) -> None:
+        async with Project.new_temporary(new_temporary_app) as project:
+            project.configuration.extensions.append(
+                ExtensionConfiguration(
+                    Nginx,
+                    extension_configuration=NginxConfiguration(
+                        www_directory_path="/var/www/betty",
+                        replicas=3,
+                    ),
+                )
+            )
+            async with project:
+                await generate_dockerfile_file(project)
+                with open(
+                    project.configuration.output_directory_path
+                    / "nginx"
+                    / "compose.yaml"
+                ) as f:
+                    actual = f.read()
+        assert "replicas: 3" in actual
+        assert "- ./nginx.conf:/etc/nginx/conf.d/betty.conf:ro" in actual
+        assert "- ../www:/var/www/betty:ro" in actual
+        assert "- ./front.conf:/etc/nginx/conf.d/default.conf:ro" in actual
+
+    async def test_with_replicas_and_production_image(
+        self, new_temporary_app: App
+    ) -> None:
+        async with Project.new_temporary(new_temporary_app) as project:
+            project.configuration.extensions.append(
+                ExtensionConfiguration(
+                    Nginx,
+                    extension_configuration=NginxConfiguration(
+                        production_image=True,
+                        replicas=3,
+                    ),
+                )
+            )
+            async with project:
+                await generate_dockerfile_file(project)
+                with open(
+                    project.configuration.output_directory_path
+                    / "nginx"
+                    / "compose.yaml"
+                ) as f:
+                    actual = f.read()
+        assert "context: .." in actual
+        assert "dockerfile: nginx/Dockerfile" in actual
+        assert "betty.conf" not in actual
+
+    async def test_with_replicas_and_destination_outside_output_directory(
+        self, new_temporary_app: App, tmp_path: Path
+    ) -> None:
+        async with Project.new_temporary(new_temporary_app) as project:
+            project.configuration.extensions.append(
+                ExtensionConfiguration(
+                    Nginx,
+                    extension_configuration=NginxConfiguration(
+                        replicas=2,
+                    ),
+                )
+            )
+            async with project:
+                await generate_dockerfile_file(
+                    project,
+                    destination_file_path=tmp_path / "Dockerfile",
+                    production=False,
+                )
+        with open(tmp_path / "compose.yaml") as f:
+            actual = f.read()
+        assert "replicas: 2" in actual
+        assert "build: ." in actual
+
+
+class TestRequiresLua:
+    @pytest.mark.parametrize(
+        ("expected", "configuration"),
+        [
+            (False, ""),
+            (False, "server {\n    listen 80;\n}"),
+            (False, "# set_by_lua_block is not used here."),
+            (True, "set_by_lua_block $foo {\n    return 'bar'\n}"),
+            (True, "    log_by_lua_file /betty-lua/log.lua;"),
+            (True, "lua_shared_dict betty 1m;"),
+        ],
+    )
+    async def test(self, expected: bool, configuration: str) -> None:
+        assert requires_lua(configuration) is expected
+
+
+class TestUsesLua:
+    @pytest.mark.parametrize(
+        ("clean_urls", "debug", "multilingual", "nginx_configuration"),
+        [
+            (False, False, False, NginxConfiguration()),
+            (False, True, True, NginxConfiguration()),
+            (True, False, False, NginxConfiguration()),
+            (True, True, True, NginxConfiguration()),
+            (False, False, False, NginxConfiguration(metrics=True)),
+            (False, False, True, NginxConfiguration(error_pages_in_memory=True)),
+            (False, True, True, NginxConfiguration(rate_limit="strict", replicas=2)),
+            (False, False, False, NginxConfiguration(image_variants=True)),
+        ],
+    )
+    async def test_should_match_rendered_configuration(
+        self,
+        clean_urls: bool,
+        debug: bool,
+        multilingual: bool,
+        nginx_configuration: NginxConfiguration,
+        new_temporary_app: App,
+    ) -> None:
+        async with Project.new_temporary(new_temporary_app) as project:
+            project.configuration.clean_urls = clean_urls
+            project.configuration.debug = debug
+            if multilingual:
+                project.configuration.locales.replace(
+                    LocaleConfiguration("en-US", alias="en"),
+                    LocaleConfiguration("nl-NL", alias="nl"),
+                )
+            project.configuration.extensions.append(
+                ExtensionConfiguration(
+                    Nginx, extension_configuration=nginx_configuration
+                )
+            )
+            async with project:
+                nginx = await _get_nginx(project)
+                assert _uses_lua(project, nginx) is requires_lua(
+                    await _render_configuration_file(project)
+                )
+
+
+class TestLoadTemplate:
+    async def test_should_reuse_compiled_template(self, new_temporary_app: App) -> None:
+        async with Project.new_temporary(new_temporary_app) as project, project:
+            assert await _load_template(
+                project, "nginx.conf.j2"
+            ) is await _load_template(project, "nginx.conf.j2")
+
+    async def test_should_recompile_changed_template(
+        self, mocker: MockerFixture, new_temporary_app: App
+    ) -> None:
+        async with Project.new_temporary(new_temporary_app) as project, project:
+            template = await _load_template(project, "nginx.conf.j2")
+            mocker.patch("os.path.getmtime", return_value=0.0)
+            assert await _load_template(project, "nginx.conf.j2") is not template
+
+    async def test_should_not_share_templates_between_environments(
+        self, new_temporary_app: App
+    ) -> None:
+        async with Project.new_temporary(
+            new_temporary_app
+        ) as project_one, Project.new_temporary(
+            new_temporary_app
+        ) as project_two, project_one, project_two:
+            template_one = await _load_template(project_one, "nginx.conf.j2")
+            template_two = await _load_template(project_two, "nginx.conf.j2")
+        assert template_one is not template_two
+
+    async def test_benchmark(self, new_temporary_app: App) -> None:
+        iterations = 10
+        async with Project.new_temporary(new_temporary_app) as project, project:
+            jinja2_environment = await project.jinja2_environment
+            template_name = _template_name("nginx.conf.j2")
+            start = time.perf_counter()
+            for _ in range(iterations):
+                _template_loader().load(
+                    jinja2_environment, template_name, jinja2_environment.globals
+                )
+            compiled_duration = time.perf_counter() - start
+            await _load_template(project, "nginx.conf.j2")
+            start = time.perf_counter()
+            for _ in range(iterations):
+                await _load_template(project, "nginx.conf.j2")
+            cached_duration = time.perf_counter() - start
+        # Cached loads are typically two orders of magnitude faster, which leaves a wide margin for noisy machines.
+        assert cached_duration * 5 < compiled_duration
+
+
+class TestGenerationReport:
+    async def test_span(self) -> None:
+        sut = GenerationReport()
+        with sut.span("render", Path("nginx.conf")):
+            time.sleep(0.01)
+        (span,) = sut.spans
+        assert span.step == "render"
+        assert span.file_path == Path("nginx.conf")
+        assert span.duration >= 0.01
+
+    async def test_span_should_exclude_nested_spans(self) -> None:
+        sut = GenerationReport()
+        start = time.perf_counter()
+        with sut.span("render", Path("nginx.conf")):
+            time.sleep(0.01)
+            with sut.span("load_template", Path("nginx.conf.j2")):
+                time.sleep(0.05)
+        duration = time.perf_counter() - start
+        load_template_span, render_span = sut.spans
+        assert load_template_span.duration >= 0.05
+        assert render_span.duration >= 0.01
+        assert render_span.duration < 0.05
+        assert load_template_span.duration + render_span.duration <= duration
+
+    async def test_extend(self) -> None:
+        sut = GenerationReport()
+        other = GenerationReport(
+            written=[Path("nginx.conf")],
+            spans=[GenerationSpan("write", Path("nginx.conf"), 0.0, 1.0)],
+        )
+        sut.extend(other)
+        assert sut.written == other.written
+        assert sut.spans == other.spans
+
+
+class TestWriteGenerationProfile:
+    async def test(self, tmp_path: Path) -> None:
+        report = GenerationReport(
+            spans=[
+                GenerationSpan("write", Path("nginx.conf"), 12.5, 0.25),
+                GenerationSpan("render", Path("nginx.conf"), 12.0, 0.5),
+                GenerationSpan("write", None, 13.0, 0.25),
+            ]
+        )
+        profile_file_path = tmp_path / "generation-profile.json"
+        await write_generation_profile(report, profile_file_path)
+        assert json.loads(profile_file_path.read_text()) == {
+            "steps": {"render": 0.5, "write": 0.5},
+            "spans": [
+                {"step": "render", "file": "nginx.conf", "start": 0.0, "duration": 0.5},
+                {"step": "write", "file": "nginx.conf", "start": 0.5, "duration": 0.25},
+                {"step": "write", "file": None, "start": 1.0, "duration": 0.25},
+            ],
+        }
+
+    async def test_steps_should_not_exceed_elapsed_time(
+        self, new_temporary_app: App, tmp_path: Path
+    ) -> None:
+        async with Project.new_temporary(new_temporary_app) as project:
+            project.configuration.clean_urls = True
+            project.configuration.extensions.append(
+                ExtensionConfiguration(
+                    Nginx,
+                    extension_configuration=NginxConfiguration(rate_limit="strict"),
+                )
+            )
+            async with project:
+                start = time.perf_counter()
+                report = await generate_configuration_file(project)
+                report.extend(await generate_dockerfile_file(project))
+                duration = time.perf_counter() - start
+        profile_file_path = tmp_path / "generation-profile.json"
+        await write_generation_profile(report, profile_file_path)
+        steps = json.loads(profile_file_path.read_text())["steps"]
+        assert steps.keys() == {
+            "compile_template",
+            "copy",
+            "create_directories",
+            "load_template",
+            "render",
+            "write",
+        }
+        assert sum(steps.values()) <= duration
+
+
+class TestWriteFile:
+    async def _chunks(self, *chunks: str) -> AsyncIterator[str]:
+        for chunk in chunks:
+            yield chunk
+
+    async def test_should_time_steps(self, tmp_path: Path) -> None:
+        async def _chunks() -> AsyncIterator[str]:
+            for chunk in ("server {", "}"):
+                await asyncio.sleep(0.01)
+                yield chunk
+
+        file_path = tmp_path / "nginx.conf"
+        report = GenerationReport()
+        await _write_file(file_path, _chunks(), report)
+        create_directories_span, render_span, write_span = report.spans
+        assert create_directories_span.step == "create_directories"
+        assert render_span.step == "render"
+        # Rendering is timed separately from writing, even though they are interleaved.
+        assert render_span.duration >= 0.02
+        assert write_span.step == "write"
+        assert write_span.duration < render_span.duration
+
+    async def test_without_existing_file(self, tmp_path: Path) -> None:
+        file_path = tmp_path / "nginx" / "nginx.conf"
+        report = GenerationReport()
+        await _write_file(file_path, self._chunks("server {", "}"), report)
+        assert file_path.read_text() == "server {}"
+        assert file_path.stat().st_mode & 0o777 == 0o644
+        assert report.written == [file_path]
+        assert list(file_path.parent.iterdir()) == [file_path]
+
+    async def test_with_unchanged_existing_file(self, tmp_path: Path) -> None:
+        file_path = tmp_path / "nginx.conf"
+        file_path.write_text("server {}")
+        file_path.chmod(0o600)
+        modification_time = file_path.stat().st_mtime_ns
+        report = GenerationReport()
+        await _write_file(file_path, self._chunks("server ", "{}"), report)
+        assert file_path.stat().st_mtime_ns == modification_time
+        assert report.unchanged == [file_path]
+        assert list(tmp_path.iterdir()) == [file_path]
+
+    @pytest.mark.parametrize(
+        ("existing", "contents"),
+        [
+            ("server {} # A longer existing file.", "server {}"),
+            ("server {}", "server {} # A longer new file."),
+            ("server {}", "server []"),
+            # Differences beyond the first buffer require the identical head to be copied.
+            (
+                "#" * _WRITE_BUFFER_SIZE + "server {}",
+                "#" * _WRITE_BUFFER_SIZE + "server []",
+            ),
+        ],
+    )
+    async def test_with_changed_existing_file(
+        self, existing: str, contents: str, tmp_path: Path
+    ) -> None:
+        file_path = tmp_path / "nginx.conf"
+        file_path.write_text(existing)
+        file_path.chmod(0o600)
+        report = GenerationReport()
+        await _write_file(file_path, self._chunks(*contents), report)
+        assert file_path.read_text() == contents
+        # The existing file's permissions are kept.
+        assert file_path.stat().st_mode & 0o777 == 0o600
+        assert report.written == [file_path]
+        assert list(tmp_path.iterdir()) == [file_path]
+
+    async def test_with_error_should_keep_existing_file(self, tmp_path: Path) -> None:
+        file_path = tmp_path / "nginx.conf"
+        file_path.write_text("server {}")
+
+        async def _chunks() -> AsyncIterator[str]:
+            yield "server []"
+            raise RuntimeError
+
+        with pytest.raises(RuntimeError):
+            await _write_file(file_path, _chunks(), GenerationReport())
+        assert file_path.read_text() == "server {}"
+        assert list(tmp_path.iterdir()) == [file_path]
+
+    async def test_should_stream(self, tmp_path: Path) -> None:
+        entries = 200_000
+        entry = "location = /person/I0000000/ { return 301 /en/person/I0000000/; }\n"
+
+        async def _chunks() -> AsyncIterator[str]:
+            for _ in range(entries):
+                yield entry
+
+        file_path = tmp_path / "nginx.conf"
+        tracemalloc.start()
+        try:
+            await _write_file(file_path, _chunks(), GenerationReport())
+            _, peak_memory = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        assert file_path.stat().st_size == entries * len(entry)
+        # The file is more than 10 MB, but only a few write buffers' worth of it may be in memory at once.
+        assert peak_memory < 2 * 2**20
@@ -0,0 +1,218 @@
+"""
+Benchmark the Python code paths against stored baselines.
+
+Each benchmark fails if it is more than ``_THRESHOLD`` times slower than its baseline in ``benchmark_baselines.json``.
+After an intentional performance change, or to calibrate the baselines for another machine, record new baselines by
+running this module with ``BETTY_NGINX_TEST_UPDATE_BENCHMARK_BASELINES=true``.
+
+Import times depend on the filesystem cache and on whatever else the machine is doing, more than on the code, so
+their benchmarks only run with ``BETTY_NGINX_TEST_IMPORT_BENCHMARKS=true``. By default, ``test_import_time`` asserts
+that heavy modules are imported lazily instead.
+"""
+
+import json
+import os
+import time
+from collections.abc import (
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Iterator,
+    MutableMapping,
+)
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+import pytest
+from babel.localedata import locale_identifiers
+from betty.app import App
+from betty.project import Project
+from betty.project.config import ExtensionConfiguration, LocaleConfiguration
+from pytest_mock import MockerFixture
+
+from betty_nginx import Nginx
+from betty_nginx.artifact import generate_configuration_file, generate_dockerfile_file
+from betty_nginx.config import NginxConfiguration
+from betty_nginx.serve import DockerizedNginxServer
+from betty_nginx.tests.test_import_time import _import
+
+_BASELINES_FILE_PATH = Path(__file__).parent / "benchmark_baselines.json"
+
+# Baselines are the fastest of several runs on a development machine. Slower machines, such as CI runners, stay well
+# within an order of magnitude of them, while regressions in the code's complexity do not.
+_THRESHOLD = 10
+
+_REPEATS = 5
+
+_UPDATE_BASELINES = bool(os.environ.get("BETTY_NGINX_TEST_UPDATE_BENCHMARK_BASELINES"))
+
+_IMPORT_BENCHMARKS = bool(os.environ.get("BETTY_NGINX_TEST_IMPORT_BENCHMARKS"))
+
+_LOCALE_COUNTS = (1, 10, 100, 500)
+
+_LOCALES = sorted(
+    locale_identifier.replace("_", "-") for locale_identifier in locale_identifiers()
+)
+
+_Benchmarker = Callable[[Callable[[], Awaitable[object]], int], Awaitable[None]]
+
+_BaselineAssertion = Callable[[float], None]
+
+
+@pytest.fixture(scope="module")
+def baselines() -> Iterator[MutableMapping[str, float]]:
+    with open(_BASELINES_FILE_PATH) as f:
+        baselines: MutableMapping[str, float] = json.load(f)
+    yield baselines
+    if _UPDATE_BASELINES:
+        with open(_BASELINES_FILE_PATH, "w") as f:
+            json.dump(dict(sorted(baselines.items())), f, indent=4)
+            f.write("\n")
+
+
+@pytest.fixture()
+def assert_baseline(
+    baselines: MutableMapping[str, float], request: pytest.FixtureRequest
+) -> _BaselineAssertion:
+    """
+    Assert that a duration is within the threshold of the baseline for the current test.
+    """
+    benchmark_name = request.node.nodeid.split("::", 1)[1]
+
+    def _assert_baseline(duration: float) -> None:
+        if _UPDATE_BASELINES:
+            baselines[benchmark_name] = float(f"{duration:.3g}")
+            return
+        assert (
+            benchmark_name in baselines
+        ), f'There is no baseline for "{benchmark_name}". Record it with BETTY_NGINX_TEST_UPDATE_BENCHMARK_BASELINES=true.'
+        baseline = baselines[benchmark_name]
+        assert (
+            duration < baseline * _THRESHOLD
+        ), f"{benchmark_name} took {duration * 1_000:.3f} milliseconds, which is more than {_THRESHOLD} times its baseline of {baseline * 1_000:.3f} milliseconds."
+
+    return _assert_baseline
+
+
+@pytest.fixture()
+def benchmarker(assert_baseline: _BaselineAssertion) -> _Benchmarker:
+    """
+    Benchmark a callable against the baseline for the current test.
+    """
+
+    async def _benchmark(
+        benchmark: Callable[[], Awaitable[object]], iterations: int
+    ) -> None:
+        # Warm up caches, such as those for compiled templates.
+        await benchmark()
+        durations = []
+        for _ in range(_REPEATS):
+            start = time.perf_counter()
+            for _ in range(iterations):
+                await benchmark()
+            durations.append((time.perf_counter() - start) / iterations)
+        assert_baseline(min(durations))
+
+    return _benchmark
+
+
+@asynccontextmanager
+async def _new_project(app: App, locale_count: int) -> AsyncIterator[Project]:
+    """
+    Create a synthetic project with the given number of locales.
+    """
+    async with Project.new_temporary(app) as project:
+        project.configuration.url = "https://example.com"
+        project.configuration.clean_urls = True
+        project.configuration.locales.replace(
+            *(LocaleConfiguration(locale) for locale in _LOCALES[:locale_count])
+        )
+        project.configuration.extensions.append(ExtensionConfiguration(Nginx))
+        async with project:
+            yield project
+
+
+@pytest.mark.parametrize("locale_count", _LOCALE_COUNTS)
+class TestGenerateConfigurationFileBenchmark:
+    async def test(
+        self, benchmarker: _Benchmarker, locale_count: int, new_temporary_app: App
+    ) -> None:
+        async with _new_project(new_temporary_app, locale_count) as project:
+            await benchmarker(lambda: generate_configuration_file(project), 20)
+
+
+@pytest.mark.parametrize("locale_count", _LOCALE_COUNTS)
+class TestGenerateDockerfileFileBenchmark:
+    async def test(
+        self, benchmarker: _Benchmarker, locale_count: int, new_temporary_app: App
+    ) -> None:
+        async with _new_project(new_temporary_app, locale_count) as project:
+            await benchmarker(lambda: generate_dockerfile_file(project), 10)
+
+
+class TestNginxConfigurationBenchmark:
+    async def test_load(self, benchmarker: _Benchmarker) -> None:
+        dump = NginxConfiguration(
+            www_directory_path="/var/www/betty",
+            metrics=True,
+            metrics_allowed_addresses=["127.0.0.1", "::1", "10.0.0.0/8"],
+            rejected_path_prefixes=["/wp-admin", "/.git/"],
+        ).dump()
+
+        async def _load() -> None:
+            NginxConfiguration().load(dump)
+
+        await benchmarker(_load, 200)
+
+    async def test_dump(self, benchmarker: _Benchmarker) -> None:
+        sut = NginxConfiguration(
+            www_directory_path="/var/www/betty",
+            metrics=True,
+            metrics_allowed_addresses=["127.0.0.1", "::1", "10.0.0.0/8"],
+            rejected_path_prefixes=["/wp-admin", "/.git/"],
+        )
+
+        async def _dump() -> None:
+            sut.dump()
+
+        await benchmarker(_dump, 2000)
+
+
+@pytest.mark.parametrize("locale_count", _LOCALE_COUNTS)
+class TestDockerizedNginxServerBenchmark:
+    async def test_start(
+        self,
+        benchmarker: _Benchmarker,
+        locale_count: int,
+        mocker: MockerFixture,
+        new_temporary_app: App,
+    ) -> None:
+        # Benchmark everything but Docker itself.
+        m_container = mocker.patch("betty_nginx.serve.Container")
+        m_container.return_value.timings = {}
+        m_container.return_value.image_size = 0
+        async with _new_project(new_temporary_app, locale_count) as project:
+
+            async def _start() -> None:
+                sut = await DockerizedNginxServer.new_for_project(project)
+                await sut.start()
+                await sut.stop()
+
+            await benchmarker(_start, 3)
+
+
+@pytest.mark.skipif(
+    not _IMPORT_BENCHMARKS,
+    reason="Import benchmarks only run with BETTY_NGINX_TEST_IMPORT_BENCHMARKS=true.",
+)
+@pytest.mark.parametrize(
+    "module_name",
+    [
+        "betty_nginx",
+        "betty_nginx._cli",
+    ],
+)
+class TestImportBenchmark:
+    async def test(self, assert_baseline: _BaselineAssertion, module_name: str) -> None:
+        # Python reports import times itself, which excludes starting the interpreter.
+        assert_baseline(min(_import(module_name)[module_name] for _ in range(_REPEATS)))
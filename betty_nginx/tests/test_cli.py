@@ -1,12 +1,19 @@
+import json
+from pathlib import Path
+
 from aiofiles.os import makedirs
 from betty.app import App
 from betty.config import write_configuration_file
 from betty.project import Project
+from betty.project.config import ExtensionConfiguration, LocaleConfiguration
 from betty.test_utils.cli import run
 from betty.test_utils.serve import NoOpProjectServer
+from PIL import Image
 from pytest_mock import MockerFixture
 
 from betty_nginx import Nginx
+from betty_nginx.config import NginxConfiguration
+from betty_nginx.release import get_current_release, list_releases
 
 
 class TestServe:
@@ -28,3 +35,259 @@ class TestServe:
                     str(project.configuration.configuration_file_path),
                     expected_exit_code=1,
                 )
+
+
+class TestLogs:
+    async def test(self, new_temporary_app: App, tmp_path: Path) -> None:
+        access_log_file_path = tmp_path / "access.json"
+        access_log_file_path.write_text(
+            json.dumps({"uri": "/index.html", "status": 200, "request_time": 0.5})
+        )
+        result = await run(new_temporary_app, "nginx-logs", str(access_log_file_path))
+        assert "Requests: 1" in result.output
+        assert "/index.html" in result.output
+
+    async def test_without_access_logs(self, new_temporary_app: App) -> None:
+        await run(new_temporary_app, "nginx-logs", expected_exit_code=2)
+
+
+class TestRelease:
+    async def test(self, new_temporary_app: App, tmp_path: Path) -> None:
+        releases_directory_path = tmp_path / "releases"
+        async with Project.new_temporary(new_temporary_app) as project:
+            project.configuration.extensions.append(
+                ExtensionConfiguration(
+                    Nginx,
+                    extension_configuration=NginxConfiguration(
+                        releases_directory_path=str(releases_directory_path),
+                        releases_kept=1,
+                    ),
+                )
+            )
+            await write_configuration_file(
+                project.configuration, project.configuration.configuration_file_path
+            )
+            await makedirs(project.configuration.www_directory_path)
+            (project.configuration.www_directory_path / "index.html").write_text(
+                "Hello, world!"
+            )
+            for _ in range(3):
+                await run(
+                    new_temporary_app,
+                    "nginx-release",
+                    "-c",
+                    str(project.configuration.configuration_file_path),
+                    "--reload-command",
+                    "",
+                )
+            releases = list_releases(releases_directory_path)
+            assert len(releases) == 2
+            assert get_current_release(releases_directory_path) == releases[-1]
+            assert (
+                releases_directory_path / "current" / "index.html"
+            ).read_text() == "Hello, world!"
+
+            await run(
+                new_temporary_app,
+                "nginx-release",
+                "-c",
+                str(project.configuration.configuration_file_path),
+                "--rollback",
+                "--reload-command",
+                "",
+            )
+            assert get_current_release(releases_directory_path) == releases[0]
+
+    async def test_without_releases_directory(self, new_temporary_app: App) -> None:
+        async with Project.new_temporary(new_temporary_app) as project:
+            project.configuration.extensions.enable(Nginx)
+            await write_configuration_file(
+                project.configuration, project.configuration.configuration_file_path
+            )
+            await run(
+                new_temporary_app,
+                "nginx-release",
+                "-c",
+                str(project.configuration.configuration_file_path),
+                expected_exit_code=2,
+            )
+
+
+class TestManifest:
+    async def test(self, new_temporary_app: App, tmp_path: Path) -> None:
+        async with Project.new_temporary(new_temporary_app) as project:
+            project.configuration.extensions.enable(Nginx)
+            await write_configuration_file(
+                project.configuration, project.configuration.configuration_file_path
+            )
+            await makedirs(project.configuration.www_directory_path)
+            index_file_path = project.configuration.www_directory_path / "index.html"
+            index_file_path.write_text("Hello, world!")
+            manifest_file_path = (
+                project.configuration.output_directory_path / "nginx" / "manifest.json"
+            )
+            await run(
+                new_temporary_app,
+                "nginx-manifest",
+                "-c",
+                str(project.configuration.configuration_file_path),
+            )
+            previous_manifest_file_path = tmp_path / "manifest.json"
+            manifest_file_path.rename(previous_manifest_file_path)
+
+            index_file_path.write_text("Goodbye, world!")
+            result = await run(
+                new_temporary_app,
+                "nginx-manifest",
+                "-c",
+                str(project.configuration.configuration_file_path),
+                "--previous",
+                str(previous_manifest_file_path),
+            )
+            assert result.output == "~ /index.html\n~ /\n"
+            assert manifest_file_path.exists()
+
+    async def test_with_previous_manifest_in_output_directory(
+        self, new_temporary_app: App
+    ) -> None:
+        async with Project.new_temporary(new_temporary_app) as project:
+            project.configuration.extensions.enable(Nginx)
+            await write_configuration_file(
+                project.configuration, project.configuration.configuration_file_path
+            )
+            await makedirs(project.configuration.www_directory_path)
+            index_file_path = project.configuration.www_directory_path / "index.html"
+            index_file_path.write_text("Hello, world!")
+            manifest_file_path = (
+                project.configuration.output_directory_path / "nginx" / "manifest.json"
+            )
+            await run(
+                new_temporary_app,
+                "nginx-manifest",
+                "-c",
+                str(project.configuration.configuration_file_path),
+            )
+
+            index_file_path.write_text("Goodbye, world!")
+            result = await run(
+                new_temporary_app,
+                "nginx-manifest",
+                "-c",
+                str(project.configuration.configuration_file_path),
+                "--previous",
+                str(manifest_file_path),
+            )
+            assert result.output == "~ /index.html\n~ /\n"
+
+
+class TestDedupe:
+    async def test(self, new_temporary_app: App) -> None:
+        async with Project.new_temporary(new_temporary_app) as project:
+            project.configuration.extensions.enable(Nginx)
+            await write_configuration_file(
+                project.configuration, project.configuration.configuration_file_path
+            )
+            www_directory_path = project.configuration.www_directory_path
+            await makedirs(www_directory_path)
+            (www_directory_path / "a.json").write_text("{}")
+            (www_directory_path / "b.json").write_text("{}")
+            result = await run(
+                new_temporary_app,
+                "nginx-dedupe",
+                "-c",
+                str(project.configuration.configuration_file_path),
+            )
+            assert "Replaced 1 duplicate files with hardlinks, saving 2 bytes." in (
+                result.output
+            )
+            assert (www_directory_path / "a.json").samefile(
+                www_directory_path / "b.json"
+            )
+
+
+class TestImages:
+    async def test(self, new_temporary_app: App) -> None:
+        async with Project.new_temporary(new_temporary_app) as project:
+            project.configuration.extensions.enable(Nginx)
+            await write_configuration_file(
+                project.configuration, project.configuration.configuration_file_path
+            )
+            www_directory_path = project.configuration.www_directory_path
+            await makedirs(www_directory_path)
+            Image.linear_gradient("L").save(www_directory_path / "portrait.png")
+            result = await run(
+                new_temporary_app,
+                "nginx-images",
+                "-c",
+                str(project.configuration.configuration_file_path),
+            )
+            assert "0 image variants were up to date" in result.output
+            assert (www_directory_path / "portrait.png.webp").exists()
+
+    async def test_with_unreadable_image(self, new_temporary_app: App) -> None:
+        async with Project.new_temporary(new_temporary_app) as project:
+            project.configuration.extensions.enable(Nginx)
+            await write_configuration_file(
+                project.configuration, project.configuration.configuration_file_path
+            )
+            www_directory_path = project.configuration.www_directory_path
+            await makedirs(www_directory_path)
+            Image.linear_gradient("L").save(www_directory_path / "portrait.png")
+            (www_directory_path / "broken.jpg").write_bytes(b"This is not an image.")
+            result = await run(
+                new_temporary_app,
+                "nginx-images",
+                "-c",
+                str(project.configuration.configuration_file_path),
+            )
+            assert "Skipped 1 images that could not be read." in result.output
+            assert (www_directory_path / "portrait.png.webp").exists()
+
+
+class TestAnalyze:
+    async def test(self, new_temporary_app: App) -> None:
+        async with Project.new_temporary(new_temporary_app) as project:
+            project.configuration.extensions.enable(Nginx)
+            await write_configuration_file(
+                project.configuration, project.configuration.configuration_file_path
+            )
+            result = await run(
+                new_temporary_app,
+                "nginx-analyze",
+                "-c",
+                str(project.configuration.configuration_file_path),
+                "--path",
+                "/index.html",
+                "--strict",
+            )
+            assert "/index.html: 404" in result.output
+            assert "Filesystem probes: 3" in result.output
+            assert "/favicon.ico" not in result.output
+            assert not (
+                project.configuration.output_directory_path / "nginx" / "nginx.conf"
+            ).exists()
+
+    async def test_with_warnings(self, new_temporary_app: App) -> None:
+        async with Project.new_temporary(new_temporary_app) as project:
+            project.configuration.locales.replace(
+                LocaleConfiguration("en-US", alias="en"),
+                LocaleConfiguration("nl-NL", alias="nl"),
+            )
+            project.configuration.extensions.enable(Nginx)
+            await write_configuration_file(
+                project.configuration, project.configuration.configuration_file_path
+            )
+            result = await run(
+                new_temporary_app,
+                "nginx-analyze",
+                "-c",
+                str(project.configuration.configuration_file_path),
+                "--strict",
+                expected_exit_code=1,
+            )
+            assert "/favicon.ico: 404" in result.output
+            assert "try_files '' @localized_redirect" in result.output
+            assert (
+                "An empty try_files argument never matches a file, but still costs a filesystem probe."
+                in result.output
+            )
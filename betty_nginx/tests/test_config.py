@@ -53,11 +53,268 @@ class TestNginxConfiguration:
         sut.load(dump)
         assert sut.www_directory_path == www_directory
 
+    @pytest.mark.parametrize(
+        "production_image",
+        [
+            True,
+            False,
+        ],
+    )
+    async def test_load_with_production_image(self, production_image: bool) -> None:
+        dump: Dump = {
+            "production_image": production_image,
+        }
+        sut = NginxConfiguration()
+        sut.load(dump)
+        assert sut.production_image == production_image
+
+    @pytest.mark.parametrize(
+        "replicas",
+        [
+            None,
+            1,
+            3,
+        ],
+    )
+    async def test_load_with_replicas(self, replicas: int | None) -> None:
+        dump: Dump = {
+            "replicas": replicas,
+        }
+        sut = NginxConfiguration()
+        sut.load(dump)
+        assert sut.replicas == replicas
+
+    @pytest.mark.parametrize(
+        "replicas",
+        [
+            0,
+            -1,
+            1.5,
+            "3",
+        ],
+    )
+    async def test_load_with_invalid_replicas_should_error(self, replicas: Any) -> None:
+        dump: Dump = {
+            "replicas": replicas,
+        }
+        with raises_error(error_type=AssertionFailed):
+            NginxConfiguration().load(dump)
+
+    async def test_load_with_access_log(self) -> None:
+        dump: Dump = {
+            "access_log_file": "/var/log/nginx/betty.json",
+            "access_log_buffer_size": None,
+            "access_log_sample_rate": 0.25,
+            "metrics": False,
+            "metrics_allowed_addresses": ["127.0.0.1", "::1"],
+            "rate_limit": None,
+            "rate_limit_allowed_addresses": ["127.0.0.1", "::1"],
+            "rate_limit_crawler_user_agents": ["bot", "crawl", "spider", "slurp"],
+        }
+        sut = NginxConfiguration()
+        sut.load(dump)
+        assert sut.access_log_file_path == "/var/log/nginx/betty.json"
+        assert sut.access_log_buffer_size is None
+        assert sut.access_log_sample_rate == 0.25
+
+    @pytest.mark.parametrize(
+        "access_log_sample_rate",
+        [
+            0,
+            -0.5,
+            1.5,
+            "0.5",
+        ],
+    )
+    async def test_load_with_invalid_access_log_sample_rate_should_error(
+        self, access_log_sample_rate: Any
+    ) -> None:
+        dump: Dump = {
+            "access_log_sample_rate": access_log_sample_rate,
+        }
+        with raises_error(error_type=AssertionFailed):
+            NginxConfiguration().load(dump)
+
+    async def test_load_with_metrics(self) -> None:
+        dump: Dump = {
+            "metrics": True,
+            "metrics_allowed_addresses": ["10.0.0.0/8"],
+        }
+        sut = NginxConfiguration()
+        sut.load(dump)
+        assert sut.metrics
+        assert sut.metrics_allowed_addresses == ["10.0.0.0/8"]
+
+    async def test_load_with_invalid_metrics_allowed_addresses_should_error(
+        self,
+    ) -> None:
+        dump: Dump = {
+            "metrics_allowed_addresses": [10],
+        }
+        with raises_error(error_type=AssertionFailed):
+            NginxConfiguration().load(dump)
+
+    @pytest.mark.parametrize(
+        "rate_limit",
+        [
+            None,
+            "relaxed",
+            "moderate",
+            "strict",
+        ],
+    )
+    async def test_load_with_rate_limit(self, rate_limit: str | None) -> None:
+        dump: Dump = {
+            "rate_limit": rate_limit,
+            "rate_limit_allowed_addresses": ["192.0.2.0/24"],
+            "rate_limit_crawler_user_agents": ["Googlebot"],
+        }
+        sut = NginxConfiguration()
+        sut.load(dump)
+        assert sut.rate_limit == rate_limit
+        assert sut.rate_limit_allowed_addresses == ["192.0.2.0/24"]
+        assert sut.rate_limit_crawler_user_agents == ["Googlebot"]
+
+    @pytest.mark.parametrize(
+        "rate_limit",
+        [
+            "extreme",
+            True,
+            10,
+        ],
+    )
+    async def test_load_with_invalid_rate_limit_should_error(
+        self, rate_limit: Any
+    ) -> None:
+        dump: Dump = {
+            "rate_limit": rate_limit,
+        }
+        with raises_error(error_type=AssertionFailed):
+            NginxConfiguration().load(dump)
+
+    async def test_load_with_releases(self) -> None:
+        dump: Dump = {
+            "releases_directory": "/srv/betty/releases",
+            "releases_kept": 5,
+        }
+        sut = NginxConfiguration()
+        sut.load(dump)
+        assert sut.releases_directory_path == "/srv/betty/releases"
+        assert sut.releases_kept == 5
+
+    @pytest.mark.parametrize(
+        "releases_kept",
+        [
+            0,
+            1.5,
+            "3",
+        ],
+    )
+    async def test_load_with_invalid_releases_kept_should_error(
+        self, releases_kept: Any
+    ) -> None:
+        dump: Dump = {
+            "releases_kept": releases_kept,
+        }
+        with raises_error(error_type=AssertionFailed):
+            NginxConfiguration().load(dump)
+
+    @pytest.mark.parametrize(
+        "image_variants",
+        [
+            True,
+            False,
+        ],
+    )
+    async def test_load_with_image_variants(self, image_variants: bool) -> None:
+        dump: Dump = {
+            "image_variants": image_variants,
+        }
+        sut = NginxConfiguration()
+        sut.load(dump)
+        assert sut.image_variants is image_variants
+
+    @pytest.mark.parametrize(
+        "generation_profile",
+        [
+            True,
+            False,
+        ],
+    )
+    async def test_load_with_generation_profile(self, generation_profile: bool) -> None:
+        dump: Dump = {
+            "generation_profile": generation_profile,
+        }
+        sut = NginxConfiguration()
+        sut.load(dump)
+        assert sut.generation_profile is generation_profile
+
+    @pytest.mark.parametrize(
+        "error_pages_in_memory",
+        [
+            True,
+            False,
+        ],
+    )
+    async def test_load_with_error_pages_in_memory(
+        self, error_pages_in_memory: bool
+    ) -> None:
+        dump: Dump = {
+            "error_pages_in_memory": error_pages_in_memory,
+        }
+        sut = NginxConfiguration()
+        sut.load(dump)
+        assert sut.error_pages_in_memory is error_pages_in_memory
+
+    async def test_load_with_rejected_path_prefixes(self) -> None:
+        dump: Dump = {
+            "rejected_path_prefixes": ["/wp-admin", "/.git/"],
+        }
+        sut = NginxConfiguration()
+        sut.load(dump)
+        assert sut.rejected_path_prefixes == ["/wp-admin", "/.git/"]
+
+    @pytest.mark.parametrize(
+        "rejected_path_prefix",
+        [
+            "",
+            "wp-admin",
+            "/wp admin",
+            "/wp-admin;",
+            "/{wp-admin}",
+            '/"wp-admin"',
+        ],
+    )
+    async def test_load_with_invalid_rejected_path_prefixes(
+        self, rejected_path_prefix: str
+    ) -> None:
+        dump: Dump = {
+            "rejected_path_prefixes": [rejected_path_prefix],
+        }
+        with raises_error(error_type=AssertionFailed):
+            NginxConfiguration().load(dump)
+
     async def test_dump_with_minimal_configuration(self) -> None:
         sut = NginxConfiguration()
         expected = {
             "https": None,
             "www_directory": None,
+            "production_image": False,
+            "replicas": None,
+            "access_log_file": None,
+            "access_log_buffer_size": "64k",
+            "access_log_sample_rate": 1.0,
+            "metrics": False,
+            "metrics_allowed_addresses": ["127.0.0.1", "::1"],
+            "rate_limit": None,
+            "rate_limit_allowed_addresses": ["127.0.0.1", "::1"],
+            "rate_limit_crawler_user_agents": ["bot", "crawl", "spider", "slurp"],
+            "releases_directory": None,
+            "releases_kept": 3,
+            "image_variants": False,
+            "generation_profile": False,
+            "error_pages_in_memory": False,
+            "rejected_path_prefixes": [],
         }
         assert sut.dump() == expected
 
@@ -68,5 +325,72 @@ class TestNginxConfiguration:
         expected = {
             "https": None,
             "www_directory": www_directory_path,
+            "production_image": False,
+            "replicas": None,
+            "access_log_file": None,
+            "access_log_buffer_size": "64k",
+            "access_log_sample_rate": 1.0,
+            "metrics": False,
+            "metrics_allowed_addresses": ["127.0.0.1", "::1"],
+            "rate_limit": None,
+            "rate_limit_allowed_addresses": ["127.0.0.1", "::1"],
+            "rate_limit_crawler_user_agents": ["bot", "crawl", "spider", "slurp"],
+            "releases_directory": None,
+            "releases_kept": 3,
+            "image_variants": False,
+            "generation_profile": False,
+            "error_pages_in_memory": False,
+            "rejected_path_prefixes": [],
+        }
+        assert sut.dump() == expected
+
+    async def test_dump_with_production_image(self) -> None:
+        sut = NginxConfiguration()
+        sut.production_image = True
+        expected = {
+            "https": None,
+            "www_directory": None,
+            "production_image": True,
+            "replicas": None,
+            "access_log_file": None,
+            "access_log_buffer_size": "64k",
+            "access_log_sample_rate": 1.0,
+            "metrics": False,
+            "metrics_allowed_addresses": ["127.0.0.1", "::1"],
+            "rate_limit": None,
+            "rate_limit_allowed_addresses": ["127.0.0.1", "::1"],
+            "rate_limit_crawler_user_agents": ["bot", "crawl", "spider", "slurp"],
+            "releases_directory": None,
+            "releases_kept": 3,
+            "image_variants": False,
+            "generation_profile": False,
+            "error_pages_in_memory": False,
+            "rejected_path_prefixes": [],
+        }
+        assert sut.dump() == expected
+
+    async def test_dump_with_access_log(self) -> None:
+        sut = NginxConfiguration()
+        sut.access_log_file_path = "/var/log/nginx/betty.json"
+        sut.access_log_sample_rate = 0.5
+        expected = {
+            "https": None,
+            "www_directory": None,
+            "production_image": False,
+            "replicas": None,
+            "access_log_file": "/var/log/nginx/betty.json",
+            "access_log_buffer_size": "64k",
+            "access_log_sample_rate": 0.5,
+            "metrics": False,
+            "metrics_allowed_addresses": ["127.0.0.1", "::1"],
+            "rate_limit": None,
+            "rate_limit_allowed_addresses": ["127.0.0.1", "::1"],
+            "rate_limit_crawler_user_agents": ["bot", "crawl", "spider", "slurp"],
+            "releases_directory": None,
+            "releases_kept": 3,
+            "image_variants": False,
+            "generation_profile": False,
+            "error_pages_in_memory": False,
+            "rejected_path_prefixes": [],
         }
         assert sut.dump() == expected
@@ -0,0 +1,228 @@
+"""
+Test and benchmark ``content_negotiation.lua`` in an embedded LuaJIT runtime, against a Python reference implementation.
+"""
+
+import re
+from collections.abc import Sequence
+from pathlib import Path
+
+import pytest
+from hypothesis import given, settings, strategies
+
+from betty_nginx import Nginx
+
+luajit = pytest.importorskip("lupa.luajit21")
+
+_LUA_MODULE_FILE_PATH = Path(Nginx.assets_directory_path() or "") / (
+    "content_negotiation.lua"
+)
+
+# Lua's %s character class.
+_WHITESPACE_PATTERN = re.compile(r"[ \t\n\v\f\r]+")
+
+# Lua's tonumber() also accepts hexadecimal numbers, which the header strategies below never generate.
+_NUMBER_PATTERN = re.compile(r"[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?")
+
+
+def _parse_quality(quality: str) -> float | None:
+    if _NUMBER_PATTERN.fullmatch(quality) is None:
+        return None
+    return float(quality)
+
+
+def _parse_header(header: str) -> tuple[Sequence[tuple[str, float]], Sequence[str]]:
+    """
+    Parse a header into its acceptable values and qualities, and its unacceptable values.
+    """
+    acceptable_values = []
+    unacceptable_values = []
+    for qualified_value in _WHITESPACE_PATTERN.sub("", header).split(","):
+        if not qualified_value:
+            continue
+        quality: float | None = 1.0
+        value = qualified_value
+        if ";q=" in qualified_value:
+            value, _, quality_value = qualified_value.rpartition(";q=")
+            quality = _parse_quality(quality_value)
+        if quality == 0:
+            unacceptable_values.append(value)
+        elif quality is not None:
+            acceptable_values.append((value, quality))
+    return acceptable_values, unacceptable_values
+
+
+def _negotiate(header: str | None, available_values: Sequence[str]) -> str | None:
+    """
+    Negotiate a value, following the same rules as ``Cone.negotiate()``.
+    """
+    if not available_values:
+        return None
+    if not header:
+        return available_values[0]
+    acceptable_values, unacceptable_values = _parse_header(header)
+    for acceptable_value, _ in sorted(
+        acceptable_values, key=lambda qualified_value: -qualified_value[1]
+    ):
+        if acceptable_value in available_values:
+            return acceptable_value
+    for available_value in available_values:
+        if available_value not in unacceptable_values:
+            return available_value
+    return available_values[0]
+
+
+class _Cone:
+    def __init__(self):
+        self._runtime = luajit.LuaRuntime()
+        self._module = self._runtime.execute(_LUA_MODULE_FILE_PATH.read_text())
+        self._benchmark = self._runtime.eval(
+            """
+            function (negotiate, iterations, header, available_values)
+                local start = os.clock()
+                for _ = 1, iterations do
+                    negotiate(header, available_values)
+                end
+                return (os.clock() - start) / iterations
+            end
+            """
+        )
+
+    def negotiate(
+        self, header: str | None, available_values: Sequence[str]
+    ) -> str | None:
+        result: str | None = self._module.negotiate(
+            header, self._runtime.table_from(available_values)
+        )
+        return result
+
+    def benchmark(
+        self, iterations: int, header: str, available_values: Sequence[str]
+    ) -> float:
+        """
+        Get the average CPU time per negotiation, in seconds.
+        """
+        duration: float = self._benchmark(
+            self._module.negotiate,
+            iterations,
+            header,
+            self._runtime.table_from(available_values),
+        )
+        return duration
+
+
+@pytest.fixture(scope="module")
+def cone() -> _Cone:
+    return _Cone()
+
+
+_VALUES = ("en", "en-US", "nl", "nl-NL", "uk", "text/html", "application/json", "*")
+
+_QUALITIES = strategies.one_of(
+    strategies.sampled_from(("0", "1", "0.5", "0.001", "1.000", "0.80", ".5", "1.")),
+    strategies.decimals(min_value=0, max_value=1, places=3).map(str),
+    # Malformed qualities, that Lua's tonumber() and Python's float() agree on.
+    strategies.text(alphabet="0123456789.-eab", max_size=5),
+)
+
+_QUALIFIED_VALUES = strategies.one_of(
+    strategies.sampled_from(_VALUES),
+    strategies.tuples(strategies.sampled_from(_VALUES), _QUALITIES).map(
+        lambda qualified_value: f"{qualified_value[0]};q={qualified_value[1]}"
+    ),
+    # Malformed values.
+    strategies.text(alphabet="abn-;q=, \t*/", max_size=8),
+)
+
+_HEADERS = strategies.one_of(
+    strategies.none(),
+    strategies.lists(_QUALIFIED_VALUES, max_size=12).map(",".join),
+    strategies.lists(_QUALIFIED_VALUES, max_size=12).map(", ".join),
+)
+
+_AVAILABLE_VALUES = strategies.lists(
+    strategies.sampled_from(_VALUES), max_size=5, unique=True
+)
+
+
+class TestNegotiate:
+    @given(header=_HEADERS, available_values=_AVAILABLE_VALUES)  # type: ignore[callable-functiontype]
+    @settings(max_examples=500, deadline=None)
+    def test_should_match_reference_implementation(
+        self, cone: _Cone, header: str | None, available_values: list[str]
+    ) -> None:
+        expected = _negotiate(header, available_values)
+        actual = cone.negotiate(header, available_values)
+        if actual == expected:
+            return
+        # Lua's table.sort() is not stable, so any acceptable value of the highest available quality may win.
+        assert header is not None
+        acceptable_values, _ = _parse_header(header)
+        best_quality = max(
+            quality for value, quality in acceptable_values if value in available_values
+        )
+        assert (actual, best_quality) in acceptable_values
+
+    @pytest.mark.parametrize(
+        ("expected", "header", "available_values"),
+        [
+            ("nl", "nl-NL,nl;q=0.9,en-US;q=0.8,en;q=0.7", ["en", "nl"]),
+            ("en", "fr;q=high,en;q=0.5,nl;q=", ["nl", "en"]),
+            ("en", "nl;q=0", ["nl", "en"]),
+        ],
+    )
+    def test(
+        self,
+        cone: _Cone,
+        expected: str,
+        header: str,
+        available_values: list[str],
+    ) -> None:
+        assert cone.negotiate(header, available_values) == expected
+        assert _negotiate(header, available_values) == expected
+
+
+_BENCHMARK_SCENARIOS = [
+    (
+        "accept-language",
+        "nl-NL,nl;q=0.9,en-US;q=0.8,en;q=0.7",
+        ["en-US", "nl-NL", "uk"],
+        0.00005,
+    ),
+    (
+        "accept",
+        "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8",
+        ["text/html", "application/json"],
+        0.00005,
+    ),
+    ("long", ",".join(["en-US;q=0.5"] * 800), ["en", "nl"], 0.02),
+    (
+        "many-qualities",
+        ",".join(f"value{index};q=0.{index:03d}" for index in range(1, 1000)),
+        ["en", "nl"],
+        0.02,
+    ),
+    ("malformed", ",;q=,;;q=x,q=0.5;,,=;q=1;q=," * 100, ["en", "nl"], 0.005),
+]
+
+
+class TestNegotiateBenchmark:
+    @pytest.mark.parametrize(
+        ("header", "available_values", "budget"),
+        [scenario[1:] for scenario in _BENCHMARK_SCENARIOS],
+        ids=[scenario[0] for scenario in _BENCHMARK_SCENARIOS],
+    )
+    def test(
+        self,
+        cone: _Cone,
+        header: str,
+        available_values: Sequence[str],
+        budget: float,
+    ) -> None:
+        # Warm up LuaJIT's trace compiler first.
+        cone.benchmark(10, header, available_values)
+        duration = cone.benchmark(100, header, available_values)
+        # Budgets are about an order of magnitude above typical durations, which leaves a wide margin for noisy
+        # machines, but still catches performance regressions.
+        assert (
+            duration < budget
+        ), f"A negotiation took {duration * 1_000_000:.1f} microseconds, which exceeds the budget of {budget * 1_000_000:.1f} microseconds."
@@ -0,0 +1,38 @@
+from pathlib import Path
+
+from betty_nginx.dedupe import deduplicate_files
+
+
+class TestDeduplicateFiles:
+    async def test(self, tmp_path: Path) -> None:
+        for locale_alias in ("en", "nl", "uk"):
+            (tmp_path / locale_alias).mkdir()
+            (tmp_path / locale_alias / "person.json").write_text('{"id": "I0001"}')
+            (tmp_path / locale_alias / "index.html").write_text(locale_alias)
+        report = deduplicate_files(tmp_path)
+        assert report.linked_files == 2
+        assert report.saved_bytes == 2 * len('{"id": "I0001"}')
+        assert (tmp_path / "en" / "person.json").samefile(
+            tmp_path / "uk" / "person.json"
+        )
+        assert (tmp_path / "nl" / "person.json").read_text() == '{"id": "I0001"}'
+        assert not (tmp_path / "en" / "index.html").samefile(
+            tmp_path / "nl" / "index.html"
+        )
+        assert sorted(path.name for path in (tmp_path / "nl").iterdir()) == [
+            "index.html",
+            "person.json",
+        ]
+
+    async def test_should_be_idempotent(self, tmp_path: Path) -> None:
+        (tmp_path / "a.json").write_text("{}")
+        (tmp_path / "b.json").write_text("{}")
+        assert deduplicate_files(tmp_path).linked_files == 1
+        report = deduplicate_files(tmp_path)
+        assert report.linked_files == 0
+        assert report.saved_bytes == 0
+
+    async def test_should_skip_empty_files(self, tmp_path: Path) -> None:
+        (tmp_path / "a.txt").touch()
+        (tmp_path / "b.txt").touch()
+        assert deduplicate_files(tmp_path).linked_files == 0
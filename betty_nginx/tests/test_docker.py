@@ -0,0 +1,81 @@
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import pytest
+from pytest_mock import MockerFixture
+
+from betty_nginx.docker import Container, ContainerNotReadyError
+
+
+class TestContainer:
+    @pytest.fixture()
+    def m_client(self, mocker: MockerFixture) -> MagicMock:
+        m_client: MagicMock = mocker.patch("docker.from_env").return_value
+        m_client.images.build.return_value = (MagicMock(attrs={"Size": 123}), [])
+        m_client.api.inspect_container.return_value = {
+            "NetworkSettings": {"Networks": {"bridge": {"IPAddress": "192.0.2.1"}}}
+        }
+        return m_client
+
+    async def test_start(
+        self, m_client: MagicMock, mocker: MockerFixture, tmp_path: Path
+    ) -> None:
+        m_connection = mocker.patch("betty_nginx.docker.HTTPConnection").return_value
+        m_connection.request.side_effect = [ConnectionRefusedError(), None]
+        mocker.patch("time.sleep")
+        sut = Container(tmp_path, tmp_path, tmp_path / "nginx.conf")
+        await sut.start()
+        m_client.images.build.assert_called_once()
+        m_client.containers.create.return_value.start.assert_called_once()
+        assert m_connection.request.call_count == 2
+        assert list(sut.timings) == ["build", "create", "start", "ready"]
+        assert sut.image_size == 123
+
+    async def test_start_not_ready(
+        self, m_client: MagicMock, mocker: MockerFixture, tmp_path: Path
+    ) -> None:
+        m_connection = mocker.patch("betty_nginx.docker.HTTPConnection").return_value
+        m_connection.request.side_effect = ConnectionRefusedError()
+        sut = Container(
+            tmp_path, tmp_path, tmp_path / "nginx.conf", readiness_timeout=0
+        )
+        with pytest.raises(ContainerNotReadyError):
+            await sut.start()
+        m_container = m_client.containers.create.return_value
+        m_container.stop.assert_called_once()
+        m_container.remove.assert_called_once_with(force=True)
+        # The failed container is not stopped again.
+        await sut.stop()
+        m_container.stop.assert_called_once()
+
+    async def test_reload(
+        self, m_client: MagicMock, mocker: MockerFixture, tmp_path: Path
+    ) -> None:
+        mocker.patch("betty_nginx.docker.HTTPConnection")
+        mocker.patch("time.sleep")
+        m_container = m_client.containers.create.return_value
+        m_container.exec_run.side_effect = [
+            (0, b"11\n12\n"),
+            (0, b""),
+            (0, b"11\n13\n14\n"),
+            (0, b"13\n14\n"),
+        ]
+        sut = Container(tmp_path, tmp_path, tmp_path / "nginx.conf")
+        await sut.reload()
+        assert m_container.exec_run.call_count == 4
+
+    async def test_reload_with_invalid_configuration(
+        self, m_client: MagicMock, tmp_path: Path
+    ) -> None:
+        m_container = m_client.containers.create.return_value
+        m_container.exec_run.side_effect = [
+            (0, b"11\n12\n"),
+            (1, b"nginx: [emerg] unexpected end of file"),
+        ]
+        sut = Container(tmp_path, tmp_path, tmp_path / "nginx.conf")
+        with pytest.raises(ContainerNotReadyError):
+            await sut.reload()
+
+    async def test_ip(self, m_client: MagicMock, tmp_path: Path) -> None:
+        sut = Container(tmp_path, tmp_path, tmp_path / "nginx.conf")
+        assert sut.ip == "192.0.2.1"
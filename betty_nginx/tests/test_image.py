@@ -0,0 +1,105 @@
+import os
+from contextlib import closing
+from pathlib import Path
+
+import pytest
+from PIL import Image
+
+from betty_nginx.image import (
+    _save_variant,
+    generate_image_variants,
+    variant_formats,
+)
+
+
+def _save_image(file_path: Path, image_format: str) -> None:
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    image = Image.linear_gradient("L").convert("RGB").resize((512, 512))
+    image.save(file_path, format=image_format)
+
+
+class TestVariantFormats:
+    async def test(self) -> None:
+        assert "WEBP" in variant_formats()
+
+
+class TestGenerateImageVariants:
+    async def test(self, tmp_path: Path) -> None:
+        _save_image(tmp_path / "file" / "F1" / "portrait.png", "PNG")
+        _save_image(tmp_path / "file" / "F2" / "scan.JPG", "JPEG")
+        (tmp_path / "index.html").write_text("Hello, world!")
+        report = generate_image_variants(tmp_path, max_workers=2)
+        assert (tmp_path / "file" / "F1" / "portrait.png.webp") in report.written
+        assert (tmp_path / "file" / "F2" / "scan.JPG.webp") in report.written
+        assert report.saved_bytes > 0
+        for variant_file_path in report.written:
+            with closing(Image.open(variant_file_path)) as variant:
+                assert variant.size == (512, 512)
+            assert (
+                variant_file_path.stat().st_size
+                < variant_file_path.with_suffix("").stat().st_size
+            )
+        assert sorted(path.name for path in tmp_path.iterdir()) == [
+            "file",
+            "index.html",
+        ]
+
+    async def test_should_skip_up_to_date_variants(self, tmp_path: Path) -> None:
+        _save_image(tmp_path / "portrait.png", "PNG")
+        written = generate_image_variants(tmp_path).written
+        report = generate_image_variants(tmp_path)
+        assert report.written == []
+        assert report.unchanged == written
+
+    async def test_should_skip_discarded_variants(self, tmp_path: Path) -> None:
+        image_file_path = tmp_path / "blank.png"
+        # A blank PNG image compresses better than its WebP variant.
+        Image.new("1", (256, 256)).save(image_file_path, format="PNG")
+        variant_file_path = tmp_path / "blank.png.webp"
+        discarded_file_path = tmp_path / ".blank.png.webp.discarded"
+        assert variant_file_path in generate_image_variants(tmp_path).discarded
+        assert not variant_file_path.exists()
+        discarded_mtime = discarded_file_path.stat().st_mtime_ns
+
+        report = generate_image_variants(tmp_path)
+        assert report.written == []
+        assert variant_file_path in report.discarded
+        assert discarded_file_path.stat().st_mtime_ns == discarded_mtime
+
+        # Once the image changes, its variants are generated again.
+        _save_image(image_file_path, "PNG")
+        os.utime(image_file_path, ns=(discarded_mtime + 10**9,) * 2)
+        assert variant_file_path in generate_image_variants(tmp_path).written
+        assert not discarded_file_path.exists()
+
+    async def test_should_skip_unreadable_images(
+        self, caplog: pytest.LogCaptureFixture, tmp_path: Path
+    ) -> None:
+        _save_image(tmp_path / "portrait.png", "PNG")
+        (tmp_path / "broken.jpg").write_bytes(b"This is not an image.")
+        (tmp_path / "truncated.png").write_bytes(
+            (tmp_path / "portrait.png").read_bytes()[:512]
+        )
+        report = generate_image_variants(tmp_path, max_workers=2)
+        assert report.failed.keys() == {
+            tmp_path / "broken.jpg",
+            tmp_path / "truncated.png",
+        }
+        assert (tmp_path / "portrait.png.webp") in report.written
+        assert not (tmp_path / "broken.jpg.webp").exists()
+        assert not (tmp_path / "truncated.png.webp").exists()
+        assert f"Skipped {tmp_path / 'broken.jpg'}" in caplog.text
+
+    async def test_without_images(self, tmp_path: Path) -> None:
+        report = generate_image_variants(tmp_path)
+        assert report.written == []
+        assert report.saved_bytes == 0
+
+
+class TestSaveVariant:
+    async def test_should_discard_larger_variant(self, tmp_path: Path) -> None:
+        variant_file_path = tmp_path / "portrait.png.webp"
+        variant_file_path.write_bytes(b"stale")
+        image = Image.new("RGB", (16, 16))
+        assert _save_variant(image, variant_file_path, "WEBP", None, 1) is None
+        assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,76 @@
+"""
+Test that importing this package does not import the dependencies that only some commands need.
+
+How long imports take is left to the opt-in import benchmarks in ``test_benchmark``, because wall-clock budgets are
+unreliable on busy machines.
+"""
+
+import subprocess
+import sys
+
+import pytest
+
+# The Betty modules this package cannot do without, and which Betty loads regardless.
+_BASELINE_MODULES = (
+    "betty.assertion",
+    "betty.cli.commands",
+    "betty.config",
+    "betty.project.extension",
+)
+
+# Dependencies that only some commands and event handlers need.
+_LAZY_MODULES = (
+    "aiofiles",
+    "docker",
+    "jinja2",
+    "PIL",
+    "betty_nginx.analyze",
+    "betty_nginx.artifact",
+    "betty_nginx.image",
+    "betty_nginx.serve",
+)
+
+_MARKER = "--betty-nginx-import-time--"
+
+
+def _import(module_name: str) -> dict[str, float]:
+    """
+    Import a module in a new interpreter, and get the cumulative import times of all newly imported modules.
+    """
+    code = "\n".join(
+        (
+            "import sys",
+            *(f"import {baseline_module}" for baseline_module in _BASELINE_MODULES),
+            f"sys.stderr.write('{_MARKER}\\n')",
+            f"import {module_name}",
+        )
+    )
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        check=True,
+        text=True,
+    ).stderr
+    import_times = {}
+    for line in stderr.split(f"{_MARKER}\n", 1)[1].splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative_time, imported_module_name = line.removeprefix(
+            "import time:"
+        ).split("|")
+        import_times[imported_module_name.strip()] = int(cumulative_time) / 1_000_000
+    return import_times
+
+
+@pytest.mark.parametrize(
+    "module_name",
+    [
+        "betty_nginx",
+        "betty_nginx._cli",
+    ],
+)
+class TestImportTime:
+    async def test_should_not_import_lazy_modules(self, module_name: str) -> None:
+        imported_module_names = _import(module_name)
+        for lazy_module_name in _LAZY_MODULES:
+            assert lazy_module_name not in imported_module_names
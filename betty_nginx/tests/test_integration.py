@@ -15,12 +15,11 @@ from betty.project.config import (
     LocaleConfiguration,
     ProjectConfiguration,
 )
-from betty.serve import Server
 from requests import Response
 
 from betty_nginx import Nginx
 from betty_nginx.config import NginxConfiguration
-from betty_nginx.serve import DockerizedNginxServer
+from betty_nginx.tests.conftest import NginxContainerLease, NginxContainerPool
 
 
 @pytest.mark.skipif(
@@ -28,19 +27,28 @@ from betty_nginx.serve import DockerizedNginxServer
     reason="macOS and Windows do not natively support Docker.",
 )
 class TestNginx:
+    @pytest.fixture(autouse=True)
+    def _nginx_container_pool(self, nginx_container_pool: NginxContainerPool) -> None:
+        self._nginx_container_pool = nginx_container_pool
+
     @asynccontextmanager
     async def server(
         self, configuration: ProjectConfiguration
-    ) -> AsyncIterator[Server]:
+    ) -> AsyncIterator[NginxContainerLease]:
         async with App.new_temporary() as app, app, Project.new_temporary(
             app
         ) as project:
             project.configuration.load(configuration.dump())
+            # Serve the site like :py:class:`betty_nginx.serve.DockerizedNginxServer` would.
+            project.configuration.debug = True
+            nginx_configuration = project.configuration.extensions[
+                Nginx
+            ].extension_configuration
+            assert isinstance(nginx_configuration, NginxConfiguration)
+            nginx_configuration.https = False
             async with project:
                 await generate.generate(project)
-                async with await DockerizedNginxServer.new_for_project(
-                    project
-                ) as server:
+                async with self._nginx_container_pool.lease(project) as server:
                     yield server
 
     async def assert_betty_html(self, response: Response) -> None:
@@ -224,6 +232,28 @@ class TestNginx:
                 },
             ).until(_assert_response)
 
+    async def test_debug_headers(
+        self, multilingual_clean_urls_configuration: ProjectConfiguration
+    ):
+        async def _assert_response(response: Response) -> None:
+            assert response.status_code == 200
+            assert "total;" in response.headers["Server-Timing"]
+            assert "negotiation;" in response.headers["Server-Timing"]
+            assert response.headers["X-Betty-Location"] == "localized"
+            assert response.headers["X-Betty-File"].endswith("/nl/index.html")
+            assert (
+                response.headers["X-Betty-Negotiation"] == "Accept=text/html (accepted)"
+            )
+
+        async with self.server(multilingual_clean_urls_configuration) as server:
+            await Do(
+                requests.get,
+                f"{server.public_url}/nl/",
+                headers={
+                    "Accept": "text/html",
+                },
+            ).until(_assert_response)
+
     async def test_negotiated_localized_negotiated_json_404(
         self, multilingual_clean_urls_configuration: ProjectConfiguration
     ):
@@ -0,0 +1,102 @@
+import gzip
+import json
+from pathlib import Path
+
+import pytest
+
+from betty_nginx.logs import analyze_access_logs, LatencyHistogram, TopCounter
+
+
+def _entry(
+    uri: str, status: int = 200, request_time: float = 0.01, **fields: str
+) -> str:
+    return json.dumps(
+        {
+            "uri": uri,
+            "status": status,
+            "request_time": request_time,
+            **fields,
+        }
+    )
+
+
+class TestLatencyHistogram:
+    async def test_percentile_without_values(self) -> None:
+        sut = LatencyHistogram()
+        assert sut.percentile(50) == 0.0
+
+    @pytest.mark.parametrize(
+        ("expected", "percentile"),
+        [
+            (0.5, 50),
+            (0.9, 90),
+            (0.99, 99),
+            (1.0, 100),
+        ],
+    )
+    async def test_percentile(self, expected: float, percentile: int) -> None:
+        sut = LatencyHistogram()
+        for value in range(1, 1001):
+            sut.add(value / 1000)
+        assert sut.percentile(percentile) == pytest.approx(expected, rel=0.02)
+
+    async def test_percentile_with_zeroes(self) -> None:
+        sut = LatencyHistogram()
+        for _ in range(9):
+            sut.add(0.0)
+        sut.add(2.0)
+        assert sut.percentile(50) == 0.0
+        assert sut.percentile(100) == 2.0
+        assert sut.maximum == 2.0
+
+
+class TestTopCounter:
+    async def test_most_common(self) -> None:
+        sut = TopCounter[str](10)
+        for key, weight in (("a", 1), ("b", 3), ("a", 1), ("c", 1)):
+            sut.add(key, weight)
+        assert sut.most_common(2) == [("b", 3), ("a", 2)]
+
+    async def test_most_common_over_capacity(self) -> None:
+        sut = TopCounter[str](10)
+        for _ in range(500):
+            sut.add("heavy")
+        for index in range(1000):
+            sut.add(str(index))
+        assert sut.most_common(1)[0][0] == "heavy"
+        assert sut.most_common(1)[0][1] >= 500
+
+
+class TestAnalyzeAccessLogs:
+    async def test(self, tmp_path: Path) -> None:
+        plain_file_path = tmp_path / "access.json"
+        plain_file_path.write_text(
+            "\n".join(
+                [
+                    _entry("/en/index.html", locale="en", media_type_extension="html"),
+                    _entry("/en/index.html", locale="en", media_type_extension="html"),
+                    "not JSON",
+                    json.dumps({"uri": "/missing-status"}),
+                    "",
+                ]
+            )
+        )
+        gzip_file_path = tmp_path / "access.json.1.gz"
+        with gzip.open(gzip_file_path, "wt") as f:
+            f.write(_entry("/slow", 404, 2.0) + "\n")
+        report = analyze_access_logs([plain_file_path, gzip_file_path], top=1)
+        assert report.requests == 3
+        assert report.malformed_lines == 2
+        assert report.statuses == {200: 2, 404: 1}
+        assert report.media_types == {"html": 2, "-": 1}
+        assert report.locales == {"en": 2, "-": 1}
+        assert report.top_urls == [("/en/index.html", 2)]
+        assert report.slowest_urls == [("/slow", 2.0)]
+        assert report.latency_maximum == 2.0
+
+    async def test_without_entries(self, tmp_path: Path) -> None:
+        file_path = tmp_path / "access.json"
+        file_path.touch()
+        report = analyze_access_logs([file_path])
+        assert report.requests == 0
+        assert report.top_urls == []
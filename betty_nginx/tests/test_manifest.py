@@ -0,0 +1,94 @@
+import hashlib
+from pathlib import Path
+
+import pytest
+
+from betty_nginx.manifest import (
+    build_manifest,
+    diff_manifests,
+    file_urls,
+    ManifestEntry,
+    read_manifest,
+    write_manifest,
+)
+
+
+@pytest.fixture()
+def www_directory_path(tmp_path: Path) -> Path:
+    www_directory_path = tmp_path / "www"
+    (www_directory_path / "nl" / "person" / "I0001").mkdir(parents=True)
+    (www_directory_path / "index.html").write_text("Hello, world!")
+    (www_directory_path / "nl" / "person" / "I0001" / "index.html").write_text(
+        "Hallo, wereld!"
+    )
+    (www_directory_path / "nl" / "person" / "I0001" / "index.json").write_text("{}")
+    return www_directory_path
+
+
+class TestBuildManifest:
+    async def test(self, www_directory_path: Path) -> None:
+        manifest = build_manifest(www_directory_path, locale_aliases={"nl": "nl-NL"})
+        assert list(manifest) == [
+            "index.html",
+            "nl/person/I0001/index.html",
+            "nl/person/I0001/index.json",
+        ]
+        assert manifest["index.html"] == ManifestEntry(
+            size=13,
+            hash=hashlib.sha256(b"Hello, world!").hexdigest(),
+            media_type="text/html",
+            locale=None,
+        )
+        assert manifest["nl/person/I0001/index.json"].media_type == "application/json"
+        assert manifest["nl/person/I0001/index.json"].locale == "nl-NL"
+
+    async def test_should_hash_in_parallel(self, www_directory_path: Path) -> None:
+        for index in range(100):
+            (www_directory_path / f"{index}.txt").write_bytes(bytes(index) * 1024)
+        assert build_manifest(www_directory_path, max_workers=1) == build_manifest(
+            www_directory_path, max_workers=8
+        )
+
+    async def test_without_files(self, tmp_path: Path) -> None:
+        assert build_manifest(tmp_path) == {}
+
+
+class TestWriteManifest:
+    async def test(self, tmp_path: Path, www_directory_path: Path) -> None:
+        manifest = build_manifest(www_directory_path)
+        manifest_file_path = tmp_path / "nginx" / "manifest.json"
+        write_manifest(manifest, manifest_file_path)
+        assert read_manifest(manifest_file_path) == manifest
+
+
+class TestDiffManifests:
+    async def test(self, www_directory_path: Path) -> None:
+        previous_manifest = build_manifest(www_directory_path)
+        (www_directory_path / "index.html").write_text("Goodbye, world!")
+        (www_directory_path / "nl" / "person" / "I0001" / "index.json").unlink()
+        (www_directory_path / "robots.txt").write_text("")
+        diff = diff_manifests(previous_manifest, build_manifest(www_directory_path))
+        assert diff
+        assert diff.added == ["robots.txt"]
+        assert diff.changed == ["index.html"]
+        assert diff.removed == ["nl/person/I0001/index.json"]
+
+    async def test_without_changes(self, www_directory_path: Path) -> None:
+        manifest = build_manifest(www_directory_path)
+        assert not diff_manifests(manifest, build_manifest(www_directory_path))
+
+
+class TestFileUrls:
+    @pytest.mark.parametrize(
+        ("expected", "file_path"),
+        [
+            (["/index.html", "/"], "index.html"),
+            (
+                ["/nl/person/I0001/index.json", "/nl/person/I0001/"],
+                "nl/person/I0001/index.json",
+            ),
+            (["/robots.txt"], "robots.txt"),
+        ],
+    )
+    async def test(self, expected: list[str], file_path: str) -> None:
+        assert file_urls(file_path) == expected
@@ -0,0 +1,144 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+from betty_nginx.release import (
+    create_release,
+    current_release_directory_path,
+    get_current_release,
+    list_releases,
+    prune_releases,
+    ReleaseError,
+    reload_nginx,
+    rollback_release,
+    switch_release,
+)
+
+
+@pytest.fixture()
+def www_directory_path(tmp_path: Path) -> Path:
+    www_directory_path = tmp_path / "www"
+    (www_directory_path / "en").mkdir(parents=True)
+    (www_directory_path / "index.html").write_text("Hello, world!")
+    (www_directory_path / "en" / "index.html").write_text("Hello, world!")
+    return www_directory_path
+
+
+async def _release(www_directory_path: Path, releases_directory_path: Path) -> Path:
+    release_path = await create_release(www_directory_path, releases_directory_path)
+    await switch_release(release_path)
+    return release_path
+
+
+class TestCreateRelease:
+    async def test(self, tmp_path: Path, www_directory_path: Path) -> None:
+        releases_directory_path = tmp_path / "releases"
+        release_path = await create_release(www_directory_path, releases_directory_path)
+        assert (release_path / "en" / "index.html").read_text() == "Hello, world!"
+        assert list_releases(releases_directory_path) == [release_path]
+        # Creating a release must not switch to it.
+        assert get_current_release(releases_directory_path) is None
+
+    async def test_should_order_releases(
+        self, tmp_path: Path, www_directory_path: Path
+    ) -> None:
+        releases_directory_path = tmp_path / "releases"
+        release_paths = [
+            await create_release(www_directory_path, releases_directory_path)
+            for _ in range(3)
+        ]
+        assert list_releases(releases_directory_path) == release_paths
+
+    async def test_should_preserve_hardlinks(
+        self, tmp_path: Path, www_directory_path: Path
+    ) -> None:
+        (www_directory_path / "index.json").hardlink_to(
+            www_directory_path / "index.html"
+        )
+        release_path = await create_release(www_directory_path, tmp_path / "releases")
+        assert (release_path / "index.json").samefile(release_path / "index.html")
+        assert not (release_path / "en" / "index.html").samefile(
+            release_path / "index.html"
+        )
+
+
+class TestSwitchRelease:
+    async def test(self, tmp_path: Path, www_directory_path: Path) -> None:
+        releases_directory_path = tmp_path / "releases"
+        first_release_path = await _release(www_directory_path, releases_directory_path)
+        (www_directory_path / "index.html").write_text("Goodbye, world!")
+        second_release_path = await _release(
+            www_directory_path, releases_directory_path
+        )
+        current_path = current_release_directory_path(releases_directory_path)
+        assert get_current_release(releases_directory_path) == second_release_path
+        assert (current_path / "index.html").read_text() == "Goodbye, world!"
+        assert (first_release_path / "index.html").read_text() == "Hello, world!"
+        # The symlink itself is never listed as a release.
+        assert list_releases(releases_directory_path) == [
+            first_release_path,
+            second_release_path,
+        ]
+        assert [path.name for path in releases_directory_path.iterdir()].count(
+            "current"
+        ) == 1
+
+    async def test_without_release(self, tmp_path: Path) -> None:
+        with pytest.raises(ReleaseError):
+            await switch_release(tmp_path / "releases" / "20240101T000000000000Z")
+
+
+class TestRollbackRelease:
+    async def test(self, tmp_path: Path, www_directory_path: Path) -> None:
+        releases_directory_path = tmp_path / "releases"
+        first_release_path = await _release(www_directory_path, releases_directory_path)
+        await _release(www_directory_path, releases_directory_path)
+        assert await rollback_release(releases_directory_path) == first_release_path
+        assert get_current_release(releases_directory_path) == first_release_path
+
+    async def test_without_previous_release(
+        self, tmp_path: Path, www_directory_path: Path
+    ) -> None:
+        releases_directory_path = tmp_path / "releases"
+        await _release(www_directory_path, releases_directory_path)
+        with pytest.raises(ReleaseError):
+            await rollback_release(releases_directory_path)
+
+
+class TestPruneReleases:
+    async def test(self, tmp_path: Path, www_directory_path: Path) -> None:
+        releases_directory_path = tmp_path / "releases"
+        release_paths = [
+            await _release(www_directory_path, releases_directory_path)
+            for _ in range(4)
+        ]
+        pruned_release_paths = await prune_releases(releases_directory_path, 2)
+        assert pruned_release_paths == release_paths[:1]
+        assert list_releases(releases_directory_path) == release_paths[1:]
+
+    async def test_should_keep_releases_after_current(
+        self, tmp_path: Path, www_directory_path: Path
+    ) -> None:
+        releases_directory_path = tmp_path / "releases"
+        release_paths = [
+            await _release(www_directory_path, releases_directory_path)
+            for _ in range(3)
+        ]
+        await switch_release(release_paths[1])
+        assert await prune_releases(releases_directory_path, 1) == []
+        assert list_releases(releases_directory_path) == release_paths
+
+    async def test_without_current_release(self, tmp_path: Path) -> None:
+        assert await prune_releases(tmp_path / "releases", 1) == []
+
+
+class TestReloadNginx:
+    async def test(self) -> None:
+        await reload_nginx([sys.executable, "-c", "pass"])
+
+    async def test_with_failure(self) -> None:
+        with pytest.raises(ReleaseError):
+            await reload_nginx(
+                [sys.executable, "-c", "import sys; sys.exit('nginx: [emerg]')"]
+            )
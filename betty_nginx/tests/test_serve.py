@@ -15,7 +15,7 @@ from requests import Response
 
 from betty_nginx import Nginx
 from betty_nginx.config import NginxConfiguration
-from betty_nginx.serve import DockerizedNginxServer
+from betty_nginx.serve import DockerizedNginxMultiSiteServer, DockerizedNginxServer
 
 
 class TestDockerizedNginxServer:
@@ -46,10 +46,71 @@ class TestDockerizedNginxServer:
                 project.configuration.www_directory_path / "index.html", "w"
             ) as f:
                 await f.write(content)
-            async with project, await DockerizedNginxServer.new_for_project(
-                project
-            ) as server:
-                await Do(requests.get, server.public_url).until(_assert_response)
+            async with project:
+                sut = await DockerizedNginxServer.new_for_project(project)
+                async with sut:
+                    await Do(requests.get, sut.public_url).until(_assert_response)
+                assert list(sut.timings) == [
+                    "configure",
+                    "build",
+                    "create",
+                    "start",
+                    "ready",
+                ]
+
+    async def test_start_should_render_from_project(
+        self, mocker: MockerFixture
+    ) -> None:
+        m_container = mocker.patch("betty_nginx.serve.Container")
+        m_container.return_value.timings = {}
+        m_container.return_value.image_size = 0
+        m_new_temporary = mocker.spy(Project, "new_temporary")
+        async with App.new_temporary() as app, app, Project.new_temporary(
+            app
+        ) as project:
+            project.configuration.url = "https://example.com"
+            project.configuration.extensions.enable(Nginx)
+            async with project:
+                m_new_temporary.reset_mock()
+                sut = await DockerizedNginxServer.new_for_project(project)
+                await sut.start()
+                try:
+                    (
+                        www_directory_path,
+                        _,
+                        nginx_configuration_file_path,
+                    ) = m_container.call_args.args
+                    async with aiofiles.open(nginx_configuration_file_path) as f:
+                        configuration = await f.read()
+                finally:
+                    await sut.stop()
+                m_new_temporary.assert_not_called()
+                assert www_directory_path == project.configuration.www_directory_path
+                assert "listen 80;" in configuration
+                assert "listen 443" not in configuration
+                assert "add_header X-Betty-Location $betty_location always;" in (
+                    configuration
+                )
+                assert not project.configuration.debug
+
+    async def test_start_with_replicas(self, mocker: MockerFixture) -> None:
+        m_container = mocker.patch("betty_nginx.serve.Container")
+        m_container.return_value.timings = {}
+        m_container.return_value.image_size = 0
+        async with App.new_temporary() as app, app, Project.new_temporary(
+            app
+        ) as project:
+            project.configuration.extensions.append(
+                ExtensionConfiguration(
+                    Nginx,
+                    extension_configuration=NginxConfiguration(replicas=2),
+                )
+            )
+            async with project:
+                sut = await DockerizedNginxServer.new_for_project(project)
+                await sut.start()
+                await sut.stop()
+        m_container.assert_called_once()
 
     async def test_public_url_unstarted(self) -> None:
         async with App.new_temporary() as app, app, Project.new_temporary(
@@ -83,3 +144,55 @@ class TestDockerizedNginxServer:
                 sut = await DockerizedNginxServer.new_for_project(project)
 
                 assert not sut.is_available()
+
+
+class TestDockerizedNginxMultiSiteServer:
+    @pytest.mark.skipif(
+        sys.platform in {"darwin", "win32"},
+        reason="macOS and Windows do not natively support Docker.",
+    )
+    async def test_context_manager(self):
+        async with App.new_temporary() as app, app, Project.new_temporary(
+            app
+        ) as project_one, Project.new_temporary(app) as project_two:
+            for project, url in (
+                (project_one, "http://example.com"),
+                (project_two, "http://example.org"),
+            ):
+                project.configuration.url = url
+                project.configuration.extensions.enable(Nginx)
+                await makedirs(project.configuration.www_directory_path)
+                async with aiofiles.open(
+                    project.configuration.www_directory_path / "index.html", "w"
+                ) as f:
+                    await f.write(url)
+            async with project_one, project_two:
+                sut = await DockerizedNginxMultiSiteServer.new_for_projects(
+                    [project_one, project_two]
+                )
+                async with sut:
+                    for host, url in zip(
+                        sut.hosts,
+                        ("http://example.com", "http://example.org"),
+                        strict=True,
+                    ):
+
+                        def _assert_response(response: Response) -> None:
+                            assert response.status_code == 200
+                            assert url == response.content.decode("utf-8")  # noqa B023
+
+                        await Do(
+                            requests.get, sut.public_url, headers={"Host": host}
+                        ).until(_assert_response)
+
+    async def test_hosts(self) -> None:
+        async with App.new_temporary() as app, app, Project.new_temporary(
+            app
+        ) as project_one, Project.new_temporary(app) as project_two:
+            project_one.configuration.url = "http://example.com"
+            project_two.configuration.url = "https://example.org:8080"
+            async with project_one, project_two:
+                sut = await DockerizedNginxMultiSiteServer.new_for_projects(
+                    [project_one, project_two]
+                )
+                assert sut.hosts == ["example.com", "example.org:8080"]
@@ -61,6 +61,10 @@ describe('negotiate', function ()
         assert.are.equal('oranges', cone.negotiate('apples;q=0', {'apples', 'oranges', 'bananas'}))
     end)
 
+    it('header with malformed qualities, should ignore those values', function ()
+        assert.are.equal('bananas', cone.negotiate('apples;q=high,bananas;q=0.5,oranges;q=', {'apples', 'oranges', 'bananas'}))
+    end)
+
     it('header with multiple values and whitespace, should return the preferred header value', function ()
         assert.are.equal('bananas', cone.negotiate('bananas	, oranges', {'apples', 'oranges', 'bananas'}))
     end)
@@ -0,0 +1,62 @@
+package.path = './betty_nginx/assets/?.lua;' .. package.path
+
+describe('error_pages', function ()
+    local error_pages
+    local directory_path
+
+    before_each(function ()
+        _G.ngx = {
+            header = {},
+            print = function (body)
+                ngx.body = body
+            end,
+            exit = function (status)
+                ngx.exit_status = status
+            end,
+        }
+        package.loaded['error_pages'] = nil
+        error_pages = require('error_pages')
+        directory_path = os.tmpname()
+        os.remove(directory_path)
+        os.execute('mkdir ' .. directory_path)
+    end)
+
+    after_each(function ()
+        os.execute('rm -r ' .. directory_path)
+    end)
+
+    local function write(file_name, contents)
+        local file = io.open(directory_path .. '/' .. file_name, 'wb')
+        file:write(contents)
+        file:close()
+    end
+
+    it('load should read a page only once', function ()
+        write('404.html', 'Not found')
+        assert.are.equal('Not found', error_pages.load(directory_path .. '/404.html'))
+        write('404.html', 'Changed')
+        assert.are.equal('Not found', error_pages.load(directory_path .. '/404.html'))
+    end)
+
+    it('load should remember missing pages', function ()
+        assert.is_false(error_pages.load(directory_path .. '/404.html'))
+        write('404.html', 'Not found')
+        assert.is_false(error_pages.load(directory_path .. '/404.html'))
+    end)
+
+    it('serve should respond with the page', function ()
+        write('404.json', '{}')
+        error_pages.serve(404, directory_path .. '/404.json')
+        assert.are.equal(404, ngx.status)
+        assert.are.equal('application/json', ngx.header['Content-Type'])
+        assert.are.equal(2, ngx.header['Content-Length'])
+        assert.are.equal('{}', ngx.body)
+        assert.is_nil(ngx.exit_status)
+    end)
+
+    it('serve without a page should let nginx respond', function ()
+        error_pages.serve(403, directory_path .. '/403.html')
+        assert.is_nil(ngx.body)
+        assert.are.equal(403, ngx.exit_status)
+    end)
+end)
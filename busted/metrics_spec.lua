@@ -0,0 +1,69 @@
+package.path = './betty_nginx/assets/?.lua;' .. package.path
+
+local function new_dictionary()
+    local values = {}
+    return {
+        incr = function (self, key, value, init)
+            values[key] = (values[key] or init) + value
+            return values[key]
+        end,
+        get = function (self, key)
+            return values[key]
+        end,
+        get_keys = function (self)
+            local keys = {}
+            for key in pairs(values) do
+                table.insert(keys, key)
+            end
+            return keys
+        end,
+    }
+end
+
+describe('metrics', function ()
+    local metrics
+
+    before_each(function ()
+        _G.ngx = {
+            shared = { betty_metrics = new_dictionary() },
+            status = 404,
+            var = { connections_active = '3' },
+            now = function () return 10.5 end,
+            req = { start_time = function () return 10.498 end },
+        }
+        package.loaded['metrics'] = nil
+        metrics = require('metrics')
+    end)
+
+    it('negotiate should return the negotiated value', function ()
+        assert.are.equal('nl', metrics.negotiate('Accept-Language', 'nl,en;q=0.5', {'en', 'nl'}))
+    end)
+
+    it('negotiate should count the outcome', function ()
+        metrics.negotiate('Accept-Language', 'nl', {'en', 'nl'})
+        metrics.negotiate('Accept-Language', 'fr', {'en', 'nl'})
+        local dictionary = ngx.shared.betty_metrics
+        assert.are.equal(1, dictionary:get('betty_negotiations_total{header="Accept-Language",outcome="nl"}'))
+        assert.are.equal(1, dictionary:get('betty_negotiations_total{header="Accept-Language",outcome="en"}'))
+        assert.are.equal(2, dictionary:get('betty_negotiation_duration_seconds_count{header="Accept-Language"}'))
+    end)
+
+    it('log should count the request per location and status', function ()
+        metrics.log('static')
+        local dictionary = ngx.shared.betty_metrics
+        assert.are.equal(1, dictionary:get('betty_requests_total{location="static",status="404"}'))
+        assert.are.equal(1, dictionary:get('betty_request_duration_seconds_bucket{le="0.005",location="static"}'))
+        assert.is_nil(dictionary:get('betty_request_duration_seconds_bucket{le="0.001",location="static"}'))
+        assert.are.equal(1, dictionary:get('betty_request_duration_seconds_bucket{le="+Inf",location="static"}'))
+    end)
+
+    it('render should expose all metric families', function ()
+        metrics.log('static')
+        local rendered = metrics.render()
+        assert.is_truthy(rendered:find('# TYPE betty_requests_total counter', 1, true))
+        assert.is_truthy(rendered:find('# TYPE betty_request_duration_seconds histogram', 1, true))
+        assert.is_truthy(rendered:find('betty_requests_total{location="static",status="404"} 1', 1, true))
+        assert.is_truthy(rendered:find('nginx_connections{state="active"} 3', 1, true))
+        assert.is_truthy(rendered:find('nginx_connections{state="reading"} 0', 1, true))
+    end)
+end)
@@ -0,0 +1,53 @@
+package.path = './betty_nginx/assets/?.lua;' .. package.path
+
+local trace = require('trace')
+
+describe('reason', function ()
+    it('without a negotiated value, should report nothing available', function ()
+        assert.are.equal('nothing available', trace.reason('nl', nil))
+    end)
+
+    it('nil header, should report no header', function ()
+        assert.are.equal('no header', trace.reason(nil, 'en'))
+    end)
+
+    it('empty header containing spaces, should report no header', function ()
+        assert.are.equal('no header', trace.reason(' ', 'en'))
+    end)
+
+    it('header with the negotiated value, should report accepted', function ()
+        assert.are.equal('accepted', trace.reason('nl;q=0.5, en', 'nl'))
+    end)
+
+    it('header with the negotiated value as unacceptable, should report fallback', function ()
+        assert.are.equal('fallback', trace.reason('nl;q=0', 'nl'))
+    end)
+
+    it('header without the negotiated value, should report fallback', function ()
+        assert.are.equal('fallback', trace.reason('fr', 'en'))
+    end)
+end)
+
+describe('negotiation', function ()
+    before_each(function ()
+        _G.ngx = {
+            var = {
+                betty_negotiation_trace = '',
+                betty_negotiation_duration = '0',
+            },
+        }
+    end)
+
+    it('should record the negotiation', function ()
+        trace.negotiation('Accept', 'application/json', 'application/json', 0.0005)
+        assert.are.equal('Accept=application/json (accepted)', ngx.var.betty_negotiation_trace)
+        assert.are.equal('0.500', ngx.var.betty_negotiation_duration)
+    end)
+
+    it('should append subsequent negotiations', function ()
+        trace.negotiation('Accept', nil, 'text/html', 0.0005)
+        trace.negotiation('Accept-Language', 'fr', 'en', 0.001)
+        assert.are.equal('Accept=text/html (no header), Accept-Language=en (fallback)', ngx.var.betty_negotiation_trace)
+        assert.are.equal('1.500', ngx.var.betty_negotiation_duration)
+    end)
+end)